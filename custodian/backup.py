@@ -0,0 +1,683 @@
+# coding: utf-8
+
+"""
+This module implements a content-addressed store for the backups made
+before corrections (see custodian.utils.backup). Instead of writing a new
+tarball of all the files at each correction, each distinct file content is
+stored once, so that unchanged inputs cost nothing, and the snapshots only
+record which content each file had. Large files are stored by reflink (or,
+optionally, hardlink) where the filesystem supports it, and the other files
+are compressed in parallel. The same store is used by Custodian for
+incremental checkpoints, which are written in the background.
+"""
+
+from __future__ import unicode_literals, division
+
+import os
+import sys
+import gzip
+import json
+import shutil
+import fnmatch
+import logging
+import hashlib
+import tempfile
+import threading
+from glob import glob
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+import six
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# ioctl from <linux/fs.h> which clones a file (copy-on-write).
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """
+    Creates dst as a copy-on-write clone of src, which takes no space until
+    either file is modified.
+
+    Args:
+        src (str): Source file.
+        dst (str): Destination file.
+
+    Raises:
+        OSError (or IOError) if the filesystem does not support reflinks.
+    """
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform")
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except (IOError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+
+
+def copy_file(src, dst, link="reflink"):
+    """
+    Copies src to dst, sharing the data of the files instead where the
+    filesystem supports it, e.g., to keep a copy of a large output which
+    the next job reads.
+
+    Args:
+        src (str): Source file.
+        dst (str): Destination file, which is replaced if it exists.
+        link (str): "reflink" (the default) clones the file where the
+            filesystem supports it. "hardlink" also tries a hardlink, which
+            is only safe if neither file is modified in place afterwards.
+            None always copies.
+
+    Returns:
+        How the file was copied, i.e., "reflink", "hardlink" or "copy".
+    """
+    if link not in ("reflink", "hardlink", None):
+        raise ValueError("Unsupported link {}".format(link))
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if link is not None:
+        try:
+            reflink(src, dst)
+            shutil.copymode(src, dst)
+            return "reflink"
+        except (IOError, OSError):
+            pass
+    if link == "hardlink":
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except (IOError, OSError):
+            pass
+    shutil.copy(src, dst)
+    return "copy"
+
+
+def _hash_file(filename, blocksize=1048576):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class _SnapshotWriter(threading.Thread):
+    """
+    Thread which writes a snapshot in the background (see
+    BackupStore.backup_async).
+    """
+
+    def __init__(self, name, write):
+        super(_SnapshotWriter, self).__init__()
+        self.snapshot = name
+        self._write = write
+        self._exc_info = None
+
+    def run(self):
+        try:
+            self._write()
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+    def get(self):
+        """
+        Waits until the snapshot has been written.
+
+        Returns:
+            Name of the snapshot.
+
+        Raises:
+            The exception raised while writing the snapshot, if any.
+        """
+        self.join()
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self.snapshot
+
+
+class BackupStore(object):
+    """
+    Content-addressed store of backup snapshots. The store is a directory
+    with the objects, i.e., the distinct file contents, named after their
+    SHA1 hash, and a manifest.json which records the objects and the files
+    of each snapshot. Snapshots are named like the tarballs made by
+    custodian.utils.backup (e.g., "error.3"), and restore recreates their
+    files. The manifest is replaced atomically once all the objects of a
+    snapshot have been written, so an interrupted backup leaves the store
+    as it was.
+
+    Files of at least link_threshold bytes are first stored by reflink or
+    hardlink (see link). Otherwise, and if linking fails, files are copied,
+    compressed with gzip unless compression is None, in parallel threads.
+    If max_size is set, files which would make the content of the objects
+    exceed it are left out of the snapshot (with a warning), so that a run
+    with many corrections cannot fill the quota. The sizes before
+    compression are counted, since the compressed size of a file is only
+    known once it has been stored, so the store never uses more.
+
+    A file is hashed again only if its inode, size or modification time has
+    changed since it was last backed up, so a snapshot of files which have
+    mostly not changed since the previous one is cheap.
+    """
+
+    MANIFEST = "manifest.json"
+
+    # Number of times a file which is modified while it is backed up
+    # asynchronously is read again.
+    MAX_RETRIES = 3
+
+    def __init__(self, directory=".custodian_backups", compression="gzip",
+                 compresslevel=6, nworkers=4, link="reflink",
+                 link_threshold=104857600, max_size=None):
+        """
+        Args:
+            directory (str): Directory of the store. Relative paths are
+                relative to the directory in which backups are made.
+                Defaults to ".custodian_backups".
+            compression (str): "gzip" or None. Defaults to "gzip".
+            compresslevel (int): gzip compression level. Defaults to 6.
+            nworkers (int): Number of threads which store files. Defaults
+                to 4.
+            link (str): How large files are stored. "reflink" (the default)
+                clones them where the filesystem supports it. "hardlink"
+                also tries hardlinks, which are only safe if the backed up
+                files are replaced, not rewritten in place (restore checks
+                the content and raises an error if it has changed). None
+                always copies them.
+            link_threshold (int): Size in bytes from which files are linked.
+                Defaults to 100 MB.
+            max_size (int): Maximum total size in bytes of the content of
+                the objects, before compression. Defaults to None, i.e., no
+                limit.
+        """
+        if compression not in ("gzip", None):
+            raise ValueError("Unsupported compression {}".format(compression))
+        if link not in ("reflink", "hardlink", None):
+            raise ValueError("Unsupported link {}".format(link))
+        self.directory = directory
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.nworkers = nworkers
+        self.link = link
+        self.link_threshold = link_threshold
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # Snapshot numbers reserved by backups which are being written.
+        self._reserved = {}
+
+    def _path(self, *args):
+        return os.path.join(self.directory, *args)
+
+    def _object_path(self, h):
+        return self._path("objects", h[:2], h)
+
+    def _load_manifest(self):
+        try:
+            with open(self._path(self.MANIFEST), "rt") as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return {"objects": {}, "snapshots": {}, "order": [],
+                    "counters": {}, "hashes": {}}
+
+    def _write_manifest(self, manifest):
+        path = self._path(self.MANIFEST)
+        with open(path + ".tmp", "wt") as f:
+            json.dump(manifest, f)
+        os.rename(path + ".tmp", path)
+
+    @property
+    def snapshots(self):
+        """
+        Names of the snapshots, in the order in which they were made.
+        """
+        return list(self._load_manifest()["order"])
+
+    @property
+    def size(self):
+        """
+        Total size in bytes of the objects.
+        """
+        return sum([o["stored"] for o in
+                    self._load_manifest()["objects"].values()])
+
+    @staticmethod
+    def _get_signature(filename):
+        st = os.stat(filename)
+        return [st.st_ino, st.st_size,
+                getattr(st, "st_mtime_ns", st.st_mtime)]
+
+    def _expand(self, filenames, root, exclude=()):
+        if isinstance(filenames, six.string_types):
+            filenames = [filenames]
+        store = os.path.abspath(self.directory)
+
+        def skip(f):
+            rel = os.path.normpath(os.path.relpath(f, root))
+            return os.path.abspath(f) == store or any(
+                [fnmatch.fnmatch(rel, p) or
+                 fnmatch.fnmatch(os.path.basename(rel), p)
+                 for p in exclude])
+
+        files = []
+        for fname in filenames:
+            for f in sorted(glob(os.path.join(root, fname))):
+                if skip(f):
+                    continue
+                if os.path.isdir(f):
+                    for d, dirs, names in os.walk(f):
+                        dirs[:] = [x for x in dirs
+                                   if not skip(os.path.join(d, x))]
+                        files.extend([os.path.join(d, n)
+                                      for n in sorted(names)
+                                      if not skip(os.path.join(d, n))])
+                else:
+                    files.append(f)
+        return sorted(set([os.path.normpath(os.path.relpath(f, root))
+                           for f in files]))
+
+    def _prepare(self, manifest, files, root, stage_dir):
+        # Returns [file, source, signature, hash] entries. The hash is None
+        # if the content of the file is not in the store yet, in which case
+        # the source is read to store it. With a stage_dir, the content of
+        # these files is frozen by copying them there, so that they can be
+        # modified while the snapshot is being written. Large files are only
+        # cloned, if possible, since copying them would delay the caller;
+        # otherwise their source is None, and they are stored from the file
+        # itself by _store_in_place.
+        entries = []
+        for f in files:
+            path = os.path.join(root, f)
+            sig = self._get_signature(path)
+            cached = manifest["hashes"].get(os.path.abspath(path))
+            if cached is not None and cached[:3] == sig and \
+                    cached[3] in manifest["objects"]:
+                entries.append([f, None, sig, cached[3]])
+                continue
+            source = path
+            if stage_dir is not None:
+                staged = os.path.join(stage_dir, str(len(entries)))
+                try:
+                    if sig[1] >= self.link_threshold:
+                        reflink(path, staged)
+                    else:
+                        shutil.copyfile(path, staged)
+                    source = staged
+                except (IOError, OSError):
+                    source = None
+            entries.append([f, source, sig, None])
+        return entries
+
+    def _hash_entry(self, entry):
+        if entry[3] is not None or entry[1] is None:
+            return entry[3]
+        return _hash_file(entry[1])
+
+    def _store_in_place(self, args):
+        # Hashes and stores a file which is being backed up asynchronously
+        # but could not be staged. The file is read again if its signature
+        # has changed meanwhile, so that the object and the recorded
+        # signature match the content which was read.
+        path, sig, stage_dir = args
+        for _ in range(self.MAX_RETRIES):
+            fd, tmp = tempfile.mkstemp(dir=stage_dir)
+            os.close(fd)
+            h = hashlib.sha1()
+            size = 0
+            with open(path, "rb") as fin, \
+                    (gzip.open(tmp, "wb", compresslevel=self.compresslevel)
+                     if self.compression == "gzip" else
+                     open(tmp, "wb")) as fout:
+                for block in iter(lambda: fin.read(1048576), b""):
+                    h.update(block)
+                    fout.write(block)
+                    size += len(block)
+            new_sig = self._get_signature(path)
+            if new_sig == sig:
+                h = h.hexdigest()
+                dst = self._object_path(h)
+                if not os.path.isdir(os.path.dirname(dst)):
+                    try:
+                        os.makedirs(os.path.dirname(dst))
+                    except OSError:
+                        # Created by another thread.
+                        pass
+                stored = os.path.getsize(tmp)
+                os.rename(tmp, dst)
+                return h, sig, {"size": size, "stored": stored,
+                                "method": self.compression or "copy"}
+            os.remove(tmp)
+            sig = new_sig
+        raise IOError("{} kept being modified while it was backed "
+                      "up.".format(path))
+
+    def _store_object(self, args):
+        f, h, size = args
+        path = self._object_path(h)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # Created by another thread.
+                pass
+        if self.link is not None and size >= self.link_threshold:
+            methods = ["reflink", "hardlink"] if self.link == "hardlink" \
+                else ["reflink"]
+            for method in methods:
+                try:
+                    if method == "reflink":
+                        reflink(f, path)
+                    else:
+                        os.link(f, path)
+                    return {"size": size, "stored": size, "method": method}
+                except (IOError, OSError):
+                    pass
+        if self.compression == "gzip":
+            with open(f, "rb") as fin, \
+                    gzip.open(path + ".tmp", "wb",
+                              compresslevel=self.compresslevel) as fout:
+                shutil.copyfileobj(fin, fout, 1048576)
+        else:
+            shutil.copyfile(f, path + ".tmp")
+        os.rename(path + ".tmp", path)
+        return {"size": size, "stored": os.path.getsize(path),
+                "method": self.compression or "copy"}
+
+    def _collect_garbage(self, manifest):
+        # Removes the objects which are not referenced by any snapshot from
+        # the manifest, and returns their hashes.
+        used = set()
+        for snapshot in manifest["snapshots"].values():
+            used.update(snapshot["files"].values())
+        garbage = [h for h in manifest["objects"] if h not in used]
+        for h in garbage:
+            del manifest["objects"][h]
+        manifest["hashes"] = {k: v for k, v in manifest["hashes"].items()
+                              if v[3] not in garbage}
+        return garbage
+
+    def _remove_objects(self, hashes):
+        for h in hashes:
+            try:
+                os.remove(self._object_path(h))
+            except OSError:
+                pass
+
+    def _start(self, filenames, prefix, name, root, stage, exclude):
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            manifest = self._load_manifest()
+            counter = None
+            if name is None:
+                num = max(manifest["counters"].get(prefix, 0),
+                          self._reserved.get(prefix, 0)) + 1
+                self._reserved[prefix] = num
+                name = "{}.{}".format(prefix, num)
+                counter = (prefix, num)
+            stage_dir = None
+            if stage:
+                if not os.path.isdir(self._path("staging")):
+                    os.makedirs(self._path("staging"))
+                stage_dir = tempfile.mkdtemp(dir=self._path("staging"))
+            entries = self._prepare(
+                manifest, self._expand(filenames, root, exclude), root,
+                stage_dir)
+        logger.info("Backing up run to snapshot {} in {}.".format(
+            name, self.directory))
+        return name, counter, entries, stage_dir
+
+    def _write(self, name, counter, entries, root, stage_dir, replace):
+        stored = {}
+        try:
+            pool = ThreadPool(max(1, self.nworkers))
+            try:
+                hashes = pool.map(self._hash_entry, entries)
+                manifest = self._load_manifest()
+                # Uncompressed sizes, as for the new files.
+                total = sum([o["size"]
+                             for o in manifest["objects"].values()])
+                files = {}
+                omitted = []
+                todo = {}
+                in_place = []
+                for (f, source, sig, h0), h in zip(entries, hashes):
+                    if h is None:
+                        # Hashed while it is stored.
+                        if self.max_size is not None and \
+                                total + sig[1] > self.max_size:
+                            logger.warning(
+                                "Not backing up {}: the size of the backups "
+                                "would exceed {} bytes.".format(
+                                    f, self.max_size))
+                            omitted.append(f)
+                        else:
+                            in_place.append(f)
+                            total += sig[1]
+                        continue
+                    if h not in manifest["objects"] and h not in todo:
+                        if self.max_size is not None and \
+                                total + sig[1] > self.max_size:
+                            logger.warning(
+                                "Not backing up {}: the size of the backups "
+                                "would exceed {} bytes.".format(
+                                    f, self.max_size))
+                            omitted.append(f)
+                            continue
+                        todo[h] = (source, h, sig[1])
+                        total += sig[1]
+                    files[f] = h
+                results = pool.map(self._store_object, list(todo.values()))
+                stored = dict(zip(todo.keys(), results))
+                sigs = {}
+                for f, (h, sig, obj) in zip(in_place, pool.map(
+                        self._store_in_place,
+                        [(os.path.join(root, f), sig, stage_dir)
+                         for f, source, sig, h0 in entries
+                         if f in in_place])):
+                    stored[h] = obj
+                    files[f] = h
+                    sigs[f] = sig
+            finally:
+                pool.close()
+                pool.join()
+
+            with self._lock:
+                manifest = self._load_manifest()
+                manifest["objects"].update(stored)
+                missing = [f for f, h in files.items()
+                           if h not in manifest["objects"]]
+                if missing:
+                    raise IOError("The backups of {} have been removed while "
+                                  "they were backed up.".format(missing))
+                for f, source, sig, h0 in entries:
+                    if f in files:
+                        manifest["hashes"][os.path.abspath(
+                            os.path.join(root, f))] = sigs.get(f, sig) + \
+                            [files[f]]
+                manifest["snapshots"][name] = {"files": files,
+                                               "omitted": omitted}
+                manifest["order"] = [n for n in manifest["order"]
+                                     if n != name and n not in replace]
+                manifest["order"].append(name)
+                for n in replace:
+                    if n != name:
+                        manifest["snapshots"].pop(n, None)
+                if counter is not None:
+                    manifest["counters"][counter[0]] = max(
+                        manifest["counters"].get(counter[0], 0), counter[1])
+                garbage = self._collect_garbage(manifest)
+                self._write_manifest(manifest)
+            self._remove_objects(garbage)
+        except Exception:
+            self._remove_objects([h for h in stored
+                                  if h not in self._load_manifest()[
+                                      "objects"]])
+            raise
+        finally:
+            if stage_dir is not None:
+                shutil.rmtree(stage_dir, ignore_errors=True)
+        return name
+
+    def backup(self, filenames, prefix="error", name=None, root=".",
+               replace=(), exclude=()):
+        """
+        Makes a snapshot of files.
+
+        Args:
+            filenames ([str]): Files to back up, relative to root. Supports
+                wildcards, and directories are backed up recursively.
+            prefix (str): Prefix of the name of the snapshot. Snapshots are
+                named prefix.1, prefix.2, etc.
+            name (str): Name of the snapshot, which overrides the numbering
+                by prefix. An existing snapshot with the same name is
+                replaced.
+            root (str): Directory relative to which the paths of the files
+                are recorded. Defaults to the current directory.
+            replace ([str]): Names of snapshots which are removed when the
+                snapshot is committed, e.g., older checkpoints.
+            exclude ([str]): Shell-style wildcards of files and directories
+                (relative to root, or names) which are not backed up.
+
+        Returns:
+            Name of the snapshot.
+        """
+        name, counter, entries, stage_dir = self._start(
+            filenames, prefix, name, root, False, exclude)
+        return self._write(name, counter, entries, root, stage_dir, replace)
+
+    def backup_async(self, filenames, prefix="error", name=None, root=".",
+                     replace=(), exclude=()):
+        """
+        Makes a snapshot of files in a background thread. Only the files
+        whose content is not in the store yet are read, and these are first
+        frozen in a staging directory, by copying them or, for files of at
+        least link_threshold bytes, by cloning them by reflink, so that they
+        can be modified as soon as this returns. Large files which cannot be
+        cloned (e.g., on ext4, Lustre or GPFS) are not copied, which would
+        delay the caller and use twice their size, but stored from the file
+        itself by the thread, and read again if they are modified
+        meanwhile. The arguments are the same as for backup.
+
+        Returns:
+            Started thread, whose get method waits for the snapshot to be
+            committed and returns its name.
+        """
+        name, counter, entries, stage_dir = self._start(
+            filenames, prefix, name, root, True, exclude)
+        writer = _SnapshotWriter(name, lambda: self._write(
+            name, counter, entries, root, stage_dir, replace))
+        writer.start()
+        return writer
+
+    def remove(self, name):
+        """
+        Removes a snapshot, and the objects which are only used by it.
+
+        Args:
+            name (str): Name of the snapshot.
+
+        Raises:
+            KeyError if the snapshot does not exist.
+        """
+        with self._lock:
+            manifest = self._load_manifest()
+            del manifest["snapshots"][name]
+            manifest["order"].remove(name)
+            garbage = self._collect_garbage(manifest)
+            self._write_manifest(manifest)
+        self._remove_objects(garbage)
+
+    def restore(self, name, output_dir=".", only_changed=False):
+        """
+        Recreates the files of a snapshot.
+
+        Args:
+            name (str): Name of the snapshot, e.g., "error.1".
+            output_dir (str): Directory in which the files are recreated,
+                with their paths relative to the directory of the backup.
+                Defaults to the current directory.
+            only_changed (bool): Whether to skip the files which are known
+                to have the content of the snapshot already, i.e., which
+                have not been modified since they were backed up (or
+                restored).
+
+        Returns:
+            List of the recreated files.
+
+        Raises:
+            KeyError if the snapshot does not exist, or IOError if a
+            hardlinked file has been modified since the backup.
+        """
+        with self._lock:
+            manifest = self._load_manifest()
+            snapshot = manifest["snapshots"][name]
+            restored = []
+            for f, h in sorted(snapshot["files"].items()):
+                obj = manifest["objects"][h]
+                src = self._object_path(h)
+                dst = os.path.join(output_dir, f.lstrip(os.sep))
+                cached = manifest["hashes"].get(os.path.abspath(dst))
+                if only_changed and cached is not None and \
+                        cached[3] == h and os.path.exists(dst) and \
+                        self._get_signature(dst) == cached[:3]:
+                    continue
+                if os.path.dirname(dst) and \
+                        not os.path.isdir(os.path.dirname(dst)):
+                    os.makedirs(os.path.dirname(dst))
+                if obj["method"] == "gzip":
+                    with gzip.open(src, "rb") as fin, \
+                            open(dst, "wb") as fout:
+                        shutil.copyfileobj(fin, fout, 1048576)
+                else:
+                    if obj["method"] == "hardlink" and _hash_file(src) != h:
+                        raise IOError("The backup of {} has been modified "
+                                      "since snapshot {}.".format(f, name))
+                    shutil.copyfile(src, dst)
+                manifest["hashes"][os.path.abspath(dst)] = \
+                    self._get_signature(dst) + [h]
+                restored.append(dst)
+            self._write_manifest(manifest)
+            for f in snapshot["omitted"]:
+                logger.warning("{} was not backed up in snapshot {}.".format(
+                    f, name))
+        return restored
+
+
+_backup_store = None
+
+
+@contextmanager
+def use_backup_store(store):
+    """
+    Context manager which makes custodian.utils.backup store its backups
+    in a BackupStore instead of writing tarballs. This is used by Custodian
+    when it is given a backup_store.
+
+    Args:
+        store (BackupStore): Store to use. If None, the tarballs are
+            written as usual.
+    """
+    global _backup_store
+    previous = _backup_store
+    _backup_store = store
+    try:
+        yield store
+    finally:
+        _backup_store = previous
+
+
+def get_backup_store():
+    """
+    Returns:
+        The BackupStore in use (see use_backup_store), or None.
+    """
+    return _backup_store
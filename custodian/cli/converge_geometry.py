@@ -19,7 +19,7 @@ from custodian.custodian import Custodian
 from custodian.vasp.handlers import VaspErrorHandler, UnconvergedErrorHandler, \
     MeshSymmetryErrorHandler, NonConvergingErrorHandler, PotimErrorHandler
 from custodian.vasp.jobs import VaspJob
-from pymatgen.io.vasp.outputs import Vasprun
+from custodian.vasp.outputs import VasprunDigest
 
 
 FORMAT = '%(asctime)s %(message)s'
@@ -47,9 +47,9 @@ def get_runs(args):
 
         else:
             backup = False
-            v = Vasprun("vasprun.xml")
+            v = VasprunDigest.from_file("vasprun.xml")
 
-            if len(v.ionic_steps) == 1:
+            if v.nionic_steps == 1:
                 converged = True
 
             if job_number < 2 and not converged:
@@ -20,7 +20,8 @@ from custodian.custodian import Custodian
 from custodian.vasp.handlers import VaspErrorHandler, \
     UnconvergedErrorHandler
 from custodian.vasp.jobs import VaspJob
-from pymatgen.io.vasp import VaspInput, Vasprun
+from custodian.vasp.outputs import VasprunDigest
+from pymatgen.io.vasp import VaspInput
 
 
 FORMAT = '%(asctime)s %(message)s'
@@ -41,7 +42,7 @@ def get_runs(vasp_command, target=1e-3, max_steps=10, mode="linear"):
             backup = True
         else:
             backup = False
-            v = Vasprun("vasprun.xml")
+            v = VasprunDigest.from_file("vasprun.xml")
             e_per_atom = v.final_energy / len(v.final_structure)
             ediff = abs(e_per_atom - energy)
             if ediff < target:
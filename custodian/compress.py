@@ -0,0 +1,236 @@
+# coding: utf-8
+
+"""
+This module implements the compression of the output of a run (see the
+gzipped_output option of Custodian). Unlike monty's gzip_dir, which gzips
+every file serially at the same level, an OutputCompressor decides what to
+do with each file from a list of rules, e.g., to delete WAVECARs or to
+compress vasprun.xml files at the best level, and compresses the files in
+parallel in a thread pool. zlib releases the GIL while it compresses, and
+unlike worker processes, threads never import the driver script again.
+Huge files are split into blocks which are compressed in parallel as the
+members of a multi-member gzip file. The result is a standard .gz file,
+which gzip, zcat and python's gzip module (and thus monty's zopen and
+decompress_dir) read like any other.
+"""
+
+from __future__ import unicode_literals, division
+
+import io
+import os
+import sys
+import gzip
+import shutil
+import logging
+import fnmatch
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import six
+
+
+logger = logging.getLogger(__name__)
+
+# Compression levels of the named actions.
+LEVELS = {"fast": 1, "best": 9}
+
+
+def _gzip_block(args):
+    # Compresses a block of a file as a complete gzip member.
+    filename, offset, size, level = args
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        data = f.read(size)
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=level,
+                       mtime=0) as g:
+        g.write(data)
+    return buf.getvalue()
+
+
+def _lower_priority(increment):
+    # Only Linux sets the niceness of the calling thread rather than of the
+    # whole process, which would also lower the priority of the next jobs.
+    if increment is None or not sys.platform.startswith("linux"):
+        return
+    try:
+        os.nice(increment)
+    except (AttributeError, OSError):
+        # Not supported on this platform.
+        pass
+
+
+def _gzip_file(args):
+    filename, level = args
+    with open(filename, "rb") as fin, \
+            gzip.GzipFile(filename + ".gz", "wb",
+                          compresslevel=level) as fout:
+        shutil.copyfileobj(fin, fout, 1048576)
+    shutil.copystat(filename, filename + ".gz")
+    os.remove(filename)
+    return filename
+
+
+class OutputCompressor(object):
+    """
+    Compresses the files of a directory according to rules. Each rule is a
+    (pattern, action) tuple, where pattern is a shell-style wildcard which
+    is matched against the path of the file relative to the directory and
+    against its name, and action is one of:
+
+    - "skip": leaves the file as it is.
+    - "delete": removes the file.
+    - "gzip": gzips the file at compresslevel.
+    - "fast" or "best": gzips the file at level 1 or 9.
+    - An int: gzips the file at that level.
+
+    The first matching rule applies. Files matching no rule are gzipped at
+    compresslevel, and files which are already gzipped (or whose .gz
+    already exists) are skipped. Files in protected directories, e.g., the
+    stores of backups and checkpoints which Custodian passes, are skipped
+    before any rule is checked, so that even a rule such as ("*", "best")
+    leaves them alone.
+
+    Files of at least block_threshold bytes are split into blocks of
+    block_size bytes, compressed in parallel. Other files are compressed
+    in parallel with each other.
+    """
+
+    def __init__(self, rules=None, compresslevel=6, nprocs=None,
+                 block_size=16777216, block_threshold=268435456):
+        """
+        Args:
+            rules ([(str, str or int)]): Rules, e.g., [("WAVECAR*",
+                "delete"), ("vasprun.xml*", "best")]. Defaults to None,
+                i.e., all files are gzipped at compresslevel.
+            compresslevel (int): Default compression level. Defaults to 6,
+                as for gzip_dir.
+            nprocs (int): Number of worker threads. Defaults to the number
+                of CPUs. With 1, files are compressed in the calling thread.
+            block_size (int): Size in bytes of the blocks of huge files.
+                Defaults to 16 MB.
+            block_threshold (int): Size in bytes from which files are
+                compressed in blocks. Defaults to 256 MB.
+        """
+        self.rules = list(rules or [])
+        for pattern, action in self.rules:
+            if not isinstance(action, int) and action not in \
+                    ("skip", "delete", "gzip", "fast", "best"):
+                raise ValueError("Unsupported action {} for {}".format(
+                    action, pattern))
+        self.compresslevel = compresslevel
+        self.nprocs = nprocs or multiprocessing.cpu_count()
+        self.block_size = block_size
+        self.block_threshold = block_threshold
+
+    def get_action(self, filename, protected=()):
+        """
+        Args:
+            filename (str): Path of a file relative to the directory.
+            protected ([str]): Directories, relative to the directory,
+                whose files are always skipped.
+
+        Returns:
+            Action for the file, i.e., "skip", "delete" or the compression
+            level.
+        """
+        path = os.path.normpath(filename)
+        for d in protected:
+            d = os.path.normpath(d)
+            if path == d or path.startswith(d + os.sep):
+                return "skip"
+        name = os.path.basename(filename)
+        for pattern, action in self.rules:
+            if fnmatch.fnmatch(filename, pattern) or \
+                    fnmatch.fnmatch(name, pattern):
+                break
+        else:
+            action = "gzip"
+        if action in ("skip", "delete"):
+            return action
+        if name.lower().endswith(".gz"):
+            return "skip"
+        if action == "gzip":
+            return self.compresslevel
+        return LEVELS.get(action, action)
+
+    def compress_dir(self, path=".", nice=None, protected=()):
+        """
+        Applies the rules to all files in a directory, recursively.
+
+        Args:
+            path (str): Directory. Defaults to the current directory.
+            nice (int): If set, files are compressed in worker threads
+                whose niceness is increased by nice (on Linux), so that they
+                mostly use idle cores, e.g., while a job is running.
+            protected ([str]): Directories, relative to path, which are
+                left alone, e.g., the directory of a BackupStore.
+
+        Returns:
+            Dict of the actions applied, by path relative to the directory.
+        """
+        filenames = []
+        for root, dirs, files in os.walk(path):
+            filenames.extend([os.path.relpath(os.path.join(root, f), path)
+                              for f in files])
+        return self.compress_files(filenames, path=path, nice=nice,
+                                   protected=protected)
+
+    def compress_files(self, filenames, path=".", nice=None, protected=()):
+        """
+        Applies the rules to files, e.g., the outputs of a finished job.
+
+        Args:
+            filenames ([str]): Files, relative to path.
+            path (str): Directory of the files. Defaults to the current
+                directory.
+            nice (int): See compress_dir.
+            protected ([str]): See compress_dir.
+
+        Returns:
+            Dict of the actions applied, by filename.
+        """
+        actions = {}
+        small = []
+        huge = []
+        for rel in filenames:
+            full_f = os.path.join(path, rel)
+            action = self.get_action(rel, protected)
+            if action == "delete":
+                os.remove(full_f)
+            elif action != "skip":
+                if os.path.exists(full_f + ".gz"):
+                    logger.warning("Both {0} and {0}.gz exist.".format(
+                        full_f))
+                    action = "skip"
+                elif os.path.getsize(full_f) >= self.block_threshold:
+                    huge.append((full_f, action))
+                else:
+                    small.append((full_f, action))
+            actions[rel] = action
+
+        if self.nprocs <= 1 and nice is None:
+            for f, level in huge + small:
+                _gzip_file((f, level))
+            return actions
+
+        pool = ThreadPool(self.nprocs, _lower_priority, (nice,))
+        try:
+            result = pool.map_async(_gzip_file, small)
+            for f, level in huge:
+                self._gzip_blocks(pool, f, level)
+            result.get()
+        finally:
+            pool.close()
+            pool.join()
+        return actions
+
+    def _gzip_blocks(self, pool, filename, level):
+        size = os.path.getsize(filename)
+        blocks = [(filename, offset, self.block_size, level)
+                  for offset in six.moves.range(0, size, self.block_size)]
+        with open(filename + ".gz", "wb") as f:
+            for member in pool.imap(_gzip_block, blocks):
+                f.write(member)
+        shutil.copystat(filename, filename + ".gz")
+        os.remove(filename)
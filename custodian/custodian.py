@@ -10,6 +10,8 @@ import time
 from glob import glob
 import tarfile
 import os
+import shutil
+import threading
 from abc import ABCMeta, abstractmethod
 from itertools import islice
 import warnings
@@ -17,12 +19,15 @@ from pprint import pformat
 
 import six
 
-from .utils import get_execution_host_info
+from .utils import get_execution_host_info, parse_cache
+from .backup import BackupStore, use_backup_store
+from .compress import OutputCompressor
+from .journal import RunLogJournal, load_run_log
+from .scheduler import MonitorScheduler
+from .watcher import get_file_watcher, get_file_signature, ProcessWatcher
 
 from monty.tempfile import ScratchDir
-from monty.shutil import gzip_dir
-from monty.json import MSONable, MontyEncoder, MontyDecoder
-from monty.serialization import loadfn, dumpfn
+from monty.json import MSONable, MontyDecoder
 
 """
 This module implements the main Custodian class, which manages a list of jobs
@@ -81,15 +86,43 @@ class Custodian(object):
         if you have a polling_time_step of 10 seconds and a monitor_freq of
         30, this means that Custodian uses the monitors to check for errors
         every 30 x 10 = 300 seconds, i.e., 5 minutes.
+
+    .. attribute: monitor_mode
+
+        Either "polling" or "event". See __init__ for details.
+
+    .. attribute: parallel_checks
+
+        Whether handler checks are run concurrently. See __init__ for
+        details.
     """
     LOG_FILE = "custodian.json"
 
+    # Append-only journal of the changes to the run log, which is compacted
+    # into LOG_FILE at the end of each job and on exit.
+    JOURNAL_FILE = "custodian.journal"
+
+    # Store of the incremental checkpoints (see checkpoint in __init__).
+    CHECKPOINT_DIR = ".custodian_checkpoints"
+
+    # Data which jobs rebuild from their outputs, and which is therefore
+    # left out of the checkpoints, e.g., the live trajectory store of
+    # custodian.vasp.trajectory.
+    CHECKPOINT_EXCLUDE = ["custodian_trajectory"]
+
+    # Minimum time in seconds between two event-triggered runs of the
+    # monitors. Coalesces bursts of writes to the watched files.
+    EVENT_MIN_INTERVAL = 1
+
     def __init__(self, handlers, jobs, validators=None,
                  max_errors_per_job=None,
                  max_errors=1, polling_time_step=10, monitor_freq=30,
                  skip_over_errors=False, scratch_dir=None,
                  gzipped_output=False, checkpoint=False, terminate_func=None,
-                 terminate_on_nonzero_returncode=True):
+                 terminate_on_nonzero_returncode=True, monitor_mode="polling",
+                 parallel_checks=False, check_time_budget=None,
+                 monitor_policy=None, backup_store=None,
+                 output_compressor=None):
         """
         Initializes a Custodian from a list of jobs and error handler.s
 
@@ -135,13 +168,64 @@ class Custodian(object):
             gzipped_output (bool): Whether to gzip the final output to save
                 space. Defaults to False.
             checkpoint (bool):  Whether to checkpoint after each successful Job.
-                Checkpoints are stored as custodian.chk.#.tar.gz files. Defaults
-                to False.
+                Checkpoints are snapshots of the directory in a BackupStore
+                in CHECKPOINT_DIR, which only stores the files changed since
+                the previous checkpoint. They are written in the background
+                while the next job runs. On restart, only the files which
+                differ from the last checkpoint are restored. Checkpoints
+                stored as custodian.chk.#.tar.gz files by earlier versions
+                are still loaded. Defaults to False.
             terminate_func (callable): A function to be called to terminate a
                 running job. If None, the default is to call Popen.terminate.
             terminate_on_nonzero_returncode (bool): If True, a non-zero return
                 code on any Job will result in a termination. Defaults to True.
+            monitor_mode (str): How monitors are scheduled while a job is
+                running. "polling" (the default) runs each monitor every
+                monitor_interval seconds (see ErrorHandler), which defaults
+                to polling_time_step x monitor_freq seconds. "event" sleeps
+                until one of the files watched by the monitors (their
+                watched_files, or else their output_filename) changes, using inotify on Linux and a
+                stat-based fallback elsewhere. Monitors whose files changed
+                are then run within EVENT_MIN_INTERVAL seconds, and all
+                monitors are still run at least at their monitor_interval.
+            parallel_checks (bool): Whether to run the checks of the handlers
+                concurrently, each in its own thread, so that a slow check
+                (e.g., parsing a very large vasprun.xml) does not delay the
+                others. Corrections are still applied one at a time in the
+                order of the handlers, and once a correction has been applied,
+                the remaining handlers are checked again serially, so the
+                results are the same as with serial checks. Defaults to False.
+            check_time_budget (float): Default maximum time in seconds to
+                wait for the check of a handler when parallel_checks is True.
+                Handlers can override this with their own check_time_budget.
+                A check that overruns its budget is logged and treated as
+                having found no error, and the handler is skipped until that
+                check has finished. Defaults to None, i.e., no limit.
+            monitor_policy (AdaptiveMonitorPolicy): Policy which adapts the
+                intervals of the monitors to the activity of the job, adds
+                random jitter to them and limits the rate of monitor runs.
+                This reduces the load on shared filesystems when many
+                Custodians run at the same time. The decisions of the policy
+                are stored in the run log under "monitor_policy". Defaults to
+                None, i.e., the monitors are run at their fixed intervals.
+            backup_store (BackupStore): Content-addressed store in which the
+                backups made before corrections (see
+                custodian.utils.backup) are stored as snapshots, instead of
+                error.N.tar.gz tarballs. Defaults to None, i.e., tarballs.
+            output_compressor (OutputCompressor): Compressor used to gzip
+                the final output if gzipped_output is True, with rules
+                which decide what is skipped, deleted or compressed at
+                which level. Defaults to None, i.e., OutputCompressor(),
+                which gzips all files at level 6 in parallel. The stores
+                of backup_store and of the checkpoints are never compressed,
+                whatever the rules. The outputs which a job has finalized
+                (see Job.finalized_outputs) are compressed in the
+                background by low-priority threads while the next job
+                runs, so that only the outputs of the last job remain to be
+                compressed at the end of the run.
         """
+        if monitor_mode not in ("polling", "event"):
+            raise ValueError("Unsupported monitor_mode {}".format(monitor_mode))
         self.max_errors = max_errors
         self.max_errors_per_job = max_errors_per_job or max_errors
         self.jobs = jobs
@@ -150,35 +234,111 @@ class Custodian(object):
         self.monitors = [h for h in handlers if h.is_monitor]
         self.polling_time_step = polling_time_step
         self.monitor_freq = monitor_freq
+        self.monitor_mode = monitor_mode
         self.skip_over_errors = skip_over_errors
         self.scratch_dir = scratch_dir
         self.gzipped_output = gzipped_output
         self.checkpoint = checkpoint
+        self._checkpoint_writer = None
+        self._compression = None
         cwd = os.getcwd()
         if self.checkpoint:
             self.restart, self.run_log = Custodian._load_checkpoint(cwd)
         else:
             self.restart = 0
             self.run_log = []
+        self._journal = RunLogJournal(Custodian.JOURNAL_FILE,
+                                      Custodian.LOG_FILE, self.run_log)
         self.errors_current_job = 0
         self.total_errors = 0
         self.terminate_func = terminate_func
         self.terminate_on_nonzero_returncode = terminate_on_nonzero_returncode
+        self.parallel_checks = parallel_checks
+        self.check_time_budget = check_time_budget
+        self.monitor_policy = monitor_policy
+        self.backup_store = backup_store
+        self.output_compressor = output_compressor
+        # Checks that have overrun their time budget, by id of the handler.
+        self._running_checks = {}
+        # Signatures of the watched files of handlers at their last check
+        # that found no error, by id of the handler.
+        self._clean_signatures = {}
         self.finished = False
 
+    def _get_protected_dirs(self):
+        # Directories which the compression of the output and the
+        # checkpoints leave alone, i.e., the stores and the data left out of
+        # the checkpoints.
+        dirs = [Custodian.CHECKPOINT_DIR] + Custodian.CHECKPOINT_EXCLUDE
+        if self.backup_store is not None:
+            dirs.append(os.path.relpath(self.backup_store.directory))
+        return dirs
+
+    def _compress_output(self):
+        compressor = self.output_compressor or OutputCompressor()
+        compressor.compress_dir(".", protected=self._get_protected_dirs())
+
+    def _compress_finalized(self, job):
+        """
+        Starts compressing the outputs finalized by a job in the background,
+        once the checkpoint being written (if any) has been committed.
+        """
+        self._wait_compression()
+        filenames = [f for f in job.finalized_outputs if os.path.isfile(f)]
+        if filenames:
+            self._compression = _OutputCompression(
+                self.output_compressor or OutputCompressor(), filenames,
+                self._checkpoint_writer, self._get_protected_dirs())
+            self._compression.start()
+
+    def _wait_compression(self):
+        """
+        Waits until the background compression (if any) has finished.
+        """
+        if self._compression is None:
+            return
+        self._compression.join()
+        try:
+            self._compression.get()
+        except Exception:
+            logger.info("Background compression failed")
+            import traceback
+            logger.error(traceback.format_exc())
+        finally:
+            self._compression = None
+
+    @staticmethod
+    def _get_checkpoint_store(cwd):
+        return BackupStore(os.path.join(cwd, Custodian.CHECKPOINT_DIR))
+
     @staticmethod
     def _load_checkpoint(cwd):
         restart = 0
         run_log = []
+        store = Custodian._get_checkpoint_store(cwd)
+        snapshots = [n for n in store.snapshots
+                     if n.startswith("custodian.chk.")]
         chkpts = glob(os.path.join(cwd, "custodian.chk.*.tar.gz"))
-        if chkpts:
+        if snapshots:
+            chkpt = snapshots[-1]
+            restart = int(chkpt.split(".")[-1])
+            logger.info("Loading from checkpoint {} in {}...".format(
+                chkpt, store.directory))
+            for f in store.restore(chkpt, cwd, only_changed=True):
+                # The outputs compressed after the checkpoint was written
+                # only lost their uncompressed copy, which the .gz replaces
+                # (see _OutputCompression).
+                if os.path.exists(f + ".gz"):
+                    os.remove(f)
+            run_log = load_run_log(Custodian.LOG_FILE, Custodian.JOURNAL_FILE)
+        elif chkpts:
             chkpt = sorted(chkpts, key=lambda c: int(c.split(".")[-3]))[0]
             restart = int(chkpt.split(".")[-3])
             logger.info("Loading from checkpoint file {}...".format(chkpt))
             t = tarfile.open(chkpt)
             t.extractall()
             # Log the corrections to a json file.
-            run_log = loadfn(Custodian.LOG_FILE, cls=MontyDecoder)
+            run_log = load_run_log(Custodian.LOG_FILE, Custodian.JOURNAL_FILE)
 
         return restart, run_log
 
@@ -186,20 +346,68 @@ class Custodian(object):
     def _delete_checkpoints(cwd):
         for f in glob(os.path.join(cwd, "custodian.chk.*.tar.gz")):
             os.remove(f)
+        shutil.rmtree(os.path.join(cwd, Custodian.CHECKPOINT_DIR),
+                      ignore_errors=True)
 
     @staticmethod
-    def _save_checkpoint(cwd, index):
+    def _start_checkpoint(cwd, index, exclude=()):
+        store = Custodian._get_checkpoint_store(cwd)
+        return store.backup_async(
+            ["."], name="custodian.chk.{}".format(index), root=cwd,
+            replace=[n for n in store.snapshots
+                     if n.startswith("custodian.chk.")],
+            exclude=Custodian.CHECKPOINT_EXCLUDE + list(exclude))
+
+    @staticmethod
+    def _save_checkpoint(cwd, index, exclude=()):
+        """
+        Writes the checkpoint after the index-th job, which replaces the
+        previous one. Files matching exclude (e.g., the directory of the
+        backup store) are left out, as well as CHECKPOINT_EXCLUDE.
+        """
         try:
-            Custodian._delete_checkpoints(cwd)
-            n = os.path.join(cwd, "custodian.chk.{}.tar.gz".format(index))
-            with tarfile.open(n,  mode="w:gz", compresslevel=3) as f:
-                f.add(cwd, arcname='.')
-            logger.info("Checkpoint written to {}".format(n))
-        except Exception as ex:
+            n = Custodian._start_checkpoint(cwd, index, exclude).get()
+            logger.info("Checkpoint {} written to {}".format(
+                n, Custodian.CHECKPOINT_DIR))
+        except Exception:
+            logger.info("Checkpointing failed")
+            import traceback
+            logger.error(traceback.format_exc())
+
+    def _save_checkpoint_async(self, cwd, index):
+        """
+        Starts writing the checkpoint after the index-th job in the
+        background. The previous checkpoint is replaced once this one has
+        been committed.
+        """
+        # The checkpoint must not see the outputs being compressed.
+        self._wait_compression()
+        self._wait_checkpoint()
+        try:
+            self._checkpoint_writer = Custodian._start_checkpoint(
+                cwd, index, self._get_protected_dirs())
+        except Exception:
             logger.info("Checkpointing failed")
             import traceback
             logger.error(traceback.format_exc())
 
+    def _wait_checkpoint(self):
+        """
+        Waits until the checkpoint being written (if any) is committed.
+        """
+        if self._checkpoint_writer is None:
+            return
+        try:
+            n = self._checkpoint_writer.get()
+            logger.info("Checkpoint {} written to {}".format(
+                n, Custodian.CHECKPOINT_DIR))
+        except Exception:
+            logger.info("Checkpointing failed")
+            import traceback
+            logger.error(traceback.format_exc())
+        finally:
+            self._checkpoint_writer = None
+
     @classmethod
     def from_spec(cls, spec):
         """
@@ -322,18 +530,22 @@ class Custodian(object):
                 *get_execution_host_info()))
 
             try:
-                # skip jobs until the restart
-                for job_n, job in islice(enumerate(self.jobs, 1),
-                                         self.restart, None):
-                    self._run_job(job_n, job)
-                    # We do a dump of the run log after each job.
-                    dumpfn(self.run_log, Custodian.LOG_FILE, cls=MontyEncoder,
-                           indent=4)
-                    # Checkpoint after each job so that we can recover from last
-                    # point and remove old checkpoints
-                    if self.checkpoint:
-                        self.restart = job_n
-                        Custodian._save_checkpoint(cwd, job_n)
+                # Start from the run log, discarding any stale journal.
+                self._journal.compact(self.run_log)
+                with use_backup_store(self.backup_store):
+                    # skip jobs until the restart
+                    for job_n, job in islice(enumerate(self.jobs, 1),
+                                             self.restart, None):
+                        self._run_job(job_n, job)
+                        # We do a dump of the run log after each job.
+                        self._journal.compact(self.run_log)
+                        # Checkpoint after each job so that we can recover
+                        # from last point and remove old checkpoints
+                        if self.checkpoint:
+                            self.restart = job_n
+                            self._save_checkpoint_async(cwd, job_n)
+                        if self.gzipped_output:
+                            self._compress_finalized(job)
             except CustodianError as ex:
                 logger.error(ex.message)
                 if ex.raises:
@@ -341,15 +553,16 @@ class Custodian(object):
             finally:
                 # Log the corrections to a json file.
                 logger.info("Logging to {}...".format(Custodian.LOG_FILE))
-                dumpfn(self.run_log, Custodian.LOG_FILE, cls=MontyEncoder,
-                       indent=4)
+                self._journal.compact(self.run_log)
                 end = datetime.datetime.now()
                 logger.info("Run ended at {}.".format(end))
                 run_time = end - start
                 logger.info("Run completed. Total time taken = {}."
                             .format(run_time))
+                self._wait_compression()
+                self._wait_checkpoint()
                 if self.gzipped_output:
-                    gzip_dir(".")
+                    self._compress_output()
 
             # Cleanup checkpoint files (if any) if run is successful.
             Custodian._delete_checkpoints(cwd)
@@ -383,6 +596,10 @@ class Custodian(object):
         # applied for each handler
         for h in self.handlers:
             h.n_applied_corrections = 0
+        # The outputs of the previous job say nothing about the activity of
+        # this one.
+        if self.monitor_policy is not None:
+            self.monitor_policy.reset()
 
         job.setup()
 
@@ -396,6 +613,8 @@ class Custodian(object):
                     job_n, job.name, attempt, self.total_errors,
                     self.errors_current_job))
 
+            for h in self.handlers:
+                h.setup()
             p = job.run()
             # Check for errors using the error handlers and perform
             # corrections.
@@ -406,62 +625,70 @@ class Custodian(object):
             # monitors to monitor the job.
             if isinstance(p, subprocess.Popen):
                 if self.monitors:
-                    n = 0
-                    while True:
-                        n += 1
-                        time.sleep(self.polling_time_step)
-                        if p.poll() is not None:
-                            break
-                        terminate = self.terminate_func or p.terminate
-                        if n % self.monitor_freq == 0:
-                            has_error = self._do_check(self.monitors,
-                                                       terminate)
-                        if terminate is not None and terminate != p.terminate:
-                            time.sleep(self.polling_time_step)
+                    # The watcher wakes the loop up as soon as the job exits,
+                    # so that no time is lost between chained jobs.
+                    with ProcessWatcher(p) as exit_watcher:
+                        if self.monitor_mode == "event":
+                            has_error = self._monitor_events(
+                                p, exit_watcher, job)
+                        else:
+                            has_error = self._monitor_polling(
+                                p, exit_watcher, job)
+                    if self.monitor_policy is not None:
+                        self.run_log[-1]["monitor_policy"] = \
+                            self.monitor_policy.summary()
                 else:
                     p.wait()
                     if self.terminate_func is not None and \
                             self.terminate_func != p.terminate:
+                        # The job has already exited, so there is nothing
+                        # left to wait for.
                         self.terminate_func()
-                        time.sleep(self.polling_time_step)
 
                 zero_return_code = p.returncode == 0
+                self._update_job(job)
 
             logger.info("{}.run has completed. "
                         "Checking remaining handlers".format(job.name))
             # Check for errors again, since in some cases non-monitor
             # handlers fix the problems detected by monitors
             # if an error has been found, not all handlers need to run
-            if has_error:
-                self._do_check([h for h in self.handlers
-                                if not h.is_monitor])
-            else:
-                has_error = self._do_check(self.handlers)
-
-            if has_error:
-                # This makes sure the job is killed cleanly for certain systems.
-                job.terminate()
-
-            # If there are no errors detected, perform
-            # postprocessing and exit.
-            if not has_error:
-                for v in self.validators:
-                    if v.check():
-                        self.run_log[-1]["validator"] = v
-                        s = "Validation failed: {}".format(v)
-                        raise ValidationError(s, True, v)
-                if not zero_return_code:
-                    if self.terminate_on_nonzero_returncode:
-                        self.run_log[-1]["nonzero_return_code"] = True
-                        s = "Job return code is %d. Terminating..." % \
-                            p.returncode
-                        logger.info(s)
-                        raise ReturnCodeError(s, True)
-                    else:
-                        warnings.warn("subprocess returned a non-zero return "
-                                      "code. Check outputs carefully...")
-                job.postprocess()
-                return
+            # The handlers, validators and postprocess (e.g., to write the
+            # digests of the outputs) share the parsed output files.
+            with parse_cache():
+                if has_error:
+                    self._do_check([h for h in self.handlers
+                                    if not h.is_monitor])
+                else:
+                    has_error = self._do_check(self.handlers)
+
+                if has_error:
+                    # This makes sure the job is killed cleanly for certain systems.
+                    job.terminate()
+
+                # If there are no errors detected, perform
+                # postprocessing and exit.
+                if not has_error:
+                    for v in self.validators:
+                        if v.check():
+                            self.run_log[-1]["validator"] = v
+                            s = "Validation failed: {}".format(v)
+                            raise ValidationError(s, True, v)
+
+                if not has_error:
+                    if not zero_return_code:
+                        if self.terminate_on_nonzero_returncode:
+                            self.run_log[-1]["nonzero_return_code"] = True
+                            s = "Job return code is %d. Terminating..." % \
+                                p.returncode
+                            logger.info(s)
+                            raise ReturnCodeError(s, True)
+                        else:
+                            warnings.warn("subprocess returned a non-zero "
+                                          "return code. Check outputs "
+                                          "carefully...")
+                    job.postprocess()
+                    return
 
             # Check that all errors could be handled
             for x in self.run_log[-1]["corrections"]:
@@ -486,6 +713,132 @@ class Custodian(object):
             logger.info(msg)
             raise MaxCorrectionsError(msg, True, self.max_errors)
 
+    def _update_job(self, job):
+        """
+        Lets a running or just finished job update the data derived from
+        its outputs (see Job.update).
+        """
+        if job is None:
+            return
+        try:
+            job.update()
+        except Exception:
+            logger.info("Update of {} failed".format(job.name))
+            import traceback
+            logger.error(traceback.format_exc())
+
+    def _monitor_polling(self, p, exit_watcher, job=None):
+        """
+        Monitors a running job by running each monitor at its
+        monitor_interval, which defaults to polling_time_step x monitor_freq
+        seconds.
+
+        Args:
+            p (Popen): Running job.
+            exit_watcher (ProcessWatcher): Watcher for the exit of p.
+            job (Job): Job of p, which is updated before the monitors are
+                checked (see Job.update).
+
+        Returns:
+            (bool) Whether errors were caught.
+        """
+        has_error = False
+        terminate = self.terminate_func or p.terminate
+        schedule = MonitorScheduler(
+            self.monitors, self.polling_time_step * self.monitor_freq,
+            time.time(), self.monitor_policy)
+        while True:
+            if exit_watcher.wait(schedule.next_due - time.time()):
+                break
+            due = schedule.pop_due(time.time())
+            if not due:
+                continue
+            self._update_job(job)
+            # A correction made by an earlier check is not undone by a
+            # later clean check of other monitors.
+            has_error = self._do_check([self.monitors[i] for i in due],
+                                       terminate) or has_error
+            now = time.time()
+            for i in due:
+                schedule.schedule(i, now)
+            if terminate != p.terminate:
+                # Give a custom terminate_func time to take effect, but
+                # move on as soon as the job has actually exited.
+                exit_watcher.wait(self.polling_time_step)
+        return has_error
+
+    def _monitor_events(self, p, exit_watcher, job=None):
+        """
+        Monitors a running job in event-driven mode. Instead of waking up
+        every polling_time_step, the loop sleeps until a file watched by one
+        of the monitors changes, a monitor is due according to its
+        monitor_interval or the job exits.
+
+        Args:
+            p (Popen): Running job.
+            exit_watcher (ProcessWatcher): Watcher for the exit of p.
+            job (Job): Job of p, which is updated before the monitors are
+                checked (see Job.update).
+
+        Returns:
+            (bool) Whether errors were caught.
+        """
+        terminate = self.terminate_func or p.terminate
+        terminated = []
+
+        def terminate_job():
+            terminated.append(True)
+            terminate()
+
+        watched = []
+        for i, h in enumerate(self.monitors):
+            files = h.watched_files
+            if files is None:
+                f = getattr(h, "output_filename", None)
+                files = [f] if isinstance(f, six.string_types) else []
+            watched.extend((i, os.path.normpath(f)) for f in files)
+
+        has_error = False
+        pending = set()
+        last_event_check = 0
+        schedule = MonitorScheduler(
+            self.monitors, self.polling_time_step * self.monitor_freq,
+            time.time(), self.monitor_policy)
+        with get_file_watcher([f for i, f in watched]) as watcher:
+            while p.poll() is None:
+                now = time.time()
+                timeout = schedule.next_due - now
+                if pending:
+                    timeout = min(timeout, last_event_check +
+                                  self.EVENT_MIN_INTERVAL - now)
+                changed = watcher.wait(max(timeout, 0), exit_watcher)
+                if p.poll() is not None:
+                    break
+                pending.update(i for i, f in watched if f in changed)
+                now = time.time()
+                if pending and \
+                        now - last_event_check >= self.EVENT_MIN_INTERVAL:
+                    for i in pending:
+                        schedule.expedite(i, now)
+                    pending.clear()
+                to_check = schedule.pop_due(now)
+                if not to_check:
+                    continue
+                pending.difference_update(to_check)
+                last_event_check = now
+                self._update_job(job)
+                has_error = self._do_check(
+                    [self.monitors[i] for i in to_check],
+                    terminate_job) or has_error
+                now = time.time()
+                for i in to_check:
+                    schedule.schedule(i, now)
+                if terminated:
+                    # Job is being terminated. Do not run the monitors
+                    # again on output that has already been corrected.
+                    p.wait()
+        return has_error
+
     def run_interrupted(self):
         """
         Runs custodian in a interuppted mode, which sets up and
@@ -511,8 +864,12 @@ class Custodian(object):
             logger.info("Custodian running on Python version {}".format(v))
 
             # load run log
-            if os.path.exists(Custodian.LOG_FILE):
-                self.run_log = loadfn(Custodian.LOG_FILE, cls=MontyDecoder)
+            if os.path.exists(Custodian.LOG_FILE) or \
+                    os.path.exists(Custodian.JOURNAL_FILE):
+                self.run_log = load_run_log(Custodian.LOG_FILE,
+                                            Custodian.JOURNAL_FILE)
+                self._journal = RunLogJournal(
+                    Custodian.JOURNAL_FILE, Custodian.LOG_FILE, self.run_log)
 
             if len(self.run_log) == 0:
                 # starting up an initial job - setup input and quit
@@ -537,28 +894,29 @@ class Custodian(object):
                 # check error handlers
                 logger.info("Checking error handlers for {}.run".format(
                     job.name))
-                if self._do_check(self.handlers):
-                    logger.info("Failed validation based on error handlers")
-                    # raise an error for an unrecoverable error
-                    for x in self.run_log[-1]["corrections"]:
-                        if not x["actions"] and x["handler"].raises_runtime_error:
-                            self.run_log[-1]["handler"] = x["handler"]
-                            s = "Unrecoverable error for handler: {}. " \
-                                "Raising RuntimeError".format(x["handler"])
-                            raise NonRecoverableError(s, True, x["handler"])
-                    logger.info("Corrected input based on error handlers")
-                    # Return with more jobs to run if recoverable error caught
-                    # and corrected for
-                    return len(self.jobs) - job_n
-
-                # check validators
-                logger.info("Checking validator for {}.run".format(job.name))
-                for v in self.validators:
-                    if v.check():
-                        self.run_log[-1]["validator"] = v
-                        logger.info("Failed validation based on validator")
-                        s = "Validation failed: {}".format(v)
-                        raise ValidationError(s, True, v)
+                with parse_cache(), use_backup_store(self.backup_store):
+                    if self._do_check(self.handlers):
+                        logger.info("Failed validation based on error handlers")
+                        # raise an error for an unrecoverable error
+                        for x in self.run_log[-1]["corrections"]:
+                            if not x["actions"] and x["handler"].raises_runtime_error:
+                                self.run_log[-1]["handler"] = x["handler"]
+                                s = "Unrecoverable error for handler: {}. " \
+                                    "Raising RuntimeError".format(x["handler"])
+                                raise NonRecoverableError(s, True, x["handler"])
+                        logger.info("Corrected input based on error handlers")
+                        # Return with more jobs to run if recoverable error caught
+                        # and corrected for
+                        return len(self.jobs) - job_n
+
+                    # check validators
+                    logger.info("Checking validator for {}.run".format(job.name))
+                    for v in self.validators:
+                        if v.check():
+                            self.run_log[-1]["validator"] = v
+                            logger.info("Failed validation based on validator")
+                            s = "Validation failed: {}".format(v)
+                            raise ValidationError(s, True, v)
 
                 logger.info("Postprocessing for {}.run".format(job.name))
                 job.postprocess()
@@ -585,64 +943,221 @@ class Custodian(object):
         finally:
             # Log the corrections to a json file.
             logger.info("Logging to {}...".format(Custodian.LOG_FILE))
-            dumpfn(self.run_log, Custodian.LOG_FILE, cls=MontyEncoder,
-                   indent=4)
+            self._journal.compact(self.run_log)
             end = datetime.datetime.now()
             logger.info("Run ended at {}.".format(end))
             run_time = end - start
             logger.info("Run completed. Total time taken = {}."
                         .format(run_time))
             if self.finished and self.gzipped_output:
-                gzip_dir(".")
+                self._compress_output()
+
+    @staticmethod
+    def _get_signature(h):
+        files = h.watched_files
+        if files is None:
+            return None
+        return tuple(get_file_signature(f) for f in files)
+
+    def _check(self, h):
+        """
+        Runs the check of a handler, unless its watched files are unchanged
+        since its last check that found no error.
+        """
+        signature = self._get_signature(h)
+        if signature is not None and \
+                self._clean_signatures.get(id(h)) == signature:
+            return False
+        return self._record_check(h, signature, h.check())
+
+    def _record_check(self, h, signature, has_error):
+        if has_error or signature is None:
+            self._clean_signatures.pop(id(h), None)
+        else:
+            self._clean_signatures[id(h)] = signature
+        return has_error
+
+    def _is_checking(self, h):
+        t = self._running_checks.get(id(h))
+        return t is not None and t.is_alive()
+
+    def _run_checks(self, handlers):
+        """
+        Runs the checks of the handlers concurrently and waits for them to
+        finish within their time budgets.
+
+        Returns:
+            {id(handler): _HandlerCheck} for the checks that have finished.
+        """
+        self._running_checks = {k: t for k, t in self._running_checks.items()
+                                if t.is_alive()}
+        started = []
+        for h in handlers:
+            if id(h) in self._running_checks:
+                logger.warning("Check of {} from a previous cycle is still "
+                               "running. Skipping it.".format(h))
+                continue
+            signature = self._get_signature(h)
+            if signature is not None and \
+                    self._clean_signatures.get(id(h)) == signature:
+                continue
+            t = _HandlerCheck(h, signature)
+            t.start()
+            started.append(t)
+        start = time.time()
+        finished = {}
+        for t in started:
+            budget = t.handler.check_time_budget
+            if budget is None:
+                budget = self.check_time_budget
+            t.join(None if budget is None
+                   else max(start + budget - time.time(), 0))
+            if t.is_alive():
+                logger.warning("Check of {} exceeded its time budget of {} "
+                               "sec. Skipping it.".format(t.handler, budget))
+                self._running_checks[id(t.handler)] = t
+            else:
+                finished[id(t.handler)] = t
+        return finished
 
     def _do_check(self, handlers, terminate_func=None):
         """
         checks the specified handlers. Returns True iff errors caught
         """
         corrections = []
-        for h in handlers:
-            try:
-                if h.check():
-                    if h.max_num_corrections is not None \
-                            and h.n_applied_corrections >= h.max_num_corrections:
-                        msg = "Maximum number of corrections {} reached " \
-                              "for handler {}".format(h.max_num_corrections, h)
-                        if h.raise_on_max:
-                            self.run_log[-1]["handler"] = h
-                            self.run_log[-1]["max_errors_per_handler"] = True
-                            raise MaxCorrectionsPerHandlerError(msg, True, h.max_num_corrections, h)
-                        else:
-                            logger.warning(msg+" Correction not applied.")
+        with parse_cache() as cache:
+            checks = self._run_checks(handlers) if self.parallel_checks \
+                else None
+            for h in handlers:
+                try:
+                    if checks is not None and not corrections:
+                        # Skipped if unchanged or if it overran its time
+                        # budget.
+                        if id(h) not in checks:
                             continue
-                    if terminate_func is not None and h.is_terminating:
-                        logger.info("Terminating job")
-                        terminate_func()
-                        # make sure we don't terminate twice
-                        terminate_func = None
-                    d = h.correct()
-                    d["handler"] = h
-                    logger.error("\n" + pformat(d, indent=2, width=-1))
-                    corrections.append(d)
-                    h.n_applied_corrections += 1
-            except Exception:
-                if not self.skip_over_errors:
-                    raise
-                else:
-                    import traceback
-                    logger.error("Bad handler %s " % h)
-                    logger.error(traceback.format_exc())
-                    corrections.append(
-                        {"errors": ["Bad handler %s " % h],
-                         "actions": []})
+                        t = checks[id(h)]
+                        has_error = self._record_check(h, t.signature,
+                                                       t.get())
+                    elif self._is_checking(h):
+                        logger.warning("Check of {} is still running. "
+                                       "Skipping it.".format(h))
+                        continue
+                    else:
+                        has_error = self._check(h)
+                    if has_error:
+                        if h.max_num_corrections is not None \
+                                and h.n_applied_corrections >= h.max_num_corrections:
+                            msg = "Maximum number of corrections {} reached " \
+                                  "for handler {}".format(h.max_num_corrections, h)
+                            if h.raise_on_max:
+                                self.run_log[-1]["handler"] = h
+                                self.run_log[-1]["max_errors_per_handler"] = True
+                                raise MaxCorrectionsPerHandlerError(msg, True, h.max_num_corrections, h)
+                            else:
+                                logger.warning(msg+" Correction not applied.")
+                                continue
+                        if terminate_func is not None and h.is_terminating:
+                            logger.info("Terminating job")
+                            terminate_func()
+                            # make sure we don't terminate twice
+                            terminate_func = None
+                        d = h.correct()
+                        # The correction may have modified any of the files.
+                        cache.clear()
+                        self._clean_signatures = {}
+                        d["handler"] = h
+                        logger.error("\n" + pformat(d, indent=2, width=-1))
+                        corrections.append(d)
+                        h.n_applied_corrections += 1
+                except Exception:
+                    cache.clear()
+                    self._clean_signatures = {}
+                    if not self.skip_over_errors:
+                        raise
+                    else:
+                        import traceback
+                        logger.error("Bad handler %s " % h)
+                        logger.error(traceback.format_exc())
+                        corrections.append(
+                            {"errors": ["Bad handler %s " % h],
+                             "actions": []})
         self.total_errors += len(corrections)
         self.errors_current_job += len(corrections)
         self.run_log[-1]["corrections"].extend(corrections)
-        # We do a dump of the run log after each check.
-        dumpfn(self.run_log, Custodian.LOG_FILE, cls=MontyEncoder,
-               indent=4)
+        # Journal the changes to the run log after each check.
+        self._journal.sync(self.run_log)
         return len(corrections) > 0
 
 
+class _HandlerCheck(threading.Thread):
+    """
+    Runs the check of a handler in a daemon thread, so that a check that
+    never returns does not prevent the interpreter from exiting.
+    """
+
+    def __init__(self, handler, signature=None):
+        super(_HandlerCheck, self).__init__()
+        self.daemon = True
+        self.handler = handler
+        # Signature of the watched files of the handler before the check.
+        self.signature = signature
+        self._result = None
+        self._exc_info = None
+
+    def run(self):
+        try:
+            self._result = self.handler.check()
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+    def get(self):
+        """
+        Returns the result of the check, or raises the exception raised by
+        it.
+        """
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self._result
+
+
+class _OutputCompression(threading.Thread):
+    """
+    Compresses the outputs of a finished job with worker threads of the
+    lowest priority, so that they mostly use the cores left idle by the
+    next job. The compression starts once the checkpoint writer (if any)
+    has finished, since the checkpoint may read the outputs in place.
+    """
+
+    def __init__(self, compressor, filenames, checkpoint_writer=None,
+                 protected=()):
+        super(_OutputCompression, self).__init__()
+        self.daemon = True
+        self.compressor = compressor
+        self.filenames = filenames
+        self.checkpoint_writer = checkpoint_writer
+        self.protected = protected
+        self._result = None
+        self._exc_info = None
+
+    def run(self):
+        try:
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.join()
+            self._result = self.compressor.compress_files(
+                self.filenames, nice=19, protected=self.protected)
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+    def get(self):
+        """
+        Returns the actions applied, or raises the exception raised by the
+        compression.
+        """
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self._result
+
+
 class Job(six.with_metaclass(ABCMeta, MSONable)):
     """
     Abstract base class defining the interface for a Job.
@@ -676,6 +1191,25 @@ class Job(six.with_metaclass(ABCMeta, MSONable)):
     def terminate(self):
         return None
 
+    def update(self):
+        """
+        This method is called by Custodian while the job runs, before the
+        monitors are checked, and once the job has finished, e.g., to
+        update data derived from the outputs which the monitors and other
+        tools read. Does nothing by default.
+        """
+        pass
+
+    @property
+    def finalized_outputs(self):
+        """
+        Files which postprocess has finalized, i.e., which no later job
+        reads or writes, e.g., outputs renamed with a suffix. With
+        gzipped_output, Custodian compresses them in the background while
+        the next job runs. Defaults to [].
+        """
+        return []
+
     @property
     def name(self):
         """
@@ -719,6 +1253,35 @@ class ErrorHandler(MSONable):
     "actions":[])
     """
 
+    watched_files = None
+    """
+    Files on which the result of check depends, or None (the default) if
+    unknown. If the files are declared, Custodian skips the check, i.e.,
+    assumes that no error is found, as long as none of the files has
+    changed (as determined by their inode, size and modification time) since
+    the last check that found no error. They are also the files which
+    trigger the monitor in the "event" monitor_mode. Handlers whose checks
+    also depend on time, e.g., to detect frozen jobs, must not declare them.
+    """
+
+    monitor_interval = None
+    """
+    Interval in seconds at which this handler is run while a job is running,
+    if it is a monitor. If None, the default of the Custodian
+    (polling_time_step x monitor_freq) is used. Monitors which only compare
+    times can use short intervals, while monitors which parse large output
+    files should use longer ones. Subclasses can make this a property to
+    adapt the interval as the job progresses. It is evaluated every time
+    the monitor has been run.
+    """
+
+    check_time_budget = None
+    """
+    Maximum time in seconds that Custodian waits for the check of this
+    handler when the checks are run in parallel (see Custodian). If None,
+    the default budget of the Custodian is used.
+    """
+
     max_num_corrections = None
     raise_on_max = False
     """
@@ -732,6 +1295,14 @@ class ErrorHandler(MSONable):
     an instance attribute from __init__.
     """
 
+    def setup(self):
+        """
+        This method is called right before each run of a job, including the
+        runs after corrections, e.g., to record the state of the inputs which
+        the job starts from. Does nothing by default.
+        """
+        pass
+
     @abstractmethod
     def check(self):
         """
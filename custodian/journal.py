@@ -0,0 +1,157 @@
+# coding: utf-8
+
+"""
+This module implements an append-only journal for the Custodian run log.
+Instead of rewriting the entire (and potentially very large) run log after
+every check, only the changes since the previous write are appended to the
+journal as small JSON records, one per line. The journal is compacted into
+the usual run log file (custodian.json) at the end of each job and when
+Custodian exits.
+"""
+
+from __future__ import unicode_literals, division
+
+import os
+import json
+import logging
+
+from monty.json import MontyEncoder, MontyDecoder
+from monty.serialization import loadfn, dumpfn
+
+
+logger = logging.getLogger(__name__)
+
+
+class RunLogJournal(object):
+    """
+    Append-only journal of the changes made to a run log, i.e., a list of
+    dicts with one dict per job and a list of corrections in each dict.
+
+    There are two kinds of records, both of which refer to positions in the
+    run log so that replaying a record more than once has no effect:
+
+    - {"entry": n, "data": {...}} sets all fields of the nth job, except
+      the corrections.
+    - {"entry": n, "start": i, "corrections": [...]} sets the corrections
+      of the nth job starting from the ith one.
+
+    Each record is written with a single append, so that a crash can at
+    worst leave a truncated last line, which is ignored when the journal
+    is read.
+    """
+
+    def __init__(self, filename, log_file, run_log=None):
+        """
+        Args:
+            filename (str): Journal file.
+            log_file (str): Run log file into which the journal is
+                compacted.
+            run_log (list): Run log that has already been saved, i.e., that
+                can be obtained by reading log_file and the journal. Only
+                the changes made to it after this will be written.
+        """
+        self.filename = filename
+        self.log_file = log_file
+        self._mark_synced(run_log or [])
+
+    def _mark_synced(self, run_log):
+        self._entries = [self._fields(e) for e in run_log]
+        self._ncorrections = [len(e.get("corrections", [])) for e in run_log]
+
+    @staticmethod
+    def _fields(entry):
+        return {k: v for k, v in entry.items() if k != "corrections"}
+
+    def _append(self, records):
+        lines = "".join(json.dumps(r, cls=MontyEncoder) + "\n"
+                        for r in records)
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     0o644)
+        try:
+            os.write(fd, lines.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def sync(self, run_log):
+        """
+        Appends the changes made to the run log since the last sync to the
+        journal.
+
+        Args:
+            run_log (list): Run log.
+        """
+        if len(run_log) < len(self._entries):
+            # Jobs have been removed from the log, which cannot be expressed
+            # in the journal.
+            self.compact(run_log)
+            return
+        records = []
+        for n, entry in enumerate(run_log):
+            fields = self._fields(entry)
+            if n >= len(self._entries):
+                self._entries.append(None)
+                self._ncorrections.append(0)
+            if fields != self._entries[n]:
+                records.append({"entry": n, "data": fields})
+                self._entries[n] = fields
+            corrections = entry.get("corrections", [])
+            start = self._ncorrections[n]
+            if len(corrections) != start:
+                records.append({"entry": n, "start": start,
+                                "corrections": corrections[start:]})
+                self._ncorrections[n] = len(corrections)
+        if records:
+            self._append(records)
+
+    def compact(self, run_log):
+        """
+        Writes the complete run log to the run log file and removes the
+        journal.
+
+        Args:
+            run_log (list): Run log.
+        """
+        dumpfn(run_log, self.log_file, cls=MontyEncoder, indent=4)
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self._mark_synced(run_log)
+
+
+def load_run_log(log_file, journal_file):
+    """
+    Reads a run log that is stored in a run log file, a journal or both.
+
+    Args:
+        log_file (str): Run log file, e.g., custodian.json.
+        journal_file (str): Journal written by RunLogJournal.
+
+    Returns:
+        Run log as a list of dicts.
+    """
+    run_log = []
+    if os.path.exists(log_file):
+        run_log = loadfn(log_file, cls=MontyDecoder)
+    if not os.path.exists(journal_file):
+        return run_log
+    with open(journal_file, "rt") as f:
+        for i, line in enumerate(f):
+            try:
+                r = json.loads(line, cls=MontyDecoder)
+            except ValueError:
+                logger.warning("Ignoring corrupted record {} in {}".format(
+                    i + 1, journal_file))
+                continue
+            n = r["entry"]
+            while len(run_log) <= n:
+                run_log.append({"corrections": []})
+            entry = run_log[n]
+            if "data" in r:
+                corrections = entry.get("corrections", [])
+                entry.clear()
+                entry.update(r["data"])
+                entry["corrections"] = corrections
+            else:
+                start = r["start"]
+                entry["corrections"][start:start + len(r["corrections"])] = \
+                    r["corrections"]
+    return run_log
@@ -0,0 +1,258 @@
+# coding: utf-8
+
+"""
+This module implements the scheduling of the monitors of a running job.
+Each monitor is run at its own interval (see ErrorHandler.monitor_interval),
+so that cheap time-based checks can run often while expensive checks which
+parse large output files run rarely. Optionally, an AdaptiveMonitorPolicy
+further adapts the intervals to the activity of the job and limits the rate
+of checks, which matters when many Custodians share a filesystem.
+"""
+
+from __future__ import unicode_literals, division
+
+import os
+import time
+import heapq
+import random
+from collections import deque
+
+
+class MonitorScheduler(object):
+    """
+    Priority queue of the times at which monitors are next due to be run.
+    Monitors are referred to by their index in the list of monitors.
+    """
+
+    # Entries of the queue are (due, since, i) tuples, where since is the
+    # time at which the monitor originally became due if its run has been
+    # deferred, so that the longest waiting monitors come first.
+
+    def __init__(self, monitors, default_interval, start_time, policy=None):
+        """
+        Args:
+            monitors ([ErrorHandler]): Monitors to schedule.
+            default_interval (float): Interval in seconds for monitors which
+                do not define their own monitor_interval.
+            start_time (float): Time (as returned by time.time()) from which
+                the first run of each monitor is scheduled.
+            policy (AdaptiveMonitorPolicy): Policy which adapts the
+                intervals and limits the rate of runs. Defaults to None,
+                i.e., the monitors are run exactly at their intervals.
+        """
+        self.monitors = monitors
+        self.default_interval = default_interval
+        self.policy = policy
+        self._queue = []
+        for i in range(len(monitors)):
+            self.schedule(i, start_time)
+
+    def get_interval(self, i):
+        """
+        Returns:
+            Interval in seconds between runs of the ith monitor.
+        """
+        interval = getattr(self.monitors[i], "monitor_interval", None)
+        if interval is None:
+            interval = self.default_interval
+        return max(interval, 0)
+
+    def _push(self, due, i):
+        self._queue = [e for e in self._queue if e[2] != i]
+        heapq.heapify(self._queue)
+        heapq.heappush(self._queue, (due, due, i))
+
+    def schedule(self, i, now):
+        """
+        Schedules the next run of the ith monitor one interval after now.
+        Any previously scheduled run of the monitor is cancelled.
+        """
+        interval = self.get_interval(i)
+        if self.policy is not None:
+            interval = self.policy.adjust_interval(self.monitors[i],
+                                                   interval)
+        self._push(now + interval, i)
+
+    def expedite(self, i, now):
+        """
+        Moves the next run of the ith monitor forward to now, e.g., because
+        the files it watches have changed.
+        """
+        due = [e[0] for e in self._queue if e[2] == i]
+        self._push(min(due + [now]), i)
+
+    @property
+    def next_due(self):
+        """
+        Time at which the next monitor is due, or None if there are no
+        monitors.
+        """
+        return self._queue[0][0] if self._queue else None
+
+    def pop_due(self, now):
+        """
+        Removes the monitors that are due at the time now from the queue.
+        They have to be scheduled again with schedule once they have been
+        run.
+
+        Returns:
+            Sorted indices of the monitors that are due.
+        """
+        entries = []
+        while self._queue and self._queue[0][0] <= now:
+            entries.append(heapq.heappop(self._queue))
+        if self.policy is not None and entries:
+            # Monitors are admitted in the order in which they became due,
+            # so that deferred monitors are not starved.
+            entries.sort(key=lambda e: (e[1], e[2]))
+            n, retry = self.policy.admit(
+                [self.monitors[e[2]] for e in entries], now)
+            for due, since, i in entries[n:]:
+                heapq.heappush(self._queue, (retry, since, i))
+            entries = entries[:n]
+        return sorted(e[2] for e in entries)
+
+
+class AdaptiveMonitorPolicy(object):
+    """
+    Policy for the scheduling of monitors by a MonitorScheduler, meant for
+    running many Custodians on a shared (e.g., Lustre) filesystem. It
+
+    1. backs off, i.e., multiplies the interval of a monitor by
+       backoff_factor (up to max_backoff), every time none of its
+       watched_files has changed size since its last run, and goes back to
+       the normal interval as soon as one does. Monitors which do not
+       declare watched_files, i.e., whose checks also depend on time (e.g.,
+       FrozenJobErrorHandler), never back off;
+    2. randomly varies each interval by up to +/- jitter, so that
+       Custodians started at the same time do not check in lockstep;
+    3. limits the number of monitor runs to io_budget per minute. Runs in
+       excess of the budget are deferred until the budget allows them.
+
+    The decisions of the policy are recorded in a bounded log, which
+    Custodian stores in the run log (see summary). Custodian resets the
+    backoffs when each job starts (see reset).
+    """
+
+    def __init__(self, backoff_factor=2, max_backoff=8, jitter=0.1,
+                 io_budget=None, log_size=100, seed=None):
+        """
+        Args:
+            backoff_factor (float): Factor by which the interval of a
+                monitor is multiplied when its output file has not grown.
+                Defaults to 2.
+            max_backoff (float): Maximum factor by which intervals are
+                multiplied due to backoff. Defaults to 8.
+            jitter (float): Maximum relative random variation of the
+                intervals. Defaults to 0.1, i.e., +/- 10%.
+            io_budget (int): Maximum number of monitor runs per minute.
+                Defaults to None, i.e., no limit.
+            log_size (int): Maximum number of decisions kept in the log.
+                Defaults to 100.
+            seed: Seed of the random number generator used for the jitter.
+                Defaults to None, i.e., a different seed for every
+                instance.
+        """
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.io_budget = io_budget
+        self.decisions = deque(maxlen=log_size)
+        self.counters = {"runs": 0, "deferred": 0, "backoffs": 0,
+                         "resets": 0}
+        self._random = random.Random(seed)
+        self._backoff = {}
+        self._sizes = {}
+        self._runs = deque()
+
+    @staticmethod
+    def _get_size(monitor):
+        files = getattr(monitor, "watched_files", None)
+        if files is None:
+            return None
+        sizes = []
+        for f in files:
+            try:
+                sizes.append(os.stat(f).st_size)
+            except (OSError, TypeError, ValueError):
+                sizes.append(None)
+        return tuple(sizes) if any(s is not None for s in sizes) else None
+
+    def reset(self):
+        """
+        Resets the backoffs of all monitors, e.g., when a new job starts.
+        """
+        self._backoff = {}
+        self._sizes = {}
+
+    def _log(self, monitor, action, **kwargs):
+        d = {"time": round(time.time(), 3), "handler":
+             monitor.__class__.__name__, "action": action}
+        d.update(kwargs)
+        self.decisions.append(d)
+
+    def adjust_interval(self, monitor, interval):
+        """
+        Args:
+            monitor (ErrorHandler): Monitor which has just been run (or
+                which is scheduled for the first time).
+            interval (float): Interval of the monitor.
+
+        Returns:
+            Interval until the next run of the monitor.
+        """
+        key = id(monitor)
+        size = self._get_size(monitor)
+        backoff = self._backoff.get(key, 1)
+        if size is not None and key in self._sizes:
+            if size == self._sizes[key]:
+                new_backoff = min(backoff * self.backoff_factor,
+                                  self.max_backoff)
+                if new_backoff != backoff:
+                    self.counters["backoffs"] += 1
+                    self._log(monitor, "backoff", factor=new_backoff)
+                backoff = new_backoff
+            elif backoff != 1:
+                self.counters["resets"] += 1
+                self._log(monitor, "reset", factor=1)
+                backoff = 1
+        self._sizes[key] = size
+        self._backoff[key] = backoff
+        return interval * backoff * \
+            (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def admit(self, monitors, now):
+        """
+        Decides which of the due monitors can be run now given the I/O
+        budget.
+
+        Args:
+            monitors ([ErrorHandler]): Due monitors in order of priority.
+            now (float): Current time.
+
+        Returns:
+            (n, retry): The first n monitors can be run now. The others
+            have to be deferred to the time retry.
+        """
+        while self._runs and self._runs[0] <= now - 60:
+            self._runs.popleft()
+        n = len(monitors)
+        retry = now
+        if self.io_budget is not None:
+            n = max(min(n, self.io_budget - len(self._runs)), 0)
+            retry = (self._runs[0] if self._runs else now) + 60
+            for m in monitors[n:]:
+                self.counters["deferred"] += 1
+                self._log(m, "defer", until=round(retry, 3))
+        self._runs.extend([now] * n)
+        self.counters["runs"] += n
+        return n, retry
+
+    def summary(self):
+        """
+        Returns:
+            JSON serializable dict with the counters and the logged
+            decisions of the policy, for the run log.
+        """
+        return {"counters": dict(self.counters),
+                "decisions": list(self.decisions)}
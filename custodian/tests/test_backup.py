@@ -0,0 +1,150 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+
+from custodian.backup import BackupStore, use_backup_store, \
+    get_backup_store, copy_file
+from custodian.utils import backup
+
+
+class BackupStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        for f in ["INCAR", "POSCAR", "OUTCAR"]:
+            with open(f, "w") as fh:
+                fh.write("{} content\n".format(f) * 100)
+
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_backup_restore(self):
+        store = BackupStore()
+        self.assertEqual(store.backup(["INCAR", "POSCAR", "OUTCAR", "*CAR"]),
+                         "error.1")
+        size = store.size
+        # Unchanged files are stored once.
+        with open("INCAR", "w") as f:
+            f.write("ALGO = Fast\n")
+        self.assertEqual(store.backup({"INCAR", "POSCAR", "OUTCAR"}),
+                         "error.2")
+        self.assertEqual(store.backup("*CAR", prefix="prev_run"),
+                         "prev_run.1")
+        self.assertEqual(store.snapshots, ["error.1", "error.2",
+                                           "prev_run.1"])
+        self.assertEqual(len(glob.glob(".custodian_backups/objects/*/*")),
+                         4)
+        self.assertGreater(store.size, size)
+
+        restored = store.restore("error.1", "restored")
+        self.assertEqual(sorted(restored), [
+            os.path.join("restored", f) for f in ["INCAR", "OUTCAR",
+                                                  "POSCAR"]])
+        for f in ["INCAR", "OUTCAR", "POSCAR"]:
+            self.assertEqual(self.read(os.path.join("restored", f)),
+                             "{} content\n".format(f) * 100)
+        store.restore("error.2", "restored")
+        self.assertEqual(self.read("restored/INCAR"), "ALGO = Fast\n")
+        self.assertRaises(KeyError, store.restore, "error.3")
+
+        # The store continues from the existing manifest.
+        self.assertEqual(BackupStore().backup(["INCAR"]), "error.3")
+
+    def test_options(self):
+        store = BackupStore(compression=None, link="hardlink",
+                            link_threshold=1000)
+        store.backup(["INCAR", "POSCAR", "OUTCAR"])
+        size = sum([os.path.getsize(f) for f in ["INCAR", "POSCAR",
+                                                 "OUTCAR"]])
+        for f in ["INCAR", "POSCAR", "OUTCAR"]:
+            os.remove(f)
+        store.restore("error.1")
+        self.assertEqual(self.read("OUTCAR"), "OUTCAR content\n" * 100)
+        self.assertEqual(store.size, size)
+
+        store = BackupStore("capped", max_size=2000)
+        store.backup(["INCAR", "POSCAR", "OUTCAR"])
+        self.assertEqual(len(glob.glob("capped/objects/*/*")), 1)
+        # The cap applies to the sizes before compression.
+        store = BackupStore("capped2", max_size=3000)
+        store.backup(["INCAR"])
+        store.backup(["POSCAR", "OUTCAR"])
+        self.assertEqual(len(glob.glob("capped2/objects/*/*")), 2)
+        self.assertRaises(ValueError, BackupStore, compression="bz2")
+
+    def test_backup_async(self):
+        # Small files are frozen, and the large files which cannot be
+        # cloned are stored either before or after they are modified.
+        store = BackupStore(link_threshold=1450)
+        writer = store.backup_async(["INCAR", "OUTCAR"])
+        for f in ["INCAR", "OUTCAR"]:
+            with open(f, "w") as fh:
+                fh.write("truncated")
+        self.assertEqual(writer.get(), "error.1")
+        store.restore("error.1", "restored")
+        self.assertEqual(self.read("restored/INCAR"),
+                         "INCAR content\n" * 100)
+        self.assertIn(self.read("restored/OUTCAR"),
+                      ["OUTCAR content\n" * 100, "truncated"])
+
+        # A file modified since its signature was taken is read again.
+        sig = BackupStore._get_signature("OUTCAR")
+        os.makedirs("stage")
+        with open("OUTCAR", "w") as f:
+            f.write("modified")
+        h, new_sig, obj = store._store_in_place(("OUTCAR", sig, "stage"))
+        self.assertEqual(new_sig, BackupStore._get_signature("OUTCAR"))
+        self.assertEqual(obj["size"], len("modified"))
+        self.assertEqual(os.listdir("stage"), [])
+        store.MAX_RETRIES = 0
+        self.assertRaises(IOError, store._store_in_place,
+                          ("OUTCAR", sig, "stage"))
+
+    def test_exclude(self):
+        os.makedirs("custodian_trajectory")
+        with open("custodian_trajectory/E0.bin", "w") as f:
+            f.write("data")
+        store = BackupStore()
+        store.backup(["."], exclude=["custodian_trajectory", "POSCAR"])
+        self.assertEqual(sorted(store.restore("error.1", "restored")),
+                         [os.path.join("restored", f)
+                          for f in ["INCAR", "OUTCAR"]])
+
+    def test_use_backup_store(self):
+        store = BackupStore()
+        self.assertIsNone(get_backup_store())
+        with use_backup_store(store):
+            self.assertIs(get_backup_store(), store)
+            backup(["INCAR", "POSCAR"])
+        self.assertIsNone(get_backup_store())
+        self.assertEqual(glob.glob("error.*.tar.gz"), [])
+        self.assertEqual(store.snapshots, ["error.1"])
+        backup(["INCAR", "POSCAR"])
+        self.assertEqual(glob.glob("error.*.tar.gz"), ["error.1.tar.gz"])
+
+    def test_copy_file(self):
+        self.assertIn(copy_file("OUTCAR", "OUTCAR.1"), ["reflink", "copy"])
+        self.assertFalse(os.path.samefile("OUTCAR", "OUTCAR.1"))
+        self.assertIn(copy_file("OUTCAR", "OUTCAR.2", link="hardlink"),
+                      ["reflink", "hardlink"])
+        self.assertEqual(copy_file("INCAR", "OUTCAR.2", link=None), "copy")
+        self.assertEqual(self.read("OUTCAR.2"), self.read("INCAR"))
+        self.assertEqual(self.read("OUTCAR"), "OUTCAR content\n" * 100)
+        self.assertRaises(ValueError, copy_file, "INCAR", "INCAR.1", "cow")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
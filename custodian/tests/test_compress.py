@@ -0,0 +1,124 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import sys
+import gzip
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from monty.io import zopen
+from monty.os.path import zpath
+from monty.shutil import decompress_dir
+
+import custodian
+from custodian.compress import OutputCompressor
+
+
+class OutputCompressorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.contents = {}
+        for f in ["INCAR", "OUTCAR", "vasprun.xml", "WAVECAR", "CHGCAR.gz",
+                  "sub/OSZICAR", ".custodian_backups/manifest.json"]:
+            if os.path.dirname(f) and not os.path.isdir(os.path.dirname(f)):
+                os.makedirs(os.path.dirname(f))
+            self.contents[f] = "".join(["{} line {}\n".format(f, i)
+                                        for i in range(2000)]).encode()
+            with (gzip.open if f.endswith(".gz") else open)(f, "wb") as fh:
+                fh.write(self.contents[f])
+
+    def read_gz(self, filename):
+        with gzip.open(filename + ".gz", "rb") as f:
+            return f.read()
+
+    def test_get_action(self):
+        c = OutputCompressor([("WAVECAR*", "delete"), ("vasprun*", "best"),
+                              ("INCAR", "skip"), ("sub/*", 3)])
+        self.assertEqual(c.get_action("WAVECAR"), "delete")
+        self.assertEqual(c.get_action("vasprun.xml"), 9)
+        self.assertEqual(c.get_action("vasprun.xml.gz"), "skip")
+        self.assertEqual(c.get_action("INCAR"), "skip")
+        self.assertEqual(c.get_action("sub/OSZICAR"), 3)
+        self.assertEqual(c.get_action("OUTCAR"), 6)
+        # Protected directories are skipped before the rules are checked.
+        c = OutputCompressor([("*", "best")])
+        self.assertEqual(c.get_action("capped/manifest.json"), 9)
+        self.assertEqual(c.get_action("capped/manifest.json", ["capped"]),
+                         "skip")
+        self.assertEqual(c.get_action("./capped/objects/ab/cd",
+                                      ["capped/"]), "skip")
+        self.assertEqual(c.get_action("capped2/manifest.json", ["capped"]),
+                         9)
+        self.assertRaises(ValueError, OutputCompressor, [("*", "zip")])
+
+    def test_compress_dir(self):
+        for nprocs in [1, 2]:
+            c = OutputCompressor([("WAVECAR*", "delete"),
+                                  ("vasprun*", "best"), ("INCAR", "skip")],
+                                 nprocs=nprocs, block_size=10000,
+                                 block_threshold=30000)
+            actions = c.compress_dir(".", protected=[".custodian_backups"])
+            self.assertEqual(actions["WAVECAR"], "delete")
+            self.assertEqual(actions["INCAR"], "skip")
+            self.assertEqual(actions["vasprun.xml"], 9)
+            self.assertEqual(actions["CHGCAR.gz"], "skip")
+            self.assertFalse(os.path.exists("WAVECAR"))
+            self.assertEqual(sorted(os.listdir(".")),
+                             [".custodian_backups", "CHGCAR.gz", "INCAR",
+                              "OUTCAR.gz", "sub", "vasprun.xml.gz"])
+            self.assertEqual(os.listdir("sub"), ["OSZICAR.gz"])
+            for f in ["OUTCAR", "vasprun.xml", "sub/OSZICAR"]:
+                self.assertEqual(self.read_gz(f), self.contents[f])
+            with zopen(zpath("OUTCAR"), "rt") as f:
+                self.assertEqual(f.readline(), "OUTCAR line 0\n")
+            decompress_dir(".")
+            with open("CHGCAR", "rb") as fin, \
+                    gzip.open("CHGCAR.gz", "wb") as fout:
+                fout.write(fin.read())
+            os.remove("CHGCAR")
+            for f in ["OUTCAR", "vasprun.xml", "sub/OSZICAR", "INCAR"]:
+                with open(f, "rb") as fh:
+                    self.assertEqual(fh.read(), self.contents[f])
+            with open("WAVECAR", "wb") as fh:
+                fh.write(self.contents["WAVECAR"])
+
+    def test_compress_files(self):
+        c = OutputCompressor([("WAVECAR*", "delete")], nprocs=1)
+        actions = c.compress_files(["OUTCAR", "WAVECAR", "CHGCAR.gz"],
+                                   nice=1)
+        self.assertEqual(actions, {"OUTCAR": 6, "WAVECAR": "delete",
+                                   "CHGCAR.gz": "skip"})
+        self.assertEqual(self.read_gz("OUTCAR"), self.contents["OUTCAR"])
+        self.assertFalse(os.path.exists("WAVECAR"))
+        self.assertTrue(os.path.exists("INCAR"))
+
+    def test_driver_script(self):
+        # The workers do not run the top level of the calling script again.
+        with open("driver.py", "w") as f:
+            f.write("from custodian.compress import OutputCompressor\n"
+                    "print('run')\n"
+                    "OutputCompressor(nprocs=2).compress_files("
+                    "['OUTCAR', 'INCAR'], nice=1)\n")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [os.path.dirname(os.path.dirname(custodian.__file__))] +
+            [p for p in [env.get("PYTHONPATH")] if p])
+        output = subprocess.check_output([sys.executable, "driver.py"],
+                                         env=env)
+        self.assertEqual(output.split(), [b"run"])
+        self.assertEqual(self.read_gz("OUTCAR"), self.contents["OUTCAR"])
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,7 +10,11 @@ import os
 import glob
 import shutil
 import subprocess
+import tempfile
+import time
 import ruamel.yaml as yaml
+from custodian.backup import BackupStore
+from custodian.compress import OutputCompressor
 
 """
 Created on Jun 1, 2012
@@ -39,6 +43,78 @@ class ExitCodeJob(Job):
         pass
 
 
+class DelayedOutputJob(Job):
+    """
+    Writes an error message to an output file after a short delay on its
+    first run, and then keeps running for a long time.
+    """
+
+    def __init__(self, output_filename="delayed.out"):
+        self.output_filename = output_filename
+        self.nruns = 0
+
+    def setup(self):
+        pass
+
+    def run(self):
+        self.nruns += 1
+        if self.nruns > 1:
+            return subprocess.Popen("exit 0", shell=True)
+        return subprocess.Popen(
+            "echo Running > {0}; sleep 0.5; echo ERROR >> {0}; "
+            "exec sleep 60".format(self.output_filename), shell=True)
+
+    def postprocess(self):
+        pass
+
+
+class FinalizedOutputJob(Job):
+    """
+    Writes an output which postprocess renames with a suffix. If wait_for
+    is given, the job runs until wait_for has been gzipped (or for at most
+    10 s).
+    """
+
+    def __init__(self, suffix, wait_for=None):
+        self.suffix = suffix
+        self.wait_for = wait_for
+
+    def setup(self):
+        pass
+
+    def run(self):
+        cmd = "echo {} > out".format(self.suffix)
+        if self.wait_for:
+            cmd += "; for i in $(seq 200); do [ -f {}.gz ] && break; " \
+                   "sleep 0.05; done".format(self.wait_for)
+        return subprocess.Popen(cmd, shell=True)
+
+    def postprocess(self):
+        shutil.move("out", "out" + self.suffix)
+
+    @property
+    def finalized_outputs(self):
+        return ["out" + self.suffix]
+
+
+class OutputErrorHandler(ErrorHandler):
+
+    is_monitor = True
+
+    def __init__(self, output_filename="delayed.out"):
+        self.output_filename = output_filename
+
+    def check(self):
+        if not os.path.exists(self.output_filename):
+            return False
+        with open(self.output_filename) as f:
+            return "ERROR" in f.read()
+
+    def correct(self):
+        os.remove(self.output_filename)
+        return {"errors": ["ERROR"], "actions": ["removed output"]}
+
+
 class ExampleJob(Job):
 
     def __init__(self, jobid, params=None):
@@ -120,6 +196,95 @@ class ExampleHandler2b(ExampleHandler2):
         return {"errors": "Unrecoverable error", "actions": []}
 
 
+class SlowCheckHandler(ErrorHandler):
+    """
+    This handler takes much longer to check than its time budget.
+    """
+    check_time_budget = 0.1
+
+    def __init__(self):
+        self.nchecks = 0
+
+    def check(self):
+        self.nchecks += 1
+        time.sleep(1)
+        return True
+
+    def correct(self):
+        return {"errors": "slow", "actions": None}
+
+
+class WatchedFileHandler(ErrorHandler):
+    """
+    This handler finds an error if its watched file contains ERROR.
+    """
+
+    def __init__(self, output_filename="watched.out"):
+        self.output_filename = output_filename
+        self.nchecks = 0
+
+    @property
+    def watched_files(self):
+        return [self.output_filename]
+
+    def check(self):
+        self.nchecks += 1
+        with open(self.output_filename) as f:
+            return "ERROR" in f.read()
+
+    def correct(self):
+        return {"errors": ["ERROR"], "actions": None}
+
+
+class OneShotHandler(ErrorHandler):
+    """
+    This monitor finds an error on its first check only, and corrects it
+    without terminating the job.
+    """
+
+    is_monitor = True
+    is_terminating = False
+
+    def __init__(self, monitor_interval):
+        self.monitor_interval = monitor_interval
+        self.nchecks = 0
+        self.nsetups = 0
+
+    def setup(self):
+        self.nsetups += 1
+
+    def check(self):
+        self.nchecks += 1
+        return self.nchecks == 1
+
+    def correct(self):
+        return {"errors": ["once"], "actions": ["none"]}
+
+
+class TwoRunsJob(Job):
+    """
+    Runs for a few seconds on its first run and exits right away after.
+    """
+
+    def __init__(self):
+        self.nruns = 0
+        self.nupdates = 0
+
+    def setup(self):
+        pass
+
+    def run(self):
+        self.nruns += 1
+        return subprocess.Popen(
+            "sleep {}".format(2 if self.nruns == 1 else 0), shell=True)
+
+    def update(self):
+        self.nupdates += 1
+
+    def postprocess(self):
+        pass
+
+
 class ExampleValidator1(Validator):
 
     def __init__(self):
@@ -154,6 +319,15 @@ class CustodianTest(unittest.TestCase):
                       terminate_on_nonzero_returncode=False)
         c.run()
 
+    def test_exit_detection(self):
+        # The job exit must be noticed right away, not after the next
+        # polling_time_step.
+        t = time.time()
+        c = Custodian([OutputErrorHandler()], [ExitCodeJob(0)],
+                      polling_time_step=30)
+        c.run()
+        self.assertLess(time.time() - t, 20)
+
     def test_run(self):
         njobs = 100
         params = {"initial": 0, "total": 0}
@@ -164,6 +338,72 @@ class CustodianTest(unittest.TestCase):
         self.assertEqual(len(output), njobs)
         d = ExampleHandler(params).as_dict()
 
+    def test_event_monitoring(self):
+        # With the default polling, the error would only be caught after
+        # 30 x 10 = 300 secs.
+        h = OutputErrorHandler()
+        c = Custodian([h], [DelayedOutputJob()], max_errors=2,
+                      polling_time_step=10, monitor_freq=30,
+                      monitor_mode="event")
+        t = time.time()
+        c.run()
+        self.assertLess(time.time() - t, 30)
+        self.assertEqual(len(c.run_log[-1]["corrections"]), 1)
+        self.assertEqual(c.run_log[-1]["corrections"][0]["errors"], ["ERROR"])
+        self.assertRaises(ValueError, Custodian, [h], [DelayedOutputJob()],
+                          monitor_mode="unknown")
+
+    def test_correction_between_checks(self):
+        # A later clean check of another monitor does not hide the
+        # correction made by an earlier one.
+        for mode in ["polling", "event"]:
+            job = TwoRunsJob()
+            c = Custodian([OneShotHandler(0.2), OneShotHandler(0.5)], [job],
+                          max_errors=2, polling_time_step=0.1,
+                          monitor_mode=mode)
+            c.handlers[1].nchecks = 1
+            c.run()
+            self.assertEqual(job.nruns, 2)
+            self.assertEqual(len(c.run_log[-1]["corrections"]), 1)
+            # The job is updated before the monitors are checked, and at
+            # the end of each run.
+            self.assertGreater(job.nupdates, 2)
+            # The handlers are set up before each run.
+            self.assertEqual(c.handlers[0].nsetups, 2)
+
+    def test_parallel_checks(self):
+        njobs = 10
+        params = {"initial": 0, "total": 0}
+        slow = SlowCheckHandler()
+        c = Custodian([ExampleHandler(params), slow],
+                      [ExampleJob(i, params) for i in range(njobs)],
+                      max_errors=1000, parallel_checks=True)
+        t = time.time()
+        output = c.run()
+        self.assertEqual(len(output), njobs)
+        # The slow check was skipped instead of being waited for, and was
+        # never run twice at the same time.
+        self.assertLess(time.time() - t, 5)
+        self.assertGreater(slow.nchecks, 0)
+        for d in output:
+            for x in d["corrections"]:
+                self.assertEqual(x["errors"], "total < 50")
+
+    def test_skip_unchanged(self):
+        h = WatchedFileHandler()
+        c = Custodian([h], [ExitCodeJob(0)])
+        c.run_log = [{"corrections": []}]
+        with open("watched.out", "w") as f:
+            f.write("Running\n")
+        self.assertFalse(c._do_check([h]))
+        self.assertFalse(c._do_check([h]))
+        self.assertEqual(h.nchecks, 1)
+        with open("watched.out", "a") as f:
+            f.write("ERROR\n")
+        self.assertTrue(c._do_check([h]))
+        self.assertTrue(c._do_check([h]))
+        self.assertEqual(h.nchecks, 3)
+
     def test_run_interrupted(self):
         njobs = 100
         params = {'initial': 0, 'total': 0}
@@ -295,10 +535,12 @@ custodian_params:
     def tearDown(self):
         for f in glob.glob("custodian.*.tar.gz"):
             os.remove(f)
-        try:
-            os.remove("custodian.json")
-        except OSError:
-            pass  # Ignore if file cannot be found.
+        for f in ["custodian.json", "custodian.journal", "delayed.out",
+                  "watched.out"]:
+            try:
+                os.remove(f)
+            except OSError:
+                pass  # Ignore if file cannot be found.
         os.chdir(self.cwd)
 
 
@@ -326,5 +568,101 @@ class CustodianCheckpointTest(unittest.TestCase):
         os.chdir(self.cwd)
 
 
+class CustodianIncrementalCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def write(self, filename, content):
+        with open(filename, "w") as f:
+            f.write(content)
+
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_background_compression(self):
+        self.write("INCAR", "ALGO = Fast\n")
+        jobs = [FinalizedOutputJob(".1"),
+                FinalizedOutputJob(".2", wait_for="out.1")]
+        c = Custodian([], jobs, checkpoint=True, gzipped_output=True)
+        start = time.time()
+        c.run()
+        # The output of the first job was compressed during the second job.
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(sorted(glob.glob("*")),
+                         ["INCAR.gz", "custodian.json.gz", "out.1.gz",
+                          "out.2.gz"])
+
+    def test_compression_protects_stores(self):
+        self.write("INCAR", "ALGO = Fast\n")
+        store = BackupStore("capped")
+        store.backup(["INCAR"])
+        c = Custodian([], [FinalizedOutputJob(".1")], checkpoint=True,
+                      gzipped_output=True, backup_store=store,
+                      output_compressor=OutputCompressor([("*", "best")],
+                                                         nprocs=1))
+        objects = glob.glob("capped/objects/*/*")
+        c._save_checkpoint_async(self.tmpdir, 1)
+        c._wait_checkpoint()
+        # The backup store is not copied into the checkpoints.
+        chk = Custodian._get_checkpoint_store(self.tmpdir)
+        self.assertEqual(sorted(chk.restore("custodian.chk.1", "restored")),
+                         [os.path.join("restored", "INCAR")])
+        shutil.rmtree("restored")
+        c.run()
+        self.assertTrue(os.path.exists("out.1.gz"))
+        self.assertTrue(os.path.exists("capped/manifest.json"))
+        self.assertEqual(glob.glob("capped/objects/*/*"), objects)
+        self.assertEqual(store.snapshots, ["error.1"])
+
+    def test_checkpoint_compressed_output(self):
+        self.write("out.1", "output")
+        Custodian._save_checkpoint(self.tmpdir, 1)
+        OutputCompressor(nprocs=1).compress_files(["out.1"])
+        restart, run_log = Custodian._load_checkpoint(self.tmpdir)
+        self.assertEqual(restart, 1)
+        # The compressed output is not restored next to its .gz.
+        self.assertEqual(glob.glob("out.1*"), ["out.1.gz"])
+
+    def test_checkpoint(self):
+        c = Custodian([], [ExitCodeJob(0)], checkpoint=True)
+        self.write("INCAR", "ALGO = Fast\n")
+        self.write("WAVECAR", "wavefunctions")
+        self.write(Custodian.LOG_FILE, "[]")
+        c._save_checkpoint_async(self.tmpdir, 1)
+        # Files can be modified while the checkpoint is being written.
+        self.write("INCAR", "ALGO = Normal\n")
+        c._wait_checkpoint()
+        store = Custodian._get_checkpoint_store(self.tmpdir)
+        self.assertEqual(store.snapshots, ["custodian.chk.1"])
+
+        Custodian._save_checkpoint(self.tmpdir, 2)
+        # Only the changed file is stored, and the older checkpoint is
+        # replaced.
+        self.assertEqual(store.snapshots, ["custodian.chk.2"])
+        self.assertEqual(len(glob.glob(os.path.join(
+            Custodian.CHECKPOINT_DIR, "objects", "*", "*"))), 3)
+
+        self.write("INCAR", "ALGO = All\n")
+        os.remove("WAVECAR")
+        self.write("OUTCAR", "new")
+        restart, run_log = Custodian._load_checkpoint(self.tmpdir)
+        self.assertEqual(restart, 2)
+        self.assertEqual(run_log, [])
+        self.assertEqual(self.read("INCAR"), "ALGO = Normal\n")
+        self.assertEqual(self.read("WAVECAR"), "wavefunctions")
+
+        Custodian._delete_checkpoints(self.tmpdir)
+        self.assertFalse(os.path.exists(Custodian.CHECKPOINT_DIR))
+        self.assertEqual(Custodian._load_checkpoint(self.tmpdir), (0, []))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,65 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from custodian.journal import RunLogJournal, load_run_log
+
+
+class RunLogJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def test_sync_and_load(self):
+        journal = RunLogJournal("custodian.journal", "custodian.json")
+        run_log = [{"job": {"name": "relax1"}, "corrections": [],
+                    "job_n": 1}]
+        journal.sync(run_log)
+        run_log[0]["corrections"].append({"errors": ["brmix"],
+                                          "actions": []})
+        journal.sync(run_log)
+        with open("custodian.journal") as f:
+            nlines = len(f.readlines())
+        # Nothing changed, so nothing is written.
+        journal.sync(run_log)
+        with open("custodian.journal") as f:
+            self.assertEqual(len(f.readlines()), nlines)
+        self.assertFalse(os.path.exists("custodian.json"))
+        self.assertEqual(load_run_log("custodian.json", "custodian.journal"),
+                         run_log)
+
+        journal.compact(run_log)
+        self.assertFalse(os.path.exists("custodian.journal"))
+        run_log[0]["max_errors"] = True
+        run_log[0]["corrections"].append({"errors": ["zpotrf"],
+                                          "actions": []})
+        run_log.append({"job": {"name": "relax2"}, "corrections": [],
+                        "job_n": 2})
+        journal.sync(run_log)
+        self.assertEqual(load_run_log("custodian.json", "custodian.journal"),
+                         run_log)
+
+        # Replaying records more than once and a truncated last record
+        # (e.g., due to a crash during a write) are harmless.
+        with open("custodian.journal") as f:
+            content = f.read()
+        with open("custodian.journal", "a") as f:
+            f.write(content)
+            f.write('{"entry": 1, "da')
+        self.assertEqual(load_run_log("custodian.json", "custodian.journal"),
+                         run_log)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from custodian.scheduler import MonitorScheduler, AdaptiveMonitorPolicy
+
+
+class Monitor(object):
+
+    def __init__(self, monitor_interval=None, output_filename=None,
+                 watched_files=None):
+        self.monitor_interval = monitor_interval
+        self.output_filename = output_filename
+        self.watched_files = watched_files
+
+
+class MonitorSchedulerTest(unittest.TestCase):
+
+    def test_schedule(self):
+        monitors = [Monitor(), Monitor(10), Monitor(1000)]
+        schedule = MonitorScheduler(monitors, 300, 0)
+        self.assertEqual(schedule.next_due, 10)
+        self.assertEqual(schedule.pop_due(9), [])
+        self.assertEqual(schedule.pop_due(10), [1])
+        schedule.schedule(1, 10)
+        self.assertEqual(schedule.next_due, 20)
+        self.assertEqual(schedule.pop_due(400), [0, 1])
+        monitors[0].monitor_interval = 5
+        schedule.schedule(0, 400)
+        schedule.schedule(1, 400)
+        # Rescheduling replaces the previous due time.
+        schedule.schedule(1, 401)
+        self.assertEqual(schedule.pop_due(411), [0, 1])
+        self.assertEqual(schedule.next_due, 1000)
+        self.assertIsNone(MonitorScheduler([], 300, 0).next_due)
+
+
+class AdaptiveMonitorPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def test_backoff(self):
+        policy = AdaptiveMonitorPolicy(jitter=0, max_backoff=4)
+        m = Monitor(output_filename="vasp.out", watched_files=["vasp.out"])
+        with open("vasp.out", "w") as f:
+            f.write("step 1\n")
+        self.assertEqual(policy.adjust_interval(m, 10), 10)
+        self.assertEqual(policy.adjust_interval(m, 10), 20)
+        self.assertEqual(policy.adjust_interval(m, 10), 40)
+        self.assertEqual(policy.adjust_interval(m, 10), 40)
+        with open("vasp.out", "a") as f:
+            f.write("step 2\n")
+        self.assertEqual(policy.adjust_interval(m, 10), 10)
+        # Monitors without watched files, e.g., of frozen jobs, never back
+        # off.
+        for m in [Monitor(), Monitor(output_filename="vasp.out")]:
+            self.assertEqual(policy.adjust_interval(m, 10), 10)
+            self.assertEqual(policy.adjust_interval(m, 10), 10)
+        summary = policy.summary()
+        self.assertEqual(summary["counters"]["backoffs"], 2)
+        self.assertEqual(summary["counters"]["resets"], 1)
+        self.assertEqual([d["action"] for d in summary["decisions"]],
+                         ["backoff", "backoff", "reset"])
+
+    def test_reset(self):
+        policy = AdaptiveMonitorPolicy(jitter=0)
+        m = Monitor(watched_files=["vasp.out"])
+        with open("vasp.out", "w") as f:
+            f.write("step 1\n")
+        policy.adjust_interval(m, 10)
+        self.assertEqual(policy.adjust_interval(m, 10), 20)
+        policy.reset()
+        self.assertEqual(policy.adjust_interval(m, 10), 10)
+
+    def test_jitter(self):
+        policy = AdaptiveMonitorPolicy(jitter=0.1, seed=0)
+        intervals = [policy.adjust_interval(Monitor(), 100)
+                     for i in range(100)]
+        self.assertTrue(all(90 <= i <= 110 for i in intervals))
+        self.assertGreater(len(set(intervals)), 1)
+
+    def test_io_budget(self):
+        policy = AdaptiveMonitorPolicy(jitter=0, io_budget=2)
+        monitors = [Monitor(10), Monitor(10), Monitor(10)]
+        schedule = MonitorScheduler(monitors, 300, 0, policy)
+        self.assertEqual(schedule.pop_due(10), [0, 1])
+        # The third run is deferred until the first runs are a minute old.
+        self.assertEqual(schedule.next_due, 70)
+        schedule.schedule(0, 10)
+        schedule.schedule(1, 10)
+        self.assertEqual(schedule.pop_due(20), [])
+        self.assertEqual(schedule.pop_due(70), [0, 2])
+        self.assertEqual(schedule.pop_due(130), [1])
+        self.assertEqual(policy.counters["runs"], 5)
+        self.assertEqual(policy.counters["deferred"], 4)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
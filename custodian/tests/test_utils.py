@@ -0,0 +1,229 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from custodian.utils import IncrementalReader, MessageMatcher, \
+    MessageScanner, get_parsed, parse_cache, write_digest, load_digest, \
+    DIGEST_SUFFIX
+
+
+class MessageScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def test_incremental_reader(self):
+        with open("vasp.out", "w") as f:
+            f.write("line 1\nline 2\npartial")
+        reader = IncrementalReader("vasp.out", chunk_size=4)
+        self.assertEqual("".join(reader.read_chunks()),
+                         "line 1\nline 2\npartial")
+        self.assertTrue(reader.restarted)
+        with open("vasp.out", "a") as f:
+            f.write(" line\nline 4\n")
+        self.assertEqual("".join(reader.read_chunks()),
+                         "partial line\nline 4\n")
+        self.assertFalse(reader.restarted)
+        self.assertEqual("".join(reader.read_chunks()), "")
+        # Rewriting the file with longer content restarts the reader.
+        with open("vasp.out", "w") as f:
+            f.write("new run\n" * 10)
+        self.assertEqual("".join(reader.read_chunks()), "new run\n" * 10)
+        self.assertTrue(reader.restarted)
+
+    def test_incremental_reader_gz(self):
+        with gzip.open("vasp.out.gz", "wb") as f:
+            f.write(b"line 1\n" * 1000)
+        reader = IncrementalReader("vasp.out.gz", chunk_size=100)
+        self.assertEqual("".join(reader.read_chunks()), "line 1\n" * 1000)
+        self.assertEqual("".join(reader.read_chunks()), "")
+        self.assertFalse(reader.restarted)
+
+    def test_scan(self):
+        scanner = MessageScanner("vasp.out", {"brmix": ["BRMIX: very"],
+                                              "zpotrf": ["LAPACK: Routine "
+                                                         "ZPOTRF failed"]})
+        with open("vasp.out", "w") as f:
+            f.write("running\n")
+        self.assertEqual(scanner.scan(), set())
+        with open("vasp.out", "a") as f:
+            f.write("BRMIX: very serious problems\n")
+        self.assertEqual(scanner.scan(), {"brmix"})
+        with open("vasp.out", "a") as f:
+            f.write("LAPACK: Routine ZPOTRF failed\n")
+        self.assertEqual(scanner.scan(), {"brmix", "zpotrf"})
+        # A restarted job clears the errors of the previous run.
+        with open("vasp.out", "w") as f:
+            f.write("")
+        self.assertEqual(scanner.scan(), set())
+
+    def test_matcher(self):
+        matcher = MessageMatcher({
+            "tet": ["Tetrahedron method fails",
+                    "Routine TETIRR needs special values"],
+            "tetirr": ["Routine TETIRR needs special values"],
+            "zbrent": ["ZBRENT: fatal internal in",
+                       "ZBRENT: fatal error in bracketing"],
+            "brent": ["ZBRENT"]})
+        self.assertEqual(matcher.match("ok\nfine\n"), set())
+        self.assertEqual(
+            matcher.match("start\nRoutine TETIRR needs special values\n"),
+            {"tet", "tetirr"})
+        self.assertEqual(
+            matcher.match("ZBRENT: fatal error in bracketing"),
+            {"zbrent", "brent"})
+        self.assertEqual(MessageMatcher({}).match("anything"), set())
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+class ParseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.nparsed = 0
+
+    def parse(self, filename):
+        self.nparsed += 1
+        with open(filename) as f:
+            content = f.read()
+        if not content:
+            raise ValueError("Empty file")
+        return content
+
+    def test_get_parsed(self):
+        with open("INCAR", "w") as f:
+            f.write("ISPIN = 2\n")
+        # Without a cache, the file is parsed every time.
+        get_parsed("INCAR", self.parse)
+        get_parsed("INCAR", self.parse)
+        self.assertEqual(self.nparsed, 2)
+        with parse_cache() as cache:
+            self.assertEqual(get_parsed("INCAR", self.parse), "ISPIN = 2\n")
+            with parse_cache():
+                get_parsed("INCAR", self.parse)
+            self.assertEqual(self.nparsed, 3)
+            with open("INCAR", "w") as f:
+                f.write("ISPIN = 1\nNELM = 100\n")
+            self.assertEqual(get_parsed("INCAR", self.parse),
+                             "ISPIN = 1\nNELM = 100\n")
+            self.assertEqual(self.nparsed, 4)
+            cache.clear()
+            get_parsed("INCAR", self.parse)
+            self.assertEqual(self.nparsed, 5)
+            # Parsing errors are cached as well.
+            open("OUTCAR", "w").close()
+            for i in range(2):
+                self.assertRaises(ValueError, get_parsed, "OUTCAR",
+                                  self.parse)
+            self.assertEqual(self.nparsed, 6)
+            self.assertRaises(IOError, get_parsed, "OSZICAR", self.parse)
+        get_parsed("INCAR", self.parse)
+        self.assertEqual(self.nparsed, 8)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+class LineCount(object):
+
+    nparsed = 0
+
+    def __init__(self, filename):
+        LineCount.nparsed += 1
+        with open(filename) as f:
+            self.nlines = len(f.readlines())
+
+    def as_dict(self):
+        return {"nlines": self.nlines}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls.__new__(cls)
+        obj.nlines = d["nlines"]
+        return obj
+
+    @classmethod
+    def from_file(cls, filename):
+        return load_digest(filename, cls)
+
+
+class DigestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        LineCount.nparsed = 0
+
+    def test_write_and_load(self):
+        with open("OUTCAR", "w") as f:
+            f.write("line\n" * 10)
+        self.assertEqual(load_digest("OUTCAR", LineCount).nlines, 10)
+        self.assertFalse(os.path.exists("OUTCAR" + DIGEST_SUFFIX))
+        self.assertEqual(write_digest("OUTCAR", LineCount).nlines, 10)
+        self.assertTrue(os.path.exists("OUTCAR" + DIGEST_SUFFIX))
+        self.assertEqual(LineCount.nparsed, 2)
+
+        # Copies of the output keep their digest.
+        shutil.copy("OUTCAR", "OUTCAR.relax1")
+        shutil.copy("OUTCAR" + DIGEST_SUFFIX, "OUTCAR.relax1" + DIGEST_SUFFIX)
+        for f in ["OUTCAR", "OUTCAR.relax1"]:
+            self.assertEqual(load_digest(f, LineCount).nlines, 10)
+        self.assertEqual(LineCount.nparsed, 2)
+
+        # A rewritten output is parsed again.
+        with open("OUTCAR", "w") as f:
+            f.write("line\n" * 10 + "line\n")
+        self.assertEqual(load_digest("OUTCAR", LineCount).nlines, 11)
+        self.assertEqual(LineCount.nparsed, 3)
+
+        # A corrupted sidecar is ignored.
+        with open("OUTCAR.relax1" + DIGEST_SUFFIX, "w") as f:
+            f.write('{"size": 50, "hash"')
+        self.assertEqual(load_digest("OUTCAR.relax1", LineCount).nlines, 10)
+        self.assertEqual(LineCount.nparsed, 4)
+        self.assertRaises(IOError, load_digest, "OSZICAR", LineCount)
+
+    def test_rewritten_middle(self):
+        # The key covers all of the content, not only both ends.
+        lines = ["line\n"] * 700000
+        with open("OUTCAR", "w") as f:
+            f.write("".join(lines))
+        write_digest("OUTCAR", LineCount)
+        lines[350000] = "LINE\n"
+        with open("OUTCAR", "w") as f:
+            f.write("".join(lines))
+        load_digest("OUTCAR", LineCount)
+        self.assertEqual(LineCount.nparsed, 2)
+
+    def test_write_cached(self):
+        with open("OUTCAR", "w") as f:
+            f.write("line\n" * 10)
+        with parse_cache():
+            get_parsed("OUTCAR", LineCount.from_file)
+            self.assertEqual(write_digest("OUTCAR", LineCount).nlines, 10)
+        self.assertEqual(LineCount.nparsed, 1)
+        self.assertEqual(load_digest("OUTCAR", LineCount).nlines, 10)
+        self.assertEqual(LineCount.nparsed, 1)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
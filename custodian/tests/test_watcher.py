@@ -0,0 +1,66 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+from custodian.watcher import ProcessWatcher, StatFileWatcher, \
+    get_file_watcher
+
+
+class FileWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    @staticmethod
+    def _write_output():
+        with open("vasp.out", "a") as f:
+            f.write("hello\n")
+
+    def _check_watcher(self, watcher):
+        with watcher:
+            threading.Timer(0.2, self._write_output).start()
+            self.assertEqual(watcher.wait(10), {"vasp.out"})
+            # Drain any remaining events from the same write.
+            while watcher.wait(0.2):
+                pass
+            t = time.time()
+            self.assertEqual(watcher.wait(0.3), set())
+            self.assertGreaterEqual(time.time() - t, 0.25)
+            with open("OUTCAR", "w") as f:
+                f.write("not watched\n")
+            self.assertEqual(watcher.wait(0.3), set())
+
+    def test_stat_watcher(self):
+        self._check_watcher(StatFileWatcher(["vasp.out"], stat_interval=0.1))
+
+    def test_get_file_watcher(self):
+        self._check_watcher(get_file_watcher(["./vasp.out"]))
+
+    def test_process_exit(self):
+        for use_pidfd in (True, False):
+            p = subprocess.Popen("sleep 0.3", shell=True)
+            with ProcessWatcher(p, use_pidfd=use_pidfd) as pw, \
+                    get_file_watcher(["vasp.out"]) as fw:
+                t = time.time()
+                self.assertEqual(fw.wait(30, pw), set())
+                self.assertLess(time.time() - t, 10)
+                self.assertTrue(pw.wait(0))
+            self.assertEqual(p.returncode, 0)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,9 +15,21 @@ __email__ = "shyuep@gmail.com"
 __date__ = "1/12/14"
 
 from glob import glob
+import bz2
+import gzip
+import hashlib
+import json
 import logging
 import os
+import re
 import tarfile
+import threading
+from contextlib import contextmanager
+
+from custodian.backup import get_backup_store
+
+
+logger = logging.getLogger(__name__)
 
 
 def backup(filenames, prefix="error"):
@@ -25,12 +37,19 @@ def backup(filenames, prefix="error"):
     Backup files to a tar.gz file. Used, for example, in backing up the
     files of an errored run before performing corrections.
 
+    If a BackupStore is in use (see custodian.backup.use_backup_store), the
+    files are stored as a snapshot named prefix.N in it instead.
+
     Args:
         filenames ([str]): List of files to backup. Supports wildcards, e.g.,
             *.*.
         prefix (str): prefix to the files. Defaults to error, which means a
             series of error.1.tar.gz, error.2.tar.gz, ... will be generated.
     """
+    store = get_backup_store()
+    if store is not None:
+        store.backup(filenames, prefix=prefix)
+        return
     num = max([0] + [int(f.split(".")[1])
                      for f in glob("{}.*.tar.gz".format(prefix))])
     filename = "{}.{}.tar.gz".format(prefix, num + 1)
@@ -41,6 +60,440 @@ def backup(filenames, prefix="error"):
                 tar.add(f)
 
 
+class IncrementalReader(object):
+    """
+    Reads a growing text file, e.g., the stdout of a running job,
+    incrementally. The reader remembers the inode of the file and the byte
+    offset up to which it has been read, and each call to read_chunks only
+    returns the lines that have been appended since the previous call.
+
+    If the file has been replaced, truncated or rewritten since the last
+    read (which is what happens when a job is restarted), the reader starts
+    over from the beginning of the file and restarted is set to True so
+    that the caller can discard any state derived from the old content.
+    Such rewrites are detected by comparing the inode, the size and the
+    first and last bytes previously read.
+
+    Files compressed with gzip or bzip2 (as found by monty's zpath in the
+    outputs of compressed or restarted runs) are read decompressed, based
+    on their extension.
+    """
+
+    # Number of bytes at the beginning of the file and before the offset
+    # that are compared to detect rewrites.
+    FINGERPRINT_SIZE = 256
+
+    def __init__(self, filename, chunk_size=4194304):
+        """
+        Args:
+            filename (str): File to read.
+            chunk_size (int): Approximate size in bytes of the chunks that
+                are read at once. Defaults to 4 MB.
+        """
+        self.filename = filename
+        self.chunk_size = chunk_size
+        ext = filename.lower().rsplit(".", 1)[-1]
+        self._open = {"gz": gzip.open, "bz2": bz2.BZ2File}.get(ext, open)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the read position, i.e., the next read starts from the
+        beginning of the file.
+        """
+        self.offset = 0
+        self.restarted = True
+        self._inode = None
+        self._head = b""
+        self._tail = b""
+
+    def _is_same_file(self, f):
+        st = os.fstat(f.fileno())
+        if st.st_ino != self._inode:
+            return False
+        # The size of a compressed file is not comparable with the offset.
+        if st.st_size < self.offset and self._open is open:
+            return False
+        if self.offset == 0:
+            return True
+        f.seek(0)
+        if f.read(len(self._head)) != self._head:
+            return False
+        f.seek(self.offset - len(self._tail))
+        return f.read(len(self._tail)) == self._tail
+
+    def read_chunks(self):
+        """
+        Checks whether the file has been restarted (setting the restarted
+        attribute accordingly) and returns an iterator over the text appended
+        to the file since the last read. Every chunk consists of complete
+        lines, except possibly the last one if the file does not end with a
+        newline. Such a trailing partial line is returned, but will be
+        returned again (completed) on the next read.
+
+        Returns:
+            Iterator over chunks of text (str).
+        """
+        f = self._open(self.filename, "rb")
+        try:
+            self.restarted = not self._is_same_file(f)
+            if self.restarted:
+                self.reset()
+                self._inode = os.fstat(f.fileno()).st_ino
+        except Exception:
+            f.close()
+            raise
+        return self._iter_chunks(f)
+
+    def _iter_chunks(self, f):
+        with f:
+            f.seek(self.offset)
+            pending = b""
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                data = pending + data
+                i = data.rfind(b"\n") + 1
+                pending = data[i:]
+                if i:
+                    self._advance(data[:i])
+                    yield data[:i].decode("utf-8", "replace")
+            if pending:
+                yield pending.decode("utf-8", "replace")
+
+    def _advance(self, data):
+        if len(self._head) < self.FINGERPRINT_SIZE:
+            self._head = (self._head + data)[:self.FINGERPRINT_SIZE]
+        self._tail = (self._tail + data)[-self.FINGERPRINT_SIZE:]
+        self.offset += len(data)
+
+
+class MessageMatcher(object):
+    """
+    Finds which of a table of error messages occur in a text. All messages
+    are compiled once into a single regular expression, which is used to
+    locate the (rare) lines containing any of the messages in a single pass
+    over the text. Only those lines are then checked against the individual
+    messages, so that messages shared by several errors or contained in
+    other messages are all reported.
+    """
+
+    def __init__(self, error_msgs):
+        """
+        Args:
+            error_msgs (dict): Error messages to look for as a mapping of
+                error name to a list of messages, e.g., {"brmix": ["BRMIX:
+                very serious problems"]}. An error is detected if any of its
+                messages is found in a line of the text.
+        """
+        self.error_msgs = error_msgs
+        self._errors_by_msg = {}
+        for err, msgs in error_msgs.items():
+            for msg in msgs:
+                self._errors_by_msg.setdefault(msg, set()).add(err)
+        self._pattern = _compile_messages(self._errors_by_msg.keys())
+
+    def match(self, text):
+        """
+        Args:
+            text (str): Text to search, e.g., a chunk of an output file.
+
+        Returns:
+            (set) Names of the errors found in the text.
+        """
+        errors = set()
+        if self._pattern is None:
+            return errors
+        pos = 0
+        while True:
+            m = self._pattern.search(text, pos)
+            if m is None:
+                return errors
+            start = text.rfind("\n", 0, m.start()) + 1
+            end = text.find("\n", m.end())
+            if end == -1:
+                end = len(text)
+            line = text[start:end]
+            for msg, errs in self._errors_by_msg.items():
+                if msg in line:
+                    errors.update(errs)
+            pos = end + 1
+
+
+_message_patterns = {}
+
+
+def _compile_messages(msgs):
+    """
+    Compiles messages into a single regular expression. Compiled patterns
+    are cached, so that handlers with the same configuration share them.
+    """
+    key = tuple(sorted(m for m in msgs if m))
+    if not key:
+        return None
+    if key not in _message_patterns:
+        # Longest messages first so that the match is as specific as
+        # possible when one message contains another.
+        alternatives = sorted(key, key=len, reverse=True)
+        _message_patterns[key] = re.compile(
+            "|".join(re.escape(m) for m in alternatives))
+    return _message_patterns[key]
+
+
+class MessageScanner(object):
+    """
+    Incrementally scans a job output file for known error messages. Only
+    the content appended since the previous scan is processed, and the
+    errors found since the file was last (re)started are kept, so that the
+    result of each scan is identical to that of a full rescan of the file.
+    """
+
+    def __init__(self, filename, error_msgs):
+        """
+        Args:
+            filename (str): File to scan.
+            error_msgs (dict): Error messages to look for as a mapping of
+                error name to a list of messages, e.g., {"brmix": ["BRMIX:
+                very serious problems"]}. An error is detected if any of its
+                messages is found in a line of the file.
+        """
+        self.filename = filename
+        self.error_msgs = error_msgs
+        self.matcher = MessageMatcher(error_msgs)
+        self.reader = IncrementalReader(filename)
+        self.errors = set()
+
+    def scan(self):
+        """
+        Scans the file.
+
+        Returns:
+            (set) Names of the errors found in the current content of the
+            file.
+        """
+        chunks = self.reader.read_chunks()
+        if self.reader.restarted:
+            self.errors = set()
+        for chunk in chunks:
+            self.errors.update(self.matcher.match(chunk))
+        return set(self.errors)
+
+
+class ParsedFileCache(object):
+    """
+    Cache of parsed files, e.g., Incar, Outcar or Vasprun objects, so that
+    a file checked by several handlers is only parsed once. Entries are
+    keyed by the parser and by the path, inode, size and modification time
+    of the file, so a file that has changed is parsed again. Exceptions
+    raised by the parser are cached as well. The cache is thread-safe, and
+    concurrent requests for the same entry result in a single parse.
+
+    Parsed objects are shared by all callers and must not be modified.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename, parser):
+        """
+        Args:
+            filename (str): File to parse.
+            parser (callable): Function (or class) that takes the filename
+                as the only argument and returns the parsed object, e.g.,
+                Incar.from_file or Outcar.
+
+        Returns:
+            parser(filename), parsed at most once while the file is
+            unchanged.
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            # Let the parser raise the appropriate error.
+            return parser(filename)
+        key = (parser, os.path.abspath(filename), st.st_ino, st.st_size,
+               getattr(st, "st_mtime_ns", st.st_mtime))
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._entries:
+                try:
+                    self._entries[key] = (parser(filename), None)
+                except Exception as ex:
+                    self._entries[key] = (None, ex)
+            obj, ex = self._entries[key]
+        if ex is not None:
+            raise ex
+        return obj
+
+    def clear(self):
+        """
+        Removes all entries, e.g., after files have been modified by
+        corrections.
+        """
+        with self._lock:
+            self._entries = {}
+            self._locks = {}
+
+
+_parse_cache = None
+_parse_cache_depth = 0
+_parse_cache_lock = threading.Lock()
+
+
+@contextmanager
+def parse_cache():
+    """
+    Context manager which activates a ParsedFileCache for all calls to
+    get_parsed made inside it. This is used by Custodian to scope the cache
+    to a single check of the handlers (and validators). Nested uses share
+    the outermost cache.
+
+    Yields:
+        ParsedFileCache
+    """
+    global _parse_cache, _parse_cache_depth
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            _parse_cache = ParsedFileCache()
+        _parse_cache_depth += 1
+        cache = _parse_cache
+    try:
+        yield cache
+    finally:
+        with _parse_cache_lock:
+            _parse_cache_depth -= 1
+            if _parse_cache_depth == 0:
+                _parse_cache = None
+
+
+def get_parsed(filename, parser):
+    """
+    Returns the parsed content of a file. Within a parse_cache context,
+    the file is parsed at most once while it is unchanged. Otherwise, this
+    is the same as parser(filename). Handlers and validators should use this
+    in their check methods instead of calling parsers directly, e.g.,
+    get_parsed("INCAR", Incar.from_file), and must not modify the returned
+    object.
+
+    Args:
+        filename (str): File to parse.
+        parser (callable): Function (or class) that takes the filename as
+            the only argument and returns the parsed object.
+
+    Returns:
+        Parsed object.
+    """
+    cache = _parse_cache
+    if cache is None:
+        return parser(filename)
+    return cache.get(filename, parser)
+
+
+DIGEST_SUFFIX = ".digest.json"
+
+
+def get_content_key(filename, blocksize=1048576):
+    """
+    Returns a key identifying the content of a file: its size and the SHA1
+    hash of all of its content. Output files which are copied or moved keep
+    their key, while any change to the content gives a new one.
+
+    Args:
+        filename (str): File.
+        blocksize (int): Number of bytes read at a time. Defaults to 1 MiB.
+
+    Returns:
+        {"size": size, "hash": hash}
+    """
+    sha1 = hashlib.sha1()
+    size = 0
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            sha1.update(block)
+            size += len(block)
+    return {"size": size, "hash": sha1.hexdigest()}
+
+
+def _read_sidecar(filename, key):
+    try:
+        with open(filename + DIGEST_SUFFIX, "rt") as f:
+            sidecar = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if sidecar.get("size") != key["size"] or \
+            sidecar.get("hash") != key["hash"]:
+        return {}
+    return sidecar.get("digests", {})
+
+
+def write_digest(filename, cls):
+    """
+    Parses a finished output file into a digest and stores the digest in a
+    sidecar file (filename + DIGEST_SUFFIX) next to it, keyed by the content
+    key of the file, so that later consumers, in the same or in another
+    process, can get it with load_digest without parsing the file again.
+    A sidecar holds the digests of several classes for the same file.
+    Within a parse_cache context, the digest which the handlers and
+    validators have built (with get_parsed(filename, cls.from_file)) is
+    reused rather than parsed again.
+
+    Args:
+        filename (str): Output file.
+        cls: Digest class, i.e., a class whose constructor parses the file
+            given as its only argument and which implements as_dict and
+            from_dict, e.g., custodian.vasp.outputs.VasprunDigest.
+
+    Returns:
+        The digest, cls(filename).
+    """
+    key = get_content_key(filename)
+    digest = get_parsed(filename, getattr(cls, "from_file", cls))
+    digests = _read_sidecar(filename, key)
+    digests[cls.__name__] = digest.as_dict()
+    sidecar = dict(key)
+    sidecar["digests"] = digests
+    path = filename + DIGEST_SUFFIX
+    try:
+        with open(path + ".tmp", "wt") as f:
+            json.dump(sidecar, f)
+        os.rename(path + ".tmp", path)
+    except (IOError, OSError) as ex:
+        logger.warning("Cannot write digest of {}: {}".format(filename, ex))
+    return digest
+
+
+def load_digest(filename, cls):
+    """
+    Returns the digest of a file, read from its sidecar file if one has been
+    written by write_digest for the current content of the file, and parsed
+    with cls(filename) otherwise.
+
+    Args:
+        filename (str): Output file.
+        cls: Digest class (see write_digest).
+
+    Returns:
+        Digest.
+    """
+    try:
+        key = get_content_key(filename)
+    except (IOError, OSError):
+        # Let the parser raise the appropriate error.
+        return cls(filename)
+    d = _read_sidecar(filename, key).get(cls.__name__)
+    if d is not None:
+        try:
+            return cls.from_dict(d)
+        except (KeyError, TypeError, ValueError):
+            # E.g., a digest written by another version.
+            pass
+    return cls(filename)
+
+
 def get_execution_host_info():
     """
     Tries to return a tuple describing the execution host.
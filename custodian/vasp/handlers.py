@@ -11,6 +11,7 @@ import shutil
 from functools import reduce
 from collections import Counter
 import re
+import math
 
 import numpy as np
 
@@ -18,9 +19,13 @@ from monty.dev import deprecated
 from monty.serialization import loadfn
 
 from custodian.custodian import ErrorHandler
-from custodian.utils import backup
-from pymatgen.io.vasp import Poscar, VaspInput, Incar, Kpoints, Vasprun, \
-    Oszicar, Outcar
+from custodian.utils import backup, get_parsed, MessageScanner
+from custodian.vasp.outputs import get_outcar_stream, \
+    get_oszicar_stream, get_xdatcar_stream, VasprunDigest
+from custodian.vasp.trajectory import get_trajectory_store
+from custodian.vasp.inputs import LazyVaspInput, read_incar_tags, \
+    read_kpoints_tags
+from pymatgen.io.vasp import Poscar, Kpoints, Oszicar
 from pymatgen.transformations.standard_transformations import \
     SupercellTransformation
 
@@ -129,30 +134,29 @@ class VaspErrorHandler(ErrorHandler):
         self.natoms_large_cell = natoms_large_cell
         self.errors_subset_to_catch = errors_subset_to_catch or \
             list(VaspErrorHandler.error_msgs.keys())
+        self._scanner = MessageScanner(
+            output_filename,
+            {k: v for k, v in VaspErrorHandler.error_msgs.items()
+             if k in self.errors_subset_to_catch})
+
+    @property
+    def watched_files(self):
+        return ["INCAR", self.output_filename]
 
     def check(self):
-        incar = Incar.from_file("INCAR")
-        self.errors = set()
-        with open(self.output_filename, "r") as f:
-            for line in f:
-                l = line.strip()
-                for err, msgs in VaspErrorHandler.error_msgs.items():
-                    if err in self.errors_subset_to_catch:
-                        for msg in msgs:
-                            if l.find(msg) != -1:
-                                # this checks if we want to run a charged
-                                # computation (e.g., defects) if yes we don't
-                                # want to kill it because there is a change in
-                                # e-density (brmix error)
-                                if err == "brmix" and 'NELECT' in incar:
-                                    continue
-                                self.errors.add(err)
+        incar = read_incar_tags()
+        self.errors = self._scanner.scan()
+        # this checks if we want to run a charged computation (e.g., defects)
+        # if yes we don't want to kill it because there is a change in
+        # e-density (brmix error)
+        if 'NELECT' in incar:
+            self.errors.discard("brmix")
         return len(self.errors) > 0
 
     def correct(self):
         backup(VASP_BACKUP_FILES | {self.output_filename})
         actions = []
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
 
         if self.errors.intersection(["tet", "dentet"]):
             actions.append({"dict": "INCAR",
@@ -167,8 +171,8 @@ class VaspErrorHandler(ErrorHandler):
             # error count to 1 to skip first fix
             if self.error_count['brmix'] == 0:
                 try:
-                    assert (Outcar(zpath(os.path.join(
-                        os.getcwd(), "OUTCAR"))).is_stopped is False)
+                    assert (get_outcar_stream(
+                        zpath("OUTCAR")).is_stopped is False)
                 except:
                     self.error_count['brmix'] += 1
 
@@ -340,17 +344,12 @@ class VaspErrorHandler(ErrorHandler):
             if "NBANDS" in vi["INCAR"]:
                 nbands = int(vi["INCAR"]["NBANDS"])
             else:
-                with open("OUTCAR") as f:
-                    for line in f:
-                        if "NBANDS" in line:
-                            try:
-                                d = line.split("=")
-                                nbands = int(d[-1].strip())
-                                break
-                            except (IndexError, ValueError):
-                                pass
-            actions.append({"dict": "INCAR",
-                            "action": {"_set": {"NBANDS": int(1.1 * nbands)}}})
+                nbands = get_outcar_stream(zpath("OUTCAR")).nbands
+            # Nothing can be done if NBANDS cannot be determined.
+            if nbands is not None:
+                actions.append({"dict": "INCAR",
+                                "action": {"_set": {
+                                    "NBANDS": int(1.1 * nbands)}}})
 
         if "pssyevx" in self.errors:
             actions.append({"dict": "INCAR", "action":
@@ -435,26 +434,24 @@ class LrfCommutatorHandler(ErrorHandler):
         self.output_filename = output_filename
         self.errors = set()
         self.error_count = Counter()
+        self._scanner = MessageScanner(output_filename,
+                                       LrfCommutatorHandler.error_msgs)
+
+    @property
+    def watched_files(self):
+        return [self.output_filename]
 
     def check(self):
-        self.errors = set()
-        with open(self.output_filename, "r") as f:
-            for line in f:
-                l = line.strip()
-                for err, msgs in LrfCommutatorHandler.error_msgs.items():
-                    for msg in msgs:
-                        if l.find(msg) != -1:
-                            self.errors.add(err)
+        self.errors = self._scanner.scan()
         return len(self.errors) > 0
 
     def correct(self):
         backup(VASP_BACKUP_FILES | {self.output_filename})
         actions = []
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
 
         if "lrf_comm" in self.errors:
-            if Outcar(zpath(os.path.join(
-                    os.getcwd(), "OUTCAR"))).is_stopped is False:
+            if get_outcar_stream(zpath("OUTCAR")).is_stopped is False:
                 if not vi["INCAR"].get("LPEAD"):
                     actions.append({"dict": "INCAR",
                                     "action": {"_set": {"LPEAD": True}}})
@@ -491,22 +488,21 @@ class StdErrHandler(ErrorHandler):
         self.output_filename = output_filename
         self.errors = set()
         self.error_count = Counter()
+        self._scanner = MessageScanner(output_filename,
+                                       StdErrHandler.error_msgs)
+
+    @property
+    def watched_files(self):
+        return [self.output_filename]
 
     def check(self):
-        self.errors = set()
-        with open(self.output_filename, "r") as f:
-            for line in f:
-                l = line.strip()
-                for err, msgs in StdErrHandler.error_msgs.items():
-                    for msg in msgs:
-                        if l.find(msg) != -1:
-                            self.errors.add(err)
+        self.errors = self._scanner.scan()
         return len(self.errors) > 0
 
     def correct(self):
         backup(VASP_BACKUP_FILES | {self.output_filename})
         actions = []
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
 
         if "kpoints_trans" in self.errors:
             if self.error_count["kpoints_trans"] == 0:
@@ -555,29 +551,21 @@ class AliasingErrorHandler(ErrorHandler):
         """
         self.output_filename = output_filename
         self.errors = set()
+        self._scanner = MessageScanner(output_filename,
+                                       AliasingErrorHandler.error_msgs)
+
+    @property
+    def watched_files(self):
+        return [self.output_filename]
 
     def check(self):
-        incar = Incar.from_file("INCAR")
-        self.errors = set()
-        with open(self.output_filename, "r") as f:
-            for line in f:
-                l = line.strip()
-                for err, msgs in AliasingErrorHandler.error_msgs.items():
-                    for msg in msgs:
-                        if l.find(msg) != -1:
-                            # this checks if we want to run a charged
-                            # computation (e.g., defects) if yes we don't
-                            # want to kill it because there is a change in e-
-                            # density (brmix error)
-                            if err == "brmix" and 'NELECT' in incar:
-                                continue
-                            self.errors.add(err)
+        self.errors = self._scanner.scan()
         return len(self.errors) > 0
 
     def correct(self):
         backup(VASP_BACKUP_FILES | {self.output_filename})
         actions = []
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
 
         if "aliasing" in self.errors:
             with open("OUTCAR") as f:
@@ -636,9 +624,13 @@ class DriftErrorHandler(ErrorHandler):
         self.to_average = int(to_average)
         self.enaug_multiply = enaug_multiply
 
+    @property
+    def watched_files(self):
+        return ["INCAR", "OUTCAR"]
+
     def check(self):
 
-        incar = Incar.from_file("INCAR")
+        incar = read_incar_tags()
         if incar.get("EDIFFG", 0.1) >= 0 or incar.get("NSW", 0) == 0:
             # Only activate when force relaxing and ionic steps
             # NSW check prevents accidental effects when running DFPT
@@ -648,26 +640,26 @@ class DriftErrorHandler(ErrorHandler):
             self.max_drift = incar["EDIFFG"] * -1
 
         try:
-            outcar = Outcar("OUTCAR")
+            drift = get_trajectory_store("OUTCAR").get("drift")
         except:
             # Can't perform check if Outcar not valid
             return False
 
-        if len(outcar.data.get('drift', [])) < self.to_average:
+        if len(drift) < self.to_average:
             # Ensure enough steps to get average drift
             return False
         else:
-            curr_drift = outcar.data.get("drift", [])[::-1][:self.to_average]
-            curr_drift = np.average([np.linalg.norm(d) for d in curr_drift])
-            return curr_drift > self.max_drift
+            return self._get_drift(drift) > self.max_drift
+
+    def _get_drift(self, drift):
+        return np.average(np.linalg.norm(drift[-self.to_average:], axis=1))
 
     def correct(self):
         backup(VASP_BACKUP_FILES)
         actions = []
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
 
         incar = vi["INCAR"]
-        outcar = Outcar("OUTCAR")
 
         # Move CONTCAR to POSCAR
         actions.append({"file": "CONTCAR",
@@ -688,8 +680,8 @@ class DriftErrorHandler(ErrorHandler):
             actions.append({"dict": "INCAR",
                             "action": {"_set": {"ENAUG": int(incar.get("ENAUG", 1040) * self.enaug_multiply)}}})
 
-        curr_drift = outcar.data.get("drift", [])[::-1][:self.to_average]
-        curr_drift = np.average([np.linalg.norm(d) for d in curr_drift])
+        curr_drift = self._get_drift(
+            get_trajectory_store("OUTCAR").get("drift"))
         VaspModder(vi=vi).apply_actions(actions)
         return {"errors": "Excessive drift {} > {}".format(curr_drift, self.max_drift), "actions": actions}
 
@@ -702,6 +694,11 @@ class MeshSymmetryErrorHandler(ErrorHandler):
     """
     is_monitor = False
 
+    error_msgs = {
+        "mesh_symmetry": ["Reciprocal lattice and k-lattice belong to "
+                          "different class of lattices."]
+    }
+
     def __init__(self, output_filename="vasp.out",
                  output_vasprun="vasprun.xml"):
         """
@@ -717,36 +714,35 @@ class MeshSymmetryErrorHandler(ErrorHandler):
         """
         self.output_filename = output_filename
         self.output_vasprun = output_vasprun
+        self._scanner = MessageScanner(output_filename,
+                                       MeshSymmetryErrorHandler.error_msgs)
 
-    def check(self):
-        msg = "Reciprocal lattice and k-lattice belong to different class of" \
-              " lattices."
+    @property
+    def watched_files(self):
+        return ["INCAR", "KPOINTS", self.output_filename,
+                self.output_vasprun]
 
-        vi = VaspInput.from_directory('.')
+    def check(self):
+        incar = read_incar_tags()
+        kpoints = read_kpoints_tags()
         # According to VASP admins, you can disregard this error
         # if symmetry is off
         # Also disregard if automatic KPOINT generation is used
-        if (not vi["INCAR"].get('ISYM', True)) or \
-                vi[
-                "KPOINTS"].style == Kpoints.supported_modes.Automatic:
+        if (not incar.get('ISYM', True)) or \
+                kpoints["style"] == "Automatic":
             return False
 
         try:
-            v = Vasprun(self.output_vasprun)
+            v = get_parsed(self.output_vasprun, VasprunDigest.from_file)
             if v.converged:
                 return False
         except:
             pass
-        with open(self.output_filename, "r") as f:
-            for line in f:
-                l = line.strip()
-                if l.find(msg) != -1:
-                    return True
-        return False
+        return len(self._scanner.scan()) > 0
 
     def correct(self):
         backup(VASP_BACKUP_FILES | {self.output_filename})
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
         m = reduce(operator.mul, vi["KPOINTS"].kpts[0])
         m = max(int(round(m ** (1 / 3))), 1)
         if vi["KPOINTS"].style.name.lower().startswith("m"):
@@ -773,9 +769,13 @@ class UnconvergedErrorHandler(ErrorHandler):
         """
         self.output_filename = output_filename
 
+    @property
+    def watched_files(self):
+        return [self.output_filename]
+
     def check(self):
         try:
-            v = Vasprun(self.output_filename)
+            v = get_parsed(self.output_filename, VasprunDigest.from_file)
             if not v.converged:
                 return True
         except:
@@ -783,7 +783,7 @@ class UnconvergedErrorHandler(ErrorHandler):
         return False
 
     def correct(self):
-        v = Vasprun(self.output_filename)
+        v = get_parsed(self.output_filename, VasprunDigest.from_file)
         actions = []
         if not v.converged_electronic:
             # Ladder from VeryFast to Fast to Fast to All
@@ -821,7 +821,7 @@ class UnconvergedErrorHandler(ErrorHandler):
                             "action": {"_file_copy": {"dest": "POSCAR"}}})
 
         if actions:
-            vi = VaspInput.from_directory(".")
+            vi = LazyVaspInput()
             backup(VASP_BACKUP_FILES)
             VaspModder(vi=vi).apply_actions(actions)
             return {"errors": ["Unconverged"], "actions": actions}
@@ -851,11 +851,15 @@ class MaxForceErrorHandler(ErrorHandler):
         self.output_filename = output_filename
         self.max_force_threshold = max_force_threshold
 
+    @property
+    def watched_files(self):
+        return [self.output_filename]
+
     def check(self):
         try:
-            v = Vasprun(self.output_filename)
-            forces = np.array(v.ionic_steps[-1]['forces'])
-            sdyn = v.final_structure.site_properties.get('selective_dynamics')
+            v = get_parsed(self.output_filename, VasprunDigest.from_file)
+            forces = self._get_forces(v)
+            sdyn = v.selective_dynamics
             if sdyn:
                 forces[np.logical_not(sdyn)] = 0
             max_force = max(np.linalg.norm(forces, axis=1))
@@ -865,9 +869,20 @@ class MaxForceErrorHandler(ErrorHandler):
             pass
         return False
 
+    def _get_forces(self, v):
+        # Forces of the last ionic step, from the trajectory store if the
+        # OUTCAR next to the vasprun.xml is of the same run.
+        outcar = os.path.join(os.path.dirname(self.output_filename), "OUTCAR")
+        if os.path.exists(outcar):
+            forces = get_trajectory_store(outcar).get("forces")
+            if len(forces) == v.nionic_steps and \
+                    forces.shape[1:] == np.shape(v.forces):
+                return np.array(forces[-1])
+        return np.array(v.forces)
+
     def correct(self):
         backup(VASP_BACKUP_FILES | {self.output_filename})
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
         ediff = float(vi["INCAR"].get("EDIFF", 1e-4))
         ediffg = float(vi["INCAR"].get("EDIFFG", ediff * 10))
         actions = [{"file": "CONTCAR",
@@ -905,19 +920,35 @@ class PotimErrorHandler(ErrorHandler):
         self.output_filename = output_filename
         self.dE_threshold = dE_threshold
 
+    @property
+    def watched_files(self):
+        return [self.input_filename, self.output_filename]
+
     def check(self):
         try:
-            oszicar = Oszicar(self.output_filename)
-            n = len(Poscar.from_file(self.input_filename).structure)
-            max_dE = max([s['dE'] for s in oszicar.ionic_steps[1:]]) / n
-            if max_dE > self.dE_threshold:
+            max_dE = self._get_max_dE()
+            n = len(get_parsed(self.input_filename,
+                               Poscar.from_file).structure)
+            if max_dE is not None and max_dE / n > self.dE_threshold:
                 return True
         except:
             return False
 
+    def _get_max_dE(self):
+        # Largest energy change between ionic steps. The free energies of
+        # the trajectory store are used if there is an OUTCAR next to the
+        # OSZICAR, since they are the same as those of the OSZICAR.
+        outcar = os.path.join(os.path.dirname(self.output_filename), "OUTCAR")
+        if os.path.exists(outcar):
+            free_energies = get_trajectory_store(outcar).get("F")
+            if len(free_energies) < 2:
+                return None
+            return float(np.nanmax(np.diff(free_energies)))
+        return get_oszicar_stream(self.output_filename).max_dE
+
     def correct(self):
         backup(VASP_BACKUP_FILES)
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
         potim = float(vi["INCAR"].get("POTIM", 0.5))
         ibrion = int(vi["INCAR"].get("IBRION", 0))
         if potim < 0.2 and ibrion != 3:
@@ -959,6 +990,12 @@ class FrozenJobErrorHandler(ErrorHandler):
         self.output_filename = output_filename
         self.timeout = timeout
 
+    @property
+    def monitor_interval(self):
+        # A frozen job is detected timeout seconds after the last output at
+        # the earliest, so there is no point in checking much more often.
+        return self.timeout / 10
+
     def check(self):
         st = os.stat(self.output_filename)
         if time.time() - st.st_mtime > self.timeout:
@@ -967,7 +1004,7 @@ class FrozenJobErrorHandler(ErrorHandler):
     def correct(self):
         backup(VASP_BACKUP_FILES | {self.output_filename})
 
-        vi = VaspInput.from_directory('.')
+        vi = LazyVaspInput()
         actions = []
         if vi["INCAR"].get("ALGO", "Normal") == "Fast":
             actions.append({"dict": "INCAR",
@@ -1003,21 +1040,24 @@ class NonConvergingErrorHandler(ErrorHandler):
         self.output_filename = output_filename
         self.nionic_steps = nionic_steps
 
+    @property
+    def watched_files(self):
+        return ["INCAR", self.output_filename]
+
     def check(self):
-        vi = VaspInput.from_directory(".")
-        nelm = vi["INCAR"].get("NELM", 60)
+        incar = read_incar_tags()
+        nelm = incar.get("NELM", 60)
         try:
-            oszicar = Oszicar(self.output_filename)
-            esteps = oszicar.electronic_steps
+            esteps = get_oszicar_stream(self.output_filename).nelectronic
             if len(esteps) > self.nionic_steps:
-                return all([len(e) == nelm
-                            for e in esteps[-(self.nionic_steps + 1):-1]])
+                return all([n == nelm
+                            for n in esteps[-(self.nionic_steps + 1):-1]])
         except:
             pass
         return False
 
     def correct(self):
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
         algo = vi["INCAR"].get("ALGO", "Normal")
         amix = vi["INCAR"].get("AMIX", 0.4)
         bmix = vi["INCAR"].get("BMIX", 1.0)
@@ -1054,6 +1094,120 @@ class NonConvergingErrorHandler(ErrorHandler):
         else:
             return {"errors": ["Non-converging job"], "actions": None}
 
+
+class ElectronicTrendErrorHandler(NonConvergingErrorHandler):
+    """
+    Detects early that the electronic steps of the ionic step in progress
+    will not reach EDIFF before NELM, from the trend of log10|dE| of the
+    last electronic steps read from the OSZICAR, instead of waiting for
+    several ionic steps to hit NELM. The errors are corrected in the same
+    way as by NonConvergingErrorHandler, i.e., by going up the ALGO and
+    mixing ladder.
+
+    A straight line is fitted to log10|dE| versus the step number, ignoring
+    the initial non-selfconsistent steps (NELMDL). The error is detected if
+
+    1. the spread of log10|dE| around the line (the standard deviation of
+       the residuals) is at least max_spread decades, i.e., dE oscillates
+       strongly, or
+    2. with a probability of at least confidence, the value predicted at
+       NELM (with its prediction interval, in the normal approximation) is
+       still above log10(EDIFF), i.e., dE stagnates or decreases too
+       slowly.
+    """
+
+    is_monitor = True
+
+    def __init__(self, output_filename="OSZICAR", nsteps=10,
+                 confidence=0.99, max_spread=0.5):
+        """
+        Initializes the handler with the output file to check.
+
+        Args:
+            output_filename (str): This is the OSZICAR file. Change
+                this only if it is different from the default (unlikely).
+            nsteps (int): Number of electronic steps, counting from the
+                last one, used for the fit, at least 3. No error is
+                detected before this many selfconsistent steps of the ionic
+                step in progress. Defaults to 10.
+            confidence (float): Confidence required to detect a slow
+                trend. Defaults to 0.99.
+            max_spread (float): Spread of log10|dE| around the trend, in
+                decades, from which dE is considered to oscillate. Defaults
+                to 0.5.
+        """
+        if nsteps < 3:
+            # The spread of the residuals of a line needs 3 points.
+            raise ValueError("nsteps must be at least 3, got {}".format(
+                nsteps))
+        super(ElectronicTrendErrorHandler, self).__init__(
+            output_filename=output_filename)
+        self.nsteps = nsteps
+        self.confidence = confidence
+        self.max_spread = max_spread
+        self._wavecar = None
+
+    def setup(self):
+        # The default ISTART depends on the WAVECAR which the job starts
+        # from, not on the one which it writes.
+        self._wavecar = os.path.exists("WAVECAR")
+
+    @staticmethod
+    def _get_nelmdl(incar, nionic_steps, wavecar):
+        # Number of non-selfconsistent steps at the start of the ionic step
+        # in progress. Negative values of NELMDL (the default with
+        # ISTART = 0) only apply to the first ionic step.
+        istart = incar.get("ISTART", 1 if wavecar else 0)
+        default = 0
+        if istart == 0:
+            default = -12 if incar.get("ALGO", "Normal").lower() == \
+                "veryfast" else -5
+        nelmdl = incar.get("NELMDL", default)
+        if nelmdl < 0 and nionic_steps > 0:
+            return 0
+        return abs(nelmdl)
+
+    def check(self):
+        incar = read_incar_tags()
+        nelm = incar.get("NELM", 60)
+        ediff = incar.get("EDIFF", 1e-4)
+        try:
+            oszicar = get_oszicar_stream(self.output_filename)
+        except IOError:
+            return False
+        if len(oszicar.nelectronic) <= oszicar.nionic_steps:
+            # No ionic step in progress.
+            return False
+        de = np.abs(np.array(oszicar.electronic_dE))
+        n = len(de)
+        wavecar = self._wavecar
+        if wavecar is None:
+            # Not run by Custodian.
+            wavecar = os.path.exists("WAVECAR")
+        nelmdl = self._get_nelmdl(incar, oszicar.nionic_steps, wavecar)
+        if n - nelmdl < self.nsteps or n >= nelm or \
+                not np.all(de[-self.nsteps:] > 0):
+            return False
+        y = np.log10(de[-self.nsteps:])
+        x = np.arange(n - self.nsteps, n) + 1
+        if y[-1] < math.log10(ediff):
+            return False
+        slope, intercept = np.polyfit(x, y, 1)
+        residuals = y - (slope * x + intercept)
+        s = math.sqrt(np.sum(residuals ** 2) / (self.nsteps - 2))
+        if s >= self.max_spread:
+            # Oscillating.
+            return True
+        sxx = np.sum((x - x.mean()) ** 2)
+        sigma = s * math.sqrt(1 + 1 / self.nsteps +
+                              (nelm - x.mean()) ** 2 / sxx)
+        z = (slope * nelm + intercept - math.log10(ediff)) / max(sigma,
+                                                                 1e-12)
+        # Probability that log10|dE| at NELM is above log10(EDIFF).
+        p = 0.5 * (1 + math.erf(z / math.sqrt(2)))
+        return p >= self.confidence
+
+
 class WalltimeHandler(ErrorHandler):
     """
     Check if a run is nearing the walltime. If so, write a STOPCAR with
@@ -1123,23 +1277,35 @@ class WalltimeHandler(ErrorHandler):
         self.electronic_step_stop = electronic_step_stop
         self.electronic_steps_timings = [0]
         self.prev_check_time = self.start_time
+        self.time_per_step = 0
+
+    @property
+    def monitor_interval(self):
+        if not self.wall_time:
+            return None
+        run_time = datetime.datetime.now() - self.start_time
+        # Time until the STOPCAR has to be written according to the step
+        # timings of the last check.
+        time_left = self.wall_time - run_time.total_seconds() - \
+            max(self.time_per_step * 3, self.buffer_time)
+        # Halve the remaining time at every check, down to a minute towards
+        # the end of the allocation.
+        return min(max(time_left / 2, 60), 1800)
 
     def check(self):
         if self.wall_time:
             run_time = datetime.datetime.now() - self.start_time
             total_secs = run_time.total_seconds()
-            outcar = Outcar("OUTCAR")
+            outcar = get_outcar_stream("OUTCAR")
             if not self.electronic_step_stop:
                 # Determine max time per ionic step.
-                outcar.read_pattern({"timings": "LOOP\+.+real time(.+)"},
-                                    postprocess=float)
-                time_per_step = np.max(outcar.data.get('timings')) if outcar.data.get("timings", []) else 0
+                timings = outcar.ionic_timings
             else:
                 # Determine max time per electronic step.
-                outcar.read_pattern({"timings": "LOOP:.+real time(.+)"},
-                                    postprocess=float)
-                time_per_step = np.max(outcar.data.get('timings')) if outcar.data.get("timings", []) else 0
+                timings = outcar.electronic_timings
+            time_per_step = max(timings) if timings else 0
 
+            self.time_per_step = time_per_step
             # If the remaining time is less than average time for 3
             # steps or buffer_time.
             time_left = self.wall_time - total_secs
@@ -1198,6 +1364,12 @@ class CheckpointHandler(ErrorHandler):
         self.start_time = datetime.datetime.now()
         self.chk_counter = 0
 
+    @property
+    def monitor_interval(self):
+        # Run the check when the next checkpoint is due.
+        run_time = datetime.datetime.now() - self.start_time
+        return max(self.interval - run_time.total_seconds(), 0) + 1
+
     def check(self):
         run_time = datetime.datetime.now() - self.start_time
         total_secs = run_time.seconds + run_time.days * 3600 * 24
@@ -1289,10 +1461,14 @@ class PositiveEnergyErrorHandler(ErrorHandler):
         """
         self.output_filename = output_filename
 
+    @property
+    def watched_files(self):
+        return [self.output_filename]
+
     def check(self):
         try:
-            oszicar = Oszicar(self.output_filename)
-            if oszicar.final_energy > 0:
+            energy = get_oszicar_stream(self.output_filename).final_energy
+            if energy is not None and energy > 0:
                 return True
         except:
             pass
@@ -1300,7 +1476,7 @@ class PositiveEnergyErrorHandler(ErrorHandler):
 
     def correct(self):
         # change ALGO = Fast to Normal if ALGO is !Normal
-        vi = VaspInput.from_directory(".")
+        vi = LazyVaspInput()
         algo = vi["INCAR"].get("ALGO", "Normal")
         if algo.lower() not in ['normal', 'n']:
             backup(VASP_BACKUP_FILES)
@@ -1317,3 +1493,99 @@ class PositiveEnergyErrorHandler(ErrorHandler):
         # Unfixable error. Just return None for actions.
         else:
             return {"errors": ["Positive energy"], "actions": None}
+
+
+class AIMDErrorHandler(ErrorHandler):
+    """
+    Monitors ab initio MD runs (IBRION = 0) from the frames appended to the
+    XDATCAR and the temperatures in the OSZICAR, and stops the job as soon
+    as the trajectory becomes unphysical instead of letting it run to NSW.
+    The last nframes frames are checked for:
+
+    1. Temperature blow-up: the average temperature exceeds
+       max_temperature (by default, temperature_factor times the larger of
+       TEBEG and TEEND).
+    2. Non-finite coordinates: VASP writes the fractional coordinates
+       wrapped into the cell, so an exploding trajectory shows up as NaN or
+       overflowing ("*****") coordinates.
+    3. Atoms too close to each other: an interatomic distance is smaller
+       than min_distance. Distances are computed between the nearest
+       periodic images in fractional coordinates, which is exact for
+       orthogonal cells and never underestimates distances otherwise.
+
+    These errors cannot be fixed, and the job is terminated.
+    """
+
+    is_monitor = True
+
+    def __init__(self, xdatcar="XDATCAR", oszicar="OSZICAR", nframes=10,
+                 temperature_factor=3, max_temperature=None,
+                 min_distance=0.5):
+        """
+        Initializes the handler with the output files to check.
+
+        Args:
+            xdatcar (str): XDATCAR file. Defaults to "XDATCAR".
+            oszicar (str): OSZICAR file. Defaults to "OSZICAR".
+            nframes (int): Number of frames, counting from the last one,
+                checked at each check. Defaults to 10.
+            temperature_factor (float): Maximum average temperature, as a
+                multiple of the larger of TEBEG and TEEND. Defaults to 3.
+            max_temperature (float): Maximum average temperature in K.
+                Overrides temperature_factor if set.
+            min_distance (float): Minimum interatomic distance in Angstrom.
+                Defaults to 0.5.
+        """
+        self.xdatcar = xdatcar
+        self.oszicar = oszicar
+        self.nframes = nframes
+        self.temperature_factor = temperature_factor
+        self.max_temperature = max_temperature
+        self.min_distance = min_distance
+        self.errors = []
+
+    @property
+    def watched_files(self):
+        return ["INCAR", self.xdatcar, self.oszicar]
+
+    def check(self):
+        self.errors = []
+        incar = read_incar_tags()
+        if incar.get("IBRION") != 0:
+            return False
+
+        max_temperature = self.max_temperature
+        if max_temperature is None:
+            tebeg = incar.get("TEBEG", 0)
+            max_temperature = self.temperature_factor * \
+                max(tebeg, incar.get("TEEND", tebeg))
+        try:
+            t = np.array(get_oszicar_stream(self.oszicar).T[-self.nframes:])
+            t = t[~np.isnan(t)]
+            if max_temperature and len(t) and t.mean() > max_temperature:
+                self.errors.append("Temperature blow-up")
+        except IOError:
+            pass
+
+        try:
+            xdatcar = get_xdatcar_stream(self.xdatcar)
+        except IOError:
+            return len(self.errors) > 0
+        frac_coords = xdatcar.get_frac_coords(self.nframes)
+        lattices = xdatcar.get_lattices(self.nframes)
+        if not np.all(np.isfinite(frac_coords)):
+            self.errors.append("Non-finite coordinates")
+        elif xdatcar.natoms > 1:
+            for f, lattice in zip(frac_coords, lattices):
+                diff = f[:, None, :] - f[None, :, :]
+                diff -= np.round(diff)
+                d = np.linalg.norm(np.dot(diff, lattice), axis=-1)
+                np.fill_diagonal(d, np.inf)
+                if d.min() < self.min_distance:
+                    self.errors.append("Atoms too close")
+                    break
+        return len(self.errors) > 0
+
+    def correct(self):
+        # Unfixable errors. Just return None for actions.
+        return {"errors": self.errors, "actions": None}
@@ -0,0 +1,268 @@
+# coding: utf-8
+
+"""
+This module implements lazy access to the VASP input files of a run
+directory. Most corrections only read and modify the INCAR, so parsing the
+POSCAR, KPOINTS and especially the POTCAR (as VaspInput.from_directory
+does) is wasted work.
+
+It also implements a slim reader of INCAR and KPOINTS tags for the checks
+of the handlers, which only need a few values and are run at every
+monitoring cycle. The pymatgen objects are only built by the corrections,
+which need to write the files.
+"""
+
+from __future__ import unicode_literals, division
+
+import os
+import re
+import threading
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+
+from monty.os.path import zpath
+from pymatgen.io.vasp import Incar, Kpoints, Poscar, Potcar
+
+from custodian.watcher import get_file_signature
+
+
+class LazyVaspInput(MutableMapping):
+    """
+    Drop-in replacement for the VaspInput of a directory, as used by the
+    handlers, jobs and VaspModder. Each input file is parsed the first time
+    it is accessed, and write_input only writes the entries that have been
+    set since.
+    """
+
+    parsers = {"INCAR": Incar.from_file, "KPOINTS": Kpoints.from_file,
+               "POSCAR": Poscar.from_file, "POTCAR": Potcar.from_file}
+
+    def __init__(self, directory="."):
+        """
+        Args:
+            directory (str): Directory with the input files. Defaults to the
+                current directory.
+        """
+        self.directory = directory
+        self.modified = set()
+        self._data = {}
+
+    def _path(self, key):
+        return zpath(os.path.join(self.directory, key))
+
+    def __getitem__(self, key):
+        if key not in self._data:
+            if key not in self.parsers:
+                raise KeyError(key)
+            self._data[key] = self.parsers[key](self._path(key))
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self.modified.add(key)
+
+    def __delitem__(self, key):
+        del self._data[key]
+        self.modified.discard(key)
+
+    def __contains__(self, key):
+        return key in self._data or (key in self.parsers and
+                                     os.path.exists(self._path(key)))
+
+    def __iter__(self):
+        for key in sorted(set(self.parsers) | set(self._data)):
+            if key in self:
+                yield key
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def is_loaded(self, key):
+        """
+        Returns:
+            Whether the entry has been parsed (or set) already.
+        """
+        return key in self._data
+
+    def write_input(self, output_dir=None):
+        """
+        Writes the modified entries.
+
+        Args:
+            output_dir (str): Directory to write to. Defaults to the
+                directory of the input.
+        """
+        output_dir = self.directory if output_dir is None else output_dir
+        for key in sorted(self.modified):
+            self._data[key].write_file(os.path.join(output_dir, key))
+        self.modified = set()
+
+
+class InputTags(Mapping):
+    """
+    Read-only mapping of the tags of an input file, as returned by
+    read_incar_tags and read_kpoints_tags. Lists of values are stored as
+    tuples.
+    """
+
+    __slots__ = ["_data"]
+
+    def __init__(self, data):
+        self._data = dict(data)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "InputTags({!r})".format(self._data)
+
+
+_bool_pattern = re.compile(r"^\.?(T|F|TRUE|FALSE)\.?$", re.IGNORECASE)
+_int_pattern = re.compile(r"^[-+]?\d+$")
+_repeat_pattern = re.compile(r"^(\d+)\*(.+)$")
+
+
+def _proc_scalar(val):
+    if _int_pattern.match(val):
+        return int(val)
+    try:
+        return float(val)
+    except ValueError:
+        pass
+    m = _bool_pattern.match(val)
+    if m:
+        return m.group(1).upper().startswith("T")
+    raise ValueError(val)
+
+
+def _proc_val(val):
+    """
+    Converts an INCAR value, following the generic conversions of
+    pymatgen's Incar.proc_val: integers, floats, booleans, lists of these
+    (with n*value repetitions) and otherwise capitalized strings.
+    """
+    toks = val.split()
+    try:
+        if len(toks) == 1 and not _repeat_pattern.match(toks[0]):
+            return _proc_scalar(toks[0])
+        values = []
+        for t in toks:
+            m = _repeat_pattern.match(t)
+            if m:
+                values.extend([_proc_scalar(m.group(2))] * int(m.group(1)))
+            else:
+                values.append(_proc_scalar(t))
+        return tuple(values)
+    except ValueError:
+        return val.capitalize()
+
+
+def parse_incar_tags(filename):
+    """
+    Parses the tags of an INCAR, without pymatgen.
+
+    Args:
+        filename (str): INCAR.
+
+    Returns:
+        InputTags, with upper case tags.
+    """
+    tags = {}
+    with open(filename, "rt") as f:
+        content = re.sub(r"\\\s*\n", " ", f.read())
+    for l in content.splitlines():
+        l = l.split("#", 1)[0].split("!", 1)[0]
+        for item in l.split(";"):
+            key, sep, val = item.partition("=")
+            key, val = key.strip().upper(), val.strip().strip('"').strip()
+            if sep and key and val:
+                tags[key] = val if key == "SYSTEM" else _proc_val(val)
+    return InputTags(tags)
+
+
+def parse_kpoints_tags(filename):
+    """
+    Parses the header of a KPOINTS, without pymatgen.
+
+    Args:
+        filename (str): KPOINTS.
+
+    Returns:
+        InputTags with the comment, the number of kpoints ("num_kpts") and
+        the style, given as the name of the corresponding member of
+        Kpoints.supported_modes (e.g., "Gamma").
+    """
+    with open(filename, "rt") as f:
+        lines = [f.readline().strip() for i in range(3)]
+    num_kpts = int(lines[1].split()[0])
+    style = lines[2].lower()[:1]
+    if style == "a":
+        name = "Automatic"
+    elif style == "g":
+        name = "Gamma"
+    elif style == "m":
+        name = "Monkhorst"
+    elif style == "l" and num_kpts > 0:
+        name = "Line_mode"
+    elif style and style in "ck":
+        name = "Cartesian"
+    else:
+        name = "Reciprocal"
+    return InputTags({"comment": lines[0], "num_kpts": num_kpts,
+                      "style": name})
+
+
+_tags_cache = {}
+_tags_cache_lock = threading.Lock()
+
+
+def _read_tags(filename, parser):
+    path = os.path.abspath(filename)
+    sig = get_file_signature(path)
+    with _tags_cache_lock:
+        entry = _tags_cache.get((parser, path))
+    if sig is None or entry is None or entry[0] != sig:
+        tags = parser(path)
+        with _tags_cache_lock:
+            _tags_cache[(parser, path)] = (sig, tags)
+        return tags
+    return entry[1]
+
+
+def read_incar_tags(filename="INCAR"):
+    """
+    Returns the tags of an INCAR, which are only parsed again if the file
+    has changed. Handlers should use this in their check methods, and only
+    build the pymatgen Incar (e.g., through LazyVaspInput) to correct the
+    file.
+
+    Args:
+        filename (str): INCAR. Defaults to "INCAR".
+
+    Returns:
+        InputTags
+    """
+    return _read_tags(filename, parse_incar_tags)
+
+
+def read_kpoints_tags(filename="KPOINTS"):
+    """
+    Returns the header of a KPOINTS (see parse_kpoints_tags), which is only
+    parsed again if the file has changed.
+
+    Args:
+        filename (str): KPOINTS. Defaults to "KPOINTS".
+
+    Returns:
+        InputTags
+    """
+    return _read_tags(filename, parse_kpoints_tags)
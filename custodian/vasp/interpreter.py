@@ -4,7 +4,7 @@ from __future__ import unicode_literals
 
 from custodian.ansible.actions import FileActions, DictActions
 from custodian.ansible.interpreter import Modder
-from pymatgen.io.vasp import VaspInput
+from custodian.vasp.inputs import LazyVaspInput
 
 
 class VaspModder(Modder):
@@ -20,11 +20,12 @@ class VaspModder(Modder):
                 mode, unsupported actions are simply ignored without any
                 errors raised. In strict mode, if an unsupported action is
                 supplied, a ValueError is raised. Defaults to True.
-            vi (VaspInput): A VaspInput object from the current directory.
-                Initialized automatically if not passed (but passing it will
+            vi (VaspInput): A VaspInput (or LazyVaspInput) object from the
+                current directory. Defaults to a LazyVaspInput, which only
+                parses the files that the actions modify (passing it will
                 avoid having to reparse the directory).
         """
-        self.vi = vi or VaspInput.from_directory('.')
+        self.vi = vi if vi is not None else LazyVaspInput()
         actions = actions or [FileActions, DictActions]
         super(VaspModder, self).__init__(actions, strict)
 
@@ -5,20 +5,26 @@ import subprocess
 import os
 import shutil
 import math
+import fnmatch
 import logging
 
 import numpy as np
 
 from pymatgen import Structure
-from pymatgen.io.vasp import VaspInput, Incar, Poscar, Outcar, Kpoints, Vasprun
+from pymatgen.io.vasp import Incar, Poscar, Kpoints
 from monty.os.path import which
 from monty.shutil import decompress_dir
 from monty.serialization import dumpfn, loadfn
 
+from custodian.backup import copy_file
 from custodian.custodian import Job
-from custodian.utils import backup
+from custodian.utils import backup, write_digest, DIGEST_SUFFIX
+from custodian.vasp.inputs import LazyVaspInput
 from custodian.vasp.interpreter import VaspModder
 from custodian.vasp.handlers import VASP_BACKUP_FILES
+from custodian.vasp.trajectory import get_trajectory_store
+from custodian.vasp.outputs import VasprunDigest, OutcarDigest, \
+    clear_streams
 
 """
 This module implements basic kinds of jobs for VASP runs.
@@ -52,6 +58,13 @@ VASP_NEB_OUTPUT_SUB_FILES = ['CHG', 'CHGCAR', 'CONTCAR', 'DOSCAR',
                              'WAVECAR', 'XDATCAR']
 
 
+def _skip_archived(filenames, patterns):
+    # Filters out the files whose names match a skip_archive pattern.
+    return [f for f in filenames
+            if not any([fnmatch.fnmatch(os.path.basename(f), p)
+                        for p in patterns])]
+
+
 class VaspJob(Job):
     """
     A basic vasp job. Just runs whatever is in the directory. But conceivably
@@ -62,7 +75,8 @@ class VaspJob(Job):
                  stderr_file="std_err.txt", suffix="", final=True,
                  backup=True, auto_npar=False, auto_gamma=True,
                  settings_override=None, gamma_vasp_cmd=None,
-                 copy_magmom=False, auto_continue=False):
+                 copy_magmom=False, auto_continue=False, link="reflink",
+                 skip_archive=None, write_digests=False, trajectory=True):
         """
         This constructor is necessarily complex due to the need for
         flexibility. For standard kinds of runs, it's often better to use one
@@ -114,6 +128,27 @@ class VaspJob(Job):
                 if a STOPCAR is present. This is very useful if using the
                 wall-time handler which will write a read-only STOPCAR to
                 prevent VASP from deleting it once it finishes
+            link (str): How the outputs are copied with the suffix if final
+                is False (see custodian.backup.copy_file). "reflink" (the
+                default) clones them where the filesystem supports it, and
+                copies them otherwise. None always copies. Hardlinks are not
+                supported, since the outputs are rewritten in place, e.g.,
+                the INCAR by copy_magmom and the OUTCAR by the next job.
+            skip_archive ([str]): Shell-style wildcards of the outputs which
+                are not copied with the suffix if final is False, e.g.,
+                ["WAVECAR", "CHG"] to avoid keeping bulky files which are
+                of no use after the next job. Defaults to None, i.e., all
+                outputs are copied.
+            write_digests (bool): Whether to write the digests of the
+                vasprun.xml and OUTCAR in sidecar files (see
+                custodian.utils.write_digest) in postprocess, so that later
+                consumers, e.g., in another process, do not have to parse
+                them again. The digests which the handlers and validators
+                have already built are reused. Defaults to False.
+            trajectory (bool): Whether the trajectory store of the run (see
+                custodian.vasp.trajectory) is kept up to date from the
+                OUTCAR while the job runs, so that handlers and other tools
+                read the ionic steps as arrays. Defaults to True.
         """
         self.vasp_cmd = vasp_cmd
         self.output_file = output_file
@@ -127,12 +162,20 @@ class VaspJob(Job):
         self.gamma_vasp_cmd = gamma_vasp_cmd
         self.copy_magmom = copy_magmom
         self.auto_continue = auto_continue
+        if link not in ("reflink", None):
+            raise ValueError("Unsupported link {}".format(link))
+        self.link = link
+        self.skip_archive = skip_archive
+        self.write_digests = write_digests
+        self.trajectory = trajectory
 
     def setup(self):
         """
         Performs initial setup for VaspJob, including overriding any settings
         and backing up.
         """
+        # Forget the outputs of the previous jobs.
+        clear_streams()
         decompress_dir('.')
 
         if self.backup:
@@ -197,7 +240,7 @@ class VaspJob(Job):
         """
         cmd = list(self.vasp_cmd)
         if self.auto_gamma:
-            vi = VaspInput.from_directory(".")
+            vi = LazyVaspInput()
             kpts = vi["KPOINTS"]
             if kpts.style == Kpoints.supported_modes.Gamma \
                     and tuple(kpts.kpts[0]) == (1, 1, 1):
@@ -213,22 +256,44 @@ class VaspJob(Job):
             p = subprocess.Popen(cmd, stdout=f_std, stderr=f_err)
         return p
 
+    def update(self):
+        """
+        Appends the ionic steps written to the OUTCAR since the last update
+        to the trajectory store, if trajectory is True.
+        """
+        if self.trajectory and os.path.exists("OUTCAR"):
+            get_trajectory_store("OUTCAR")
+
     def postprocess(self):
         """
-        Postprocessing includes renaming and gzipping where necessary.
-        Also copies the magmom to the incar if necessary
+        Postprocessing includes writing the digests of the vasprun.xml and
+        OUTCAR if write_digests is True, renaming and gzipping where
+        necessary. Also copies the magmom to the incar if necessary
         """
-        for f in VASP_OUTPUT_FILES + [self.output_file]:
-            if os.path.exists(f):
-                if self.final and self.suffix != "":
-                    shutil.move(f, "{}{}".format(f, self.suffix))
-                elif self.suffix != "":
-                    shutil.copy(f, "{}{}".format(f, self.suffix))
+        for f, cls in [("vasprun.xml", VasprunDigest),
+                       ("OUTCAR", OutcarDigest)]:
+            if self.write_digests and os.path.exists(f):
+                try:
+                    write_digest(f, cls)
+                except Exception as ex:
+                    logger.warning("Cannot write digest of {}: {}".format(
+                        f, ex))
+
+        for f in self._get_archived(VASP_OUTPUT_FILES + [self.output_file]):
+            # The digests go along with the outputs.
+            for g in [f, f + DIGEST_SUFFIX]:
+                if os.path.exists(g):
+                    if self.final:
+                        shutil.move(g, "{}{}".format(f, self.suffix) +
+                                    g[len(f):])
+                    else:
+                        copy_file(g, "{}{}".format(f, self.suffix) +
+                                  g[len(f):], self.link)
 
         if self.copy_magmom and not self.final:
             try:
-                outcar = Outcar("OUTCAR")
-                magmom = [m['tot'] for m in outcar.magnetization]
+                outcar = OutcarDigest.from_file("OUTCAR")
+                magmom = [m['tot'] for m in outcar.site_magnetization]
                 incar = Incar.from_file("INCAR")
                 incar['MAGMOM'] = magmom
                 incar.write_file("INCAR")
@@ -240,6 +305,23 @@ class VaspJob(Job):
         if os.path.exists("continue.json"):
             os.remove("continue.json")
 
+    @property
+    def finalized_outputs(self):
+        """
+        The outputs renamed with the suffix by postprocess. Their digests
+        are left as they are, so that they can be read without the outputs.
+        """
+        return ["{}{}".format(f, self.suffix) for f in
+                self._get_archived(VASP_OUTPUT_FILES + [self.output_file])]
+
+    def _get_archived(self, filenames):
+        # Outputs which postprocess renames or copies with the suffix.
+        if self.suffix == "":
+            return []
+        if self.final or not self.skip_archive:
+            return filenames
+        return _skip_archived(filenames, self.skip_archive)
+
     @classmethod
     def double_relaxation_run(cls, vasp_cmd, auto_npar=True, ediffg=-0.05,
                               half_kpts_first_relax=False, auto_continue=False):
@@ -486,7 +568,7 @@ class VaspJob(Job):
                 backup = True
             else:
                 backup = False
-                v = Vasprun("vasprun.xml")
+                v = VasprunDigest.from_file("vasprun.xml")
                 structure = v.final_structure
                 energy = v.final_energy
                 lattice = structure.lattice
@@ -609,7 +691,8 @@ class VaspNEBJob(Job):
                  output_file="neb_vasp.out", stderr_file="neb_std_err.txt",
                  suffix="", final=True, backup=True, auto_npar=True,
                  half_kpts=False, auto_gamma=True, auto_continue=False,
-                 gamma_vasp_cmd=None, settings_override=None):
+                 gamma_vasp_cmd=None, settings_override=None,
+                 link="reflink", skip_archive=None):
         """
         This constructor is a simplified version of VaspJob, which satisfies
         the need for flexibility. For standard kinds of runs, it's often
@@ -660,6 +743,11 @@ class VaspNEBJob(Job):
                     [{"dict": "INCAR", "action": {"_set": {"ISTART": 1}}},
                      {"file": "CONTCAR",
                       "action": {"_file_copy": {"dest": "POSCAR"}}}]
+            link (str): How the outputs are copied with the suffix if final
+                is False. See VaspJob.
+            skip_archive ([str]): Shell-style wildcards of the outputs
+                (including those of the image directories) which are not
+                copied with the suffix if final is False. See VaspJob.
         """
 
         self.vasp_cmd = vasp_cmd
@@ -674,6 +762,10 @@ class VaspNEBJob(Job):
         self.gamma_vasp_cmd = gamma_vasp_cmd
         self.auto_continue = auto_continue
         self.settings_override = settings_override
+        if link not in ("reflink", None):
+            raise ValueError("Unsupported link {}".format(link))
+        self.link = link
+        self.skip_archive = skip_archive
         self.neb_dirs = []  # 00, 01, etc.
         self.neb_sub = []  # 01, 02, etc.
 
@@ -688,6 +780,8 @@ class VaspNEBJob(Job):
         Performs initial setup for VaspNEBJob, including overriding any settings
         and backing up.
         """
+        # Forget the outputs of the previous jobs.
+        clear_streams()
         neb_dirs = self.neb_dirs
 
         if self.backup:
@@ -772,23 +866,31 @@ class VaspNEBJob(Job):
         """
         Postprocessing includes renaming and gzipping where necessary.
         """
-        # Add suffix to all sub_dir/{items}
-        for path in self.neb_dirs:
-            for f in VASP_NEB_OUTPUT_SUB_FILES:
-                f = os.path.join(path, f)
-                if os.path.exists(f):
-                    if self.final and self.suffix != "":
-                        shutil.move(f, "{}{}".format(f, self.suffix))
-                    elif self.suffix != "":
-                        shutil.copy(f, "{}{}".format(f, self.suffix))
-
-        # Add suffix to all output files
-        for f in VASP_NEB_OUTPUT_FILES + [self.output_file]:
+        # Add suffix to all sub_dir/{items} and output files
+        for f in self._get_archived():
             if os.path.exists(f):
-                if self.final and self.suffix != "":
+                if self.final:
                     shutil.move(f, "{}{}".format(f, self.suffix))
-                elif self.suffix != "":
-                    shutil.copy(f, "{}{}".format(f, self.suffix))
+                else:
+                    copy_file(f, "{}{}".format(f, self.suffix), self.link)
+
+    @property
+    def finalized_outputs(self):
+        """
+        The outputs renamed with the suffix by postprocess.
+        """
+        return ["{}{}".format(f, self.suffix) for f in self._get_archived()]
+
+    def _get_archived(self):
+        # Outputs which postprocess renames or copies with the suffix.
+        if self.suffix == "":
+            return []
+        files = [os.path.join(path, f) for path in self.neb_dirs
+                 for f in VASP_NEB_OUTPUT_SUB_FILES]
+        files += VASP_NEB_OUTPUT_FILES + [self.output_file]
+        if self.final or not self.skip_archive:
+            return files
+        return _skip_archived(files, self.skip_archive)
 
 
 class GenerateVaspInputJob(Job):
@@ -0,0 +1,945 @@
+# coding: utf-8
+
+"""
+This module implements incremental readers of VASP output files. Unlike the
+pymatgen parsers, which read the whole file every time, these readers resume
+from where they stopped at the previous read and keep a rolling state of the
+quantities needed by the error handlers and validators, so that checking a
+multi-GB output file while the job is running only costs reading what has
+been appended to it. XdatcarStream likewise keeps the last frames of MD
+runs in a bounded buffer. VasprunDigest similarly extracts the few quantities
+needed from a vasprun.xml in constant memory, and ChgcarSlabReader reads
+volumetric data files one plane at a time. The digests of finished outputs
+(VasprunDigest and OutcarDigest) can be stored in sidecar files, so that
+they are parsed only once.
+"""
+
+from __future__ import unicode_literals, division
+
+import os
+import re
+import math
+import threading
+from array import array
+from collections import deque
+
+import numpy as np
+from monty.io import zopen
+from pymatgen.core.structure import Structure
+
+from custodian.utils import IncrementalReader, load_digest
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+
+class OutcarStream(object):
+    """
+    Incremental reader of an OUTCAR. Each call to update reads the lines
+    appended since the previous call and updates the following attributes.
+    If the OUTCAR has been rewritten (e.g., because the job was restarted),
+    the state is reset and the file is read from the beginning.
+
+    .. attribute:: ionic_timings
+
+        Real times in seconds of the ionic steps (LOOP+ lines).
+
+    .. attribute:: electronic_timings
+
+        Real times in seconds of the electronic steps (LOOP: lines).
+
+    .. attribute:: drift
+
+        Total drift vectors [x, y, z], one per ionic step.
+
+    .. attribute:: magnetization
+
+        Total magnetization after each electronic step.
+
+    .. attribute:: nbands
+
+        Number of bands (NBANDS), or None if not found yet.
+
+    .. attribute:: mdalgo
+
+        Values of all MDALGO tags found, as strings.
+
+    .. attribute:: is_stopped
+
+        Whether the job has been stopped by a STOPCAR.
+
+    .. attribute:: site_magnetization
+
+        Magnetization of each site in the last "magnetization (x)" table, as
+        a list of dicts (e.g., {"s": ..., "p": ..., "d": ..., "tot": ...})
+        like Outcar.magnetization. For noncollinear runs, the values are
+        [x, y, z] lists.
+    """
+
+    patterns = {
+        "LOOP+": re.compile(r"LOOP\+.+real time(.+)"),
+        "LOOP:": re.compile(r"LOOP:.+real time(.+)"),
+        "total drift:": re.compile(
+            r"total drift:\s+([\.\-\d]+)\s+([\.\-\d]+)\s+([\.\-\d]+)"),
+        "NBANDS=": re.compile(r"number\s+of\s+bands\s+NBANDS=\s+(\d+)"),
+        "MDALGO": re.compile(r"MDALGO\s+=\s+([\d]+)"),
+        "magnetization": re.compile(
+            r"number of electron\s+\S+\s+magnetization\s+(\S+)"),
+    }
+
+    def __init__(self, filename="OUTCAR"):
+        """
+        Args:
+            filename (str): OUTCAR to read. Defaults to "OUTCAR".
+        """
+        self.filename = filename
+        self.reader = IncrementalReader(filename)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the state. The next update reads the file from the beginning.
+        """
+        self.reader.reset()
+        self._clear()
+
+    def _clear(self):
+        self.ionic_timings = []
+        self.electronic_timings = []
+        self.drift = []
+        self.magnetization = []
+        self.nbands = None
+        self.mdalgo = []
+        self.is_stopped = False
+        self.site_magnetization = []
+        self._mag_tables = {}
+        self._mag_table = None
+        self._mag_header = []
+
+    def update(self):
+        """
+        Reads the lines appended to the OUTCAR since the last update.
+
+        Returns:
+            self, for convenience.
+        """
+        with self._lock:
+            chunks = self.reader.read_chunks()
+            if self.reader.restarted:
+                self._clear()
+            for chunk in chunks:
+                for l in chunk.splitlines(True):
+                    # A partial last line is returned again, completed, by
+                    # the next read.
+                    if l.endswith("\n"):
+                        self._parse_line(l)
+        return self
+
+    def _parse_magnetization(self, l):
+        clean = l.strip()
+        if clean in ("magnetization (x)", "magnetization (y)",
+                     "magnetization (z)"):
+            self._mag_table = clean[-2]
+            if self._mag_table == "x":
+                self._mag_tables = {}
+            self._mag_tables[self._mag_table] = []
+        elif self._mag_table is None:
+            return
+        elif clean.startswith("# of ion"):
+            self._mag_header = clean.split()[3:]
+        elif clean.startswith("tot") or "electrostatic" in clean:
+            tables = self._mag_tables
+            if self._mag_table == "x" or ("y" in tables and "z" in tables):
+                if "y" in tables and "z" in tables:
+                    self.site_magnetization = [
+                        {k: [x[k], y[k], z[k]] for k in x}
+                        for x, y, z in zip(tables["x"], tables["y"],
+                                           tables["z"])]
+                else:
+                    self.site_magnetization = tables["x"]
+            self._mag_table = None
+        elif clean and clean[0].isdigit():
+            try:
+                values = [float(x) for x in clean.split()[1:]]
+            except ValueError:
+                return
+            self._mag_tables[self._mag_table].append(
+                dict(zip(self._mag_header, values)))
+
+    def _parse_line(self, l):
+        if "soft stop encountered!  aborting job" in l:
+            self.is_stopped = True
+        if self._mag_table is not None or "magnetization (" in l:
+            self._parse_magnetization(l)
+        for key, patt in self.patterns.items():
+            if key not in l:
+                continue
+            m = patt.search(l)
+            if m is None:
+                continue
+            if key == "LOOP+":
+                self.ionic_timings.append(float(m.group(1)))
+            elif key == "LOOP:":
+                self.electronic_timings.append(float(m.group(1)))
+            elif key == "total drift:":
+                self.drift.append([float(x) for x in m.groups()])
+            elif key == "NBANDS=":
+                if self.nbands is None:
+                    self.nbands = int(m.group(1))
+            elif key == "MDALGO":
+                self.mdalgo.append(m.group(1))
+            elif key == "magnetization":
+                self.magnetization.append(float(m.group(1)))
+
+
+class OszicarStream(object):
+    """
+    Incremental reader of an OSZICAR. Each call to update reads the lines
+    appended since the previous call. The ionic steps are stored in compact
+    arrays, with one item per ionic step, so that the memory used and the
+    cost of the checks stay small for MD runs with many thousands of steps.
+    As for OutcarStream, the state is reset if the OSZICAR is rewritten.
+
+    .. attribute:: E0, dE, F, T
+
+        Arrays of the energies E0, energy changes dE, free energies F and,
+        for MD runs, temperatures T of the ionic steps. Values missing from
+        an ionic step line are nan.
+
+    .. attribute:: nelectronic
+
+        Array of the numbers of electronic steps of the ionic steps,
+        including the ionic step in progress, i.e., with the same meaning as
+        [len(e) for e in Oszicar.electronic_steps].
+
+    .. attribute:: electronic_dE
+
+        Array of the energy changes dE of the electronic steps of the last
+        ionic step (the one in progress, if any).
+
+    .. attribute:: max_dE
+
+        Maximum dE of the ionic steps after the first one, or None if there
+        is at most one ionic step.
+    """
+
+    electronic_pattern = re.compile(r"\s*\w+\s*:(.*)")
+    header_pattern = re.compile(r"^\s*N\s+E")
+    ionic_pattern = re.compile(r"(\w+)=\s*(\S+)")
+    exponent_pattern = re.compile(r"(?<=\d)([+-]\d+)$")
+
+    def __init__(self, filename="OSZICAR"):
+        """
+        Args:
+            filename (str): OSZICAR to read. Defaults to "OSZICAR".
+        """
+        self.filename = filename
+        self.reader = IncrementalReader(filename)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the state. The next update reads the file from the beginning.
+        """
+        self.reader.reset()
+        self._clear()
+
+    def _clear(self):
+        self.E0 = array("d")
+        self.dE = array("d")
+        self.F = array("d")
+        self.T = array("d")
+        self.nelectronic = array("i")
+        self.electronic_dE = array("d")
+        self.max_dE = None
+
+    @property
+    def nionic_steps(self):
+        """
+        Number of completed ionic steps.
+        """
+        return len(self.E0)
+
+    @property
+    def final_energy(self):
+        """
+        E0 of the last completed ionic step, or None if there is none.
+        """
+        return self.E0[-1] if self.E0 else None
+
+    def update(self):
+        """
+        Reads the lines appended to the OSZICAR since the last update.
+
+        Returns:
+            self, for convenience.
+        """
+        with self._lock:
+            chunks = self.reader.read_chunks()
+            if self.reader.restarted:
+                self._clear()
+            for chunk in chunks:
+                for l in chunk.splitlines(True):
+                    if l.endswith("\n"):
+                        self._parse_line(l.strip())
+        return self
+
+    def _float(self, s):
+        try:
+            return float(self.exponent_pattern.sub(r"E\1", s))
+        except ValueError:
+            return float("nan")
+
+    def _parse_line(self, l):
+        if not l:
+            return
+        m = self.electronic_pattern.match(l)
+        if m:
+            toks = m.group(1).split()
+            if (toks and toks[0] == "1") or not self.nelectronic:
+                self.nelectronic.append(1)
+                self.electronic_dE = array("d")
+            else:
+                self.nelectronic[-1] += 1
+            self.electronic_dE.append(
+                self._float(toks[2]) if len(toks) > 2 else float("nan"))
+        elif not self.header_pattern.match(l):
+            step = dict(self.ionic_pattern.findall(
+                re.sub(r"d E ", "dE", l)))
+            if "F" not in step and "E0" not in step:
+                # Not an ionic step, e.g., a comment. Ignored, as by
+                # pymatgen's Oszicar.
+                return
+            values = [self._float(step[k]) if k in step else float("nan")
+                      for k in ["E0", "dE", "F", "T"]]
+            if self.E0 and not math.isnan(values[1]):
+                if self.max_dE is None or values[1] > self.max_dE:
+                    self.max_dE = values[1]
+            for a, v in zip([self.E0, self.dE, self.F, self.T], values):
+                a.append(v)
+
+
+class XdatcarStream(object):
+    """
+    Incremental reader of an XDATCAR (in the VASP 5 format), for monitoring
+    MD runs without waiting for the vasprun.xml. Only the last max_frames
+    frames are kept, as arrays of fractional coordinates and lattices, so
+    that the memory used does not grow with the length of the run. Headers
+    repeated before the frames of variable cell runs update the lattice. As
+    for the other streams, the state is reset if the XDATCAR is rewritten.
+
+    .. attribute:: species
+
+        Symbols of the species, as given in the header.
+
+    .. attribute:: natoms
+
+        Number of atoms, or 0 if the header has not been read yet.
+
+    .. attribute:: nframes
+
+        Number of complete frames read, including those no longer kept.
+    """
+
+    def __init__(self, filename="XDATCAR", max_frames=100):
+        """
+        Args:
+            filename (str): XDATCAR to read. Defaults to "XDATCAR".
+            max_frames (int): Number of frames kept, counting from the last
+                one. Defaults to 100.
+        """
+        self.filename = filename
+        self.max_frames = max_frames
+        self.reader = IncrementalReader(filename)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the state. The next update reads the file from the beginning.
+        """
+        self.reader.reset()
+        self._clear()
+
+    def _clear(self):
+        self.species = []
+        self.natoms = 0
+        self.nframes = 0
+        self._frac_coords = deque(maxlen=self.max_frames)
+        self._lattices = deque(maxlen=self.max_frames)
+        self._lattice = None
+        self._header = []
+        self._frame = None
+
+    def update(self):
+        """
+        Reads the lines appended to the XDATCAR since the last update.
+
+        Returns:
+            self, for convenience.
+        """
+        with self._lock:
+            chunks = self.reader.read_chunks()
+            if self.reader.restarted:
+                self._clear()
+            for chunk in chunks:
+                for l in chunk.splitlines(True):
+                    if l.endswith("\n"):
+                        self._parse_line(l.strip())
+        return self
+
+    @staticmethod
+    def _floats(l):
+        values = []
+        for t in l.split()[:3]:
+            try:
+                values.append(float(t))
+            except ValueError:
+                # E.g., overflowing values written as "*****".
+                values.append(float("nan"))
+        return values + [float("nan")] * (3 - len(values))
+
+    def _parse_header(self, lines):
+        scale = float(lines[1].split()[0])
+        lattice = np.array([[float(x) for x in l.split()[:3]]
+                            for l in lines[2:5]])
+        if scale < 0:
+            # A negative scale is the volume of the cell.
+            scale = (-scale / abs(np.linalg.det(lattice))) ** (1 / 3)
+        self._lattice = lattice * scale
+        self.species = lines[5].split()
+        self.natoms = sum([int(n) for n in lines[6].split()])
+
+    def _parse_line(self, l):
+        if self._frame is not None:
+            self._frame.extend(self._floats(l))
+            if len(self._frame) == 3 * self.natoms:
+                self._frac_coords.append(
+                    np.array(self._frame).reshape((self.natoms, 3)))
+                self._lattices.append(self._lattice)
+                self.nframes += 1
+                self._frame = None
+        elif "configuration" in l.lower():
+            if len(self._header) >= 7:
+                self._parse_header(self._header[-7:])
+            self._header = []
+            if self.natoms and self._lattice is not None:
+                self._frame = []
+        else:
+            self._header.append(l)
+
+    def get_frac_coords(self, nframes=None):
+        """
+        Args:
+            nframes (int): Number of frames to return, counting from the
+                last one. Defaults to all the frames kept.
+
+        Returns:
+            Array of the fractional coordinates of the frames, with shape
+            (nframes, natoms, 3).
+        """
+        with self._lock:
+            return self._get_last(self._frac_coords, nframes,
+                                  (self.natoms, 3))
+
+    @staticmethod
+    def _get_last(frames, nframes, shape):
+        n = len(frames) if nframes is None else min(nframes, len(frames))
+        if n == 0:
+            return np.zeros((0,) + shape)
+        return np.array(list(frames)[len(frames) - n:])
+
+    def get_lattices(self, nframes=None):
+        """
+        Args:
+            nframes (int): Number of frames to return, counting from the
+                last one. Defaults to all the frames kept.
+
+        Returns:
+            Array of the lattice matrices of the frames, with shape
+            (nframes, 3, 3).
+        """
+        with self._lock:
+            return self._get_last(self._lattices, nframes, (3, 3))
+
+
+class VasprunDigest(object):
+    """
+    Digest of a vasprun.xml with only the quantities needed by the handlers
+    and validators, i.e., the INCAR and parameters, the number of ionic
+    steps, the electronic steps of the last ionic step, the last forces, the
+    final selective dynamics and the final energy. The file is read with
+    iterparse and every element is discarded as soon as it has been read,
+    so that the memory used does not depend on the size of the file (e.g.,
+    of long MD runs or of runs with a large DOS).
+
+    Parsing fails with an exception if the file is not well-formed XML,
+    e.g., because the run has been killed while writing it.
+
+    .. attribute:: incar
+
+        Dict of the INCAR tags in the vasprun.xml.
+
+    .. attribute:: parameters
+
+        Dict of all the parameters used by VASP.
+
+    .. attribute:: nionic_steps
+
+        Number of ionic steps, i.e., of calculation elements.
+
+    .. attribute:: nelectronic_steps
+
+        Number of electronic steps of the last ionic step.
+
+    .. attribute:: forces
+
+        Forces of the last ionic step, or None if there are none.
+
+    .. attribute:: selective_dynamics
+
+        Selective dynamics flags of the final structure, or None if there
+        are none.
+
+    .. attribute:: final_energy
+
+        Final energy (e_0_energy) of the last ionic step, or inf if there
+        is none, as for Vasprun.final_energy.
+
+    .. attribute:: species, lattice, frac_coords
+
+        Species of the sites, and lattice vectors and fractional coordinates
+        of the final structure (see final_structure).
+
+    Digests are stored in sidecar files next to finished vasprun.xml files
+    (see custodian.utils.write_digest) and from_file loads them from there
+    when possible.
+    """
+
+    _energy_keys = {"e_wo_entrp", "e_fr_energy", "e_0_energy"}
+
+    def __init__(self, filename="vasprun.xml"):
+        """
+        Args:
+            filename (str): vasprun.xml to read, which may be compressed.
+                Defaults to "vasprun.xml".
+        """
+        self.filename = filename
+        self.incar = {}
+        self.parameters = {}
+        self.nionic_steps = 0
+        self.nelectronic_steps = 0
+        self.forces = None
+        self.selective_dynamics = None
+        self.final_energy = float("inf")
+        self.species = []
+        self.lattice = None
+        self.frac_coords = None
+        # Whether the energies of each electronic step of the last ionic
+        # step are the three energies only, which is needed to check the
+        # convergence of LEPSILON runs.
+        self._short_steps = []
+        with zopen(filename, "rb") as f:
+            self._parse(f)
+
+    @staticmethod
+    def _parse_value(elem):
+        val_type = elem.get("type")
+        text = elem.text or ""
+        if elem.tag == "v":
+            return [VasprunDigest._convert(val_type, t)
+                    for t in text.split()]
+        return VasprunDigest._convert(val_type, text.strip())
+
+    @staticmethod
+    def _convert(val_type, text):
+        if val_type == "logical":
+            return text == "T"
+        elif val_type == "int":
+            return int(text)
+        elif val_type == "string":
+            return text
+        try:
+            return float(text)
+        except ValueError:
+            return float("nan")
+
+    def _parse(self, f):
+        path = []
+        root = None
+        step = {}
+        calc = {}
+        structure = None
+        array_name = None
+        for event, elem in ElementTree.iterparse(f, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if root is None:
+                    root = elem
+                path.append(tag)
+                if tag == "calculation":
+                    calc = {"nsteps": 0, "short_steps": [], "forces": None}
+                elif tag == "scstep":
+                    step = {}
+                elif tag == "structure":
+                    # Other structures, e.g., the primitive cell, are not
+                    # part of the trajectory.
+                    structure = {} if elem.get("name") in \
+                        (None, "initialpos", "finalpos") else None
+                elif tag == "array":
+                    array_name = elem.get("name")
+                continue
+            path.pop()
+            name = elem.get("name")
+            parent = path[-1] if path else None
+            if tag in ("i", "v") and name is not None:
+                if parent == "incar":
+                    self.incar[name] = self._parse_value(elem)
+                elif "parameters" in path:
+                    self.parameters[name] = self._parse_value(elem)
+                elif parent == "energy" and "calculation" in path:
+                    value = self._convert(None, (elem.text or "").strip())
+                    if "scstep" in path:
+                        step[name] = value
+                    else:
+                        calc[name] = value
+            elif tag == "scstep":
+                calc["nsteps"] += 1
+                calc["short_steps"].append(set(step) == self._energy_keys)
+                calc["last_step"] = step
+            elif tag == "varray" and name == "forces" and \
+                    parent == "calculation":
+                calc["forces"] = [[float(x) for x in v.text.split()]
+                                  for v in elem]
+            elif tag == "varray" and structure is not None and \
+                    name in ("basis", "positions", "selective"):
+                structure[name] = [[x == "T" for x in v.text.split()]
+                                   if name == "selective" else
+                                   [float(x) for x in v.text.split()]
+                                   for v in elem]
+            elif tag == "structure" and structure is not None:
+                self.lattice = structure.get("basis")
+                self.frac_coords = structure.get("positions")
+                self.selective_dynamics = structure.get("selective")
+                structure = None
+            elif tag == "rc" and array_name == "atoms" and \
+                    "atominfo" in path:
+                symbol = elem[0].text.strip()
+                # VASP truncates the symbols of Xe and Zr.
+                self.species.append({"X": "Xe", "r": "Zr"}.get(symbol,
+                                                               symbol))
+            elif tag == "calculation":
+                self._end_calculation(calc)
+            if parent not in ("varray", "rc"):
+                # The rows of an array are read with the array.
+                elem.clear()
+            if len(path) == 1:
+                # Also drops the cleared children of the root element.
+                root.clear()
+
+    def _end_calculation(self, calc):
+        self.nionic_steps += 1
+        self.nelectronic_steps = calc["nsteps"]
+        self._short_steps = calc["short_steps"]
+        self.forces = calc["forces"]
+        try:
+            energy = calc["e_0_energy"]
+            # Same correction of a bug in vasprun.xml as in
+            # Vasprun.final_energy.
+            step = calc["last_step"]
+            fixed = round(step["e_0_energy"] - step["e_fr_energy"] +
+                          calc["e_fr_energy"], 8)
+            self.final_energy = fixed if abs(energy - fixed) > 1e-7 \
+                else energy
+        except KeyError:
+            self.final_energy = calc.get("e_0_energy", float("inf"))
+
+    @classmethod
+    def from_file(cls, filename="vasprun.xml"):
+        """
+        Returns the digest of a vasprun.xml, loaded from its sidecar file if
+        there is an up to date one.
+
+        Args:
+            filename (str): vasprun.xml. Defaults to "vasprun.xml".
+
+        Returns:
+            VasprunDigest
+        """
+        return load_digest(filename, cls)
+
+    def as_dict(self):
+        d = dict(self.__dict__)
+        d["@module"] = self.__class__.__module__
+        d["@class"] = self.__class__.__name__
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        digest = cls.__new__(cls)
+        digest.__dict__.update({k: v for k, v in d.items()
+                                if not k.startswith("@")})
+        for k in ["filename", "incar", "parameters", "nionic_steps",
+                  "final_energy", "species", "frac_coords"]:
+            if k not in digest.__dict__:
+                raise KeyError(k)
+        return digest
+
+    @property
+    def final_structure(self):
+        """
+        Final structure, with the selective dynamics as a site property if
+        there are any, or None if the file has no structure.
+        """
+        if self.lattice is None or self.frac_coords is None:
+            return None
+        props = None
+        if self.selective_dynamics is not None:
+            props = {"selective_dynamics": self.selective_dynamics}
+        return Structure(self.lattice, self.species, self.frac_coords,
+                         site_properties=props)
+
+    @property
+    def converged_electronic(self):
+        """
+        Whether the electronic steps of the last ionic step have converged,
+        with the same meaning as Vasprun.converged_electronic.
+        """
+        if self.incar.get("ML_LMLFF"):
+            return True
+        nelm = self.parameters.get("NELM", 60)
+        if self.incar.get("LEPSILON"):
+            i = 1
+            while i < len(self._short_steps) and self._short_steps[i]:
+                i += 1
+            return i + 1 != nelm
+        if self.incar.get("ALGO", "") == "Exact" and \
+                self.incar.get("NELM") == 1:
+            return True
+        return self.nelectronic_steps < nelm
+
+    @property
+    def converged_ionic(self):
+        """
+        Whether the ionic steps have converged, with the same meaning as
+        Vasprun.converged_ionic.
+        """
+        nsw = self.parameters.get("NSW", 0)
+        ibrion = self.parameters.get("IBRION", -1 if nsw in (-1, 0) else 0)
+        if ibrion == 0:
+            return nsw <= 1 or self.nionic_steps == nsw
+        if ibrion in (1, 2) and self.parameters.get("EDIFFG", 1) == 0:
+            return nsw <= 1 or self.nionic_steps == nsw
+        return nsw <= 1 or self.nionic_steps < nsw
+
+    @property
+    def converged(self):
+        """
+        Whether the run has converged both electronically and ionically.
+        """
+        return self.converged_electronic and self.converged_ionic
+
+
+class OutcarDigest(object):
+    """
+    Digest of a finished OUTCAR, i.e., the final state of an OutcarStream
+    that has read the whole file. Like VasprunDigest, it is stored in a
+    sidecar file next to finished OUTCARs and from_file loads it from there
+    when possible.
+
+    .. attribute:: site_magnetization
+
+        Magnetization of each site (see OutcarStream.site_magnetization).
+
+    .. attribute:: magnetization
+
+        Last total magnetization, or None.
+
+    .. attribute:: drift
+
+        Last total drift, or None.
+
+    .. attribute:: nbands
+
+        Number of bands, or None.
+
+    .. attribute:: nionic_steps
+
+        Number of completed ionic steps.
+
+    .. attribute:: is_stopped
+
+        Whether the job has been stopped by a STOPCAR.
+    """
+
+    def __init__(self, filename="OUTCAR"):
+        """
+        Args:
+            filename (str): OUTCAR to read. Defaults to "OUTCAR".
+        """
+        stream = OutcarStream(filename).update()
+        self.filename = filename
+        self.site_magnetization = stream.site_magnetization
+        self.magnetization = stream.magnetization[-1] \
+            if stream.magnetization else None
+        self.drift = stream.drift[-1] if stream.drift else None
+        self.nbands = stream.nbands
+        self.nionic_steps = len(stream.ionic_timings)
+        self.is_stopped = stream.is_stopped
+
+    @classmethod
+    def from_file(cls, filename="OUTCAR"):
+        """
+        Returns the digest of an OUTCAR, loaded from its sidecar file if
+        there is an up to date one.
+
+        Args:
+            filename (str): OUTCAR. Defaults to "OUTCAR".
+
+        Returns:
+            OutcarDigest
+        """
+        return load_digest(filename, cls)
+
+    def as_dict(self):
+        d = dict(self.__dict__)
+        d["@module"] = self.__class__.__module__
+        d["@class"] = self.__class__.__name__
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        digest = cls.__new__(cls)
+        digest.__dict__.update({k: v for k, v in d.items()
+                                if not k.startswith("@")})
+        for k in ["filename", "site_magnetization", "nionic_steps"]:
+            if k not in digest.__dict__:
+                raise KeyError(k)
+        return digest
+
+
+class ChgcarSlabReader(object):
+    """
+    Reader of the volumetric data of a CHGCAR-like file (CHGCAR, AECCAR0,
+    AECCAR2, ...) one plane at a time. The data are stored in the file with
+    the x index varying fastest, so that the planes of constant z can be
+    read sequentially and the memory used is that of a single plane instead
+    of the whole grid. Only the first data set (the total density) is read.
+
+    .. attribute:: dims
+
+        Dimensions (nx, ny, nz) of the grid.
+    """
+
+    def __init__(self, filename):
+        """
+        Args:
+            filename (str): File to read, which may be compressed.
+        """
+        self.filename = filename
+        with zopen(filename, "rt") as f:
+            self.dims = self._read_header(f)
+
+    @staticmethod
+    def _read_header(f):
+        # The structure ends with a blank line, followed by the dimensions.
+        for line in f:
+            if not line.strip():
+                break
+        return tuple(int(i) for i in next(f).split())
+
+    def __iter__(self):
+        """
+        Yields the planes z = 0, ..., nz - 1 as (nx, ny) arrays, with the
+        same values as Chgcar.data["total"][:, :, z].
+        """
+        nx, ny, nz = self.dims
+        n = nx * ny
+        with zopen(self.filename, "rt") as f:
+            self._read_header(f)
+            tokens = []
+            for z in range(nz):
+                while len(tokens) < n:
+                    tokens.extend(next(f).split())
+                plane = np.array(tokens[:n], dtype=float)
+                del tokens[:n]
+                yield plane.reshape((nx, ny), order="F")
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def _get_stream(cls, filename):
+    path = os.path.abspath(filename)
+    with _streams_lock:
+        if (cls, path) not in _streams:
+            _streams[(cls, path)] = cls(path)
+        stream = _streams[(cls, path)]
+    return stream.update()
+
+
+def clear_streams():
+    """
+    Discards all the shared streams, e.g., when a job starts, so that the
+    state read from the outputs of previous jobs does not accumulate in
+    the process.
+    """
+    with _streams_lock:
+        _streams.clear()
+
+
+def get_outcar_stream(filename="OUTCAR"):
+    """
+    Returns the up to date OutcarStream of an OUTCAR. The streams are shared
+    by all handlers and validators in the process, so that the OUTCAR is
+    read only once no matter how many of them need it.
+
+    Args:
+        filename (str): OUTCAR. Defaults to "OUTCAR".
+
+    Returns:
+        OutcarStream
+
+    Raises:
+        IOError if the OUTCAR does not exist.
+    """
+    return _get_stream(OutcarStream, filename)
+
+
+def get_oszicar_stream(filename="OSZICAR"):
+    """
+    Returns the up to date OszicarStream of an OSZICAR, shared in the same
+    way as the streams returned by get_outcar_stream.
+
+    Args:
+        filename (str): OSZICAR. Defaults to "OSZICAR".
+
+    Returns:
+        OszicarStream
+
+    Raises:
+        IOError if the OSZICAR does not exist.
+    """
+    return _get_stream(OszicarStream, filename)
+
+
+def get_xdatcar_stream(filename="XDATCAR"):
+    """
+    Returns the up to date XdatcarStream of an XDATCAR, shared in the same
+    way as the streams returned by get_outcar_stream.
+
+    Args:
+        filename (str): XDATCAR. Defaults to "XDATCAR".
+
+    Returns:
+        XdatcarStream
+
+    Raises:
+        IOError if the XDATCAR does not exist.
+    """
+    return _get_stream(XdatcarStream, filename)
@@ -19,14 +19,16 @@ import os
 import glob
 import shutil
 import datetime
+import tempfile
 import numpy as np
 
 from custodian.vasp.handlers import VaspErrorHandler, \
     UnconvergedErrorHandler, MeshSymmetryErrorHandler, WalltimeHandler, \
     MaxForceErrorHandler, PositiveEnergyErrorHandler, PotimErrorHandler, \
     FrozenJobErrorHandler, AliasingErrorHandler, StdErrHandler, LrfCommutatorHandler, \
-    DriftErrorHandler
+    DriftErrorHandler, AIMDErrorHandler, ElectronicTrendErrorHandler
 from pymatgen.io.vasp import Incar, Poscar, Structure, Kpoints, VaspInput, Vasprun
+from custodian.vasp.outputs import VasprunDigest
 
 
 test_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..",
@@ -521,6 +523,22 @@ class MaxForceErrorHandlerTest(unittest.TestCase):
         handler = MaxForceErrorHandler(output_filename, max_force_threshold=0.5)
         self.assertFalse(handler.check())
 
+    def test_trajectory_forces(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shutil.copytree(os.path.join(test_dir, "postprocess"),
+                            os.path.join(tmpdir, "run"))
+            os.chdir(os.path.join(tmpdir, "run"))
+            h = MaxForceErrorHandler()
+            v = VasprunDigest.from_file("vasprun.xml")
+            # The forces come from the trajectory store of the OUTCAR.
+            np.testing.assert_allclose(h._get_forces(v), v.forces,
+                                       atol=1e-5)
+            self.assertTrue(os.path.exists("custodian_trajectory"))
+        finally:
+            os.chdir(test_dir)
+            shutil.rmtree(tmpdir)
+
     def tearDown(self):
         os.chdir(cwd)
 
@@ -543,6 +561,15 @@ class WalltimeHandlerTest(unittest.TestCase):
         self.assertEqual(os.environ.get("CUSTODIAN_WALLTIME_START"),
                          new_starttime.strftime("%a %b %d %H:%M:%S UTC %Y"))
 
+    def test_monitor_interval(self):
+        h = WalltimeHandler(wall_time=36000, buffer_time=120)
+        self.assertEqual(h.monitor_interval, 1800)
+        h.start_time = datetime.datetime.now() - datetime.timedelta(minutes=580)
+        self.assertAlmostEqual(h.monitor_interval, 540, delta=1)
+        h.start_time = datetime.datetime.now() - datetime.timedelta(minutes=598)
+        self.assertEqual(h.monitor_interval, 60)
+        self.assertIsNone(WalltimeHandler().monitor_interval)
+
     def test_check_and_correct(self):
         # Try a 1 hr wall time with a 2 min buffer
         h = WalltimeHandler(wall_time=3600, buffer_time=120)
@@ -633,6 +660,10 @@ class PotimHandlerTest(unittest.TestCase):
 
         h = PotimErrorHandler()
         self.assertTrue(h.check())
+        # The energies come from the trajectory store of the OUTCAR.
+        self.assertTrue(os.path.exists("custodian_trajectory"))
+        self.assertAlmostEqual(h._get_max_dE(), 367.992, 3)
+        shutil.rmtree("custodian_trajectory")
         d = h.correct()
         self.assertEqual(d["errors"], ['POTIM'])
 
@@ -782,8 +813,156 @@ class DriftErrorHandlerTest(unittest.TestCase):
 
     def tearDown(self):
         clean_dir()
+        shutil.rmtree("custodian_trajectory", ignore_errors=True)
+        os.chdir(cwd)
+
+
+class ElectronicTrendErrorHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        Incar({"ALGO": "Fast", "EDIFF": 1e-6, "NELM": 60}).write_file("INCAR")
+
+    def write_oszicar(self, de, first_ionic_step=False):
+        with open("OSZICAR", "w") as f:
+            f.write("       N       E                     dE             "
+                    "d eps       ncg     rms          rms(c)\n")
+            if not first_ionic_step:
+                f.write("DAV:   1    -0.100000000000E+03   -0.10000E+03   "
+                        "-0.10000E+03   960   0.100E+01\n")
+                f.write("   1 F= -.10000000E+03 E0= -.10000000E+03  "
+                        "d E =-.100000E+03\n")
+            for i, d in enumerate(de):
+                f.write("RMM:  {:3d}    -0.100000000000E+03   {:.5E}   "
+                        "-0.10000E+00   960   0.100E+01\n".format(i + 1, d))
+
+    def test_check_correct(self):
+        rs = np.random.RandomState(0)
+        h = ElectronicTrendErrorHandler()
+        # Converging geometrically, with noise.
+        self.write_oszicar(10 ** (-0.5 * np.arange(12) +
+                                  rs.normal(0, 0.2, 12)))
+        self.assertFalse(h.check())
+        # Not enough steps yet.
+        self.write_oszicar(10 ** rs.normal(-2, 0.2, 5))
+        self.assertFalse(h.check())
+        # Stagnating and oscillating.
+        self.write_oszicar([(-1) ** i * 10 ** rs.normal(-2, 0.2)
+                            for i in range(12)])
+        self.assertTrue(h.check())
+        self.assertFalse(ElectronicTrendErrorHandler(nsteps=20).check())
+        self.assertRaises(ValueError, ElectronicTrendErrorHandler, nsteps=2)
+        # Already converged.
+        self.write_oszicar([1e-2] * 11 + [1e-7])
+        self.assertFalse(h.check())
+
+        self.write_oszicar(10 ** rs.normal(-2, 0.2, 12))
+        self.assertTrue(h.check())
+        d = h.correct()
+        self.assertEqual(d["errors"], ["Non-converging job"])
+        self.assertEqual(Incar.from_file("INCAR")["ALGO"], "Normal")
+
+    def test_oscillating(self):
+        h = ElectronicTrendErrorHandler()
+        # The trend alone would reach EDIFF well before NELM, but dE
+        # alternates over two decades around it.
+        trend = -1 - 0.4 * np.arange(12)
+        self.write_oszicar(10 ** (trend + np.where(np.arange(12) % 2, 1, -1)))
+        self.assertTrue(h.check())
+        self.write_oszicar(10 ** trend)
+        self.assertFalse(h.check())
+
+    def test_nelmdl(self):
+        rs = np.random.RandomState(0)
+        h = ElectronicTrendErrorHandler()
+        # The first 5 steps of the first ionic step are not selfconsistent
+        # by default with ISTART = 0, so 12 steps are not enough.
+        self.write_oszicar(10 ** rs.normal(-2, 0.2, 12),
+                           first_ionic_step=True)
+        self.assertFalse(h.check())
+        self.write_oszicar(10 ** rs.normal(-2, 0.2, 15),
+                           first_ionic_step=True)
+        self.assertTrue(h.check())
+        # Only the WAVECAR which the job starts from matters.
+        h.setup()
+        with open("WAVECAR", "w") as f:
+            f.write("written by the job")
+        self.write_oszicar(10 ** rs.normal(-2, 0.2, 12),
+                           first_ionic_step=True)
+        self.assertFalse(h.check())
+        h.setup()
+        self.assertTrue(h.check())
+        os.remove("WAVECAR")
+        h = ElectronicTrendErrorHandler()
+        Incar({"ALGO": "Fast", "EDIFF": 1e-6, "NELM": 60,
+               "NELMDL": 0}).write_file("INCAR")
+        self.write_oszicar(10 ** rs.normal(-2, 0.2, 12),
+                           first_ionic_step=True)
+        self.assertTrue(h.check())
+
+    def tearDown(self):
         os.chdir(cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+class AIMDErrorHandlerTest(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        Incar({"IBRION": 0, "TEBEG": 300, "NSW": 1000}).write_file("INCAR")
+
+    def write_outputs(self, frac_coords, temperatures):
+        with open("XDATCAR", "w") as f:
+            f.write("Si2\n1.0\n3 0 0\n0 3 0\n0 0 3\nSi\n2\n")
+            for i, c in enumerate(frac_coords):
+                f.write("Direct configuration= {}\n".format(i + 1))
+                f.write("{} {} {}\n{} {} {}\n".format(*c))
+        with open("OSZICAR", "w") as f:
+            for i, t in enumerate(temperatures):
+                f.write("{:6d} T= {:6.0f}. E= -.1E+02 F= -.1E+02 "
+                        "E0= -.1E+02  EK= 0.1E+00 SP= 0.0E+00 "
+                        "SK= 0.0E+00\n".format(i + 1, t))
+
+    def test_check_correct(self):
+        ok = [0, 0, 0, 0.5, 0.5, 0.5]
+        self.write_outputs([ok] * 20, [300] * 20)
+        h = AIMDErrorHandler()
+        self.assertFalse(h.check())
+
+        self.write_outputs([ok] * 20, [300] * 15 + [3000] * 5)
+        self.assertTrue(h.check())
+        self.assertEqual(h.errors, ["Temperature blow-up"])
+        self.assertFalse(AIMDErrorHandler(max_temperature=5000).check())
+        self.assertEqual(h.correct(),
+                         {"errors": ["Temperature blow-up"], "actions": None})
+
+        self.write_outputs([ok] * 19 + [[0, 0, 0, 0.5, 0.5, "*****"]],
+                           [300] * 20)
+        self.assertTrue(h.check())
+        self.assertEqual(h.errors, ["Non-finite coordinates"])
+
+        # Distances are computed between the nearest periodic images.
+        self.write_outputs([ok] * 19 + [[0, 0, 0.02, 0.5, 0.5, 0.98]],
+                           [300] * 20)
+        self.assertFalse(h.check())
+        self.write_outputs([ok] * 19 + [[0, 0, 0.02, 0, 0, 0.98]],
+                           [300] * 20)
+        self.assertTrue(h.check())
+        self.assertEqual(h.errors, ["Atoms too close"])
+        # Only the last nframes frames are checked.
+        self.write_outputs([[0, 0, 0.02, 0, 0, 0.98]] + [ok] * 19,
+                           [300] * 20)
+        self.assertFalse(h.check())
+
+        Incar({"IBRION": 2, "NSW": 10}).write_file("INCAR")
+        self.write_outputs([[0, 0, 0.02, 0, 0, 0.98]] * 20, [3000] * 20)
+        self.assertFalse(h.check())
+
+    def tearDown(self):
+        os.chdir(cwd)
+        shutil.rmtree(self.tmpdir)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pymatgen.io.vasp import Incar, Kpoints
+
+from custodian.vasp.inputs import LazyVaspInput, read_incar_tags, \
+    read_kpoints_tags
+from custodian.vasp.interpreter import VaspModder
+
+test_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                        'test_files')
+
+
+class LazyVaspInputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        for f in ["INCAR", "KPOINTS", "POSCAR", "POTCAR"]:
+            shutil.copy(os.path.join(test_dir, f), self.tmpdir)
+        os.chdir(self.tmpdir)
+
+    def test_lazy(self):
+        vi = LazyVaspInput()
+        self.assertEqual(sorted(vi), ["INCAR", "KPOINTS", "POSCAR",
+                                      "POTCAR"])
+        self.assertEqual(vi["INCAR"], Incar.from_file("INCAR"))
+        self.assertTrue(vi.is_loaded("INCAR"))
+        for k in ["KPOINTS", "POSCAR", "POTCAR"]:
+            self.assertFalse(vi.is_loaded(k))
+        self.assertRaises(KeyError, vi.__getitem__, "CONTCAR")
+
+        os.remove("KPOINTS")
+        self.assertNotIn("KPOINTS", vi)
+        self.assertEqual(len(vi), 3)
+        self.assertRaises(IOError, vi.__getitem__, "KPOINTS")
+
+    def test_write_input(self):
+        vi = LazyVaspInput()
+        incar = vi["INCAR"].copy()
+        incar["ISTART"] = 1
+        vi["INCAR"] = incar
+        vi["KPOINTS"] = Kpoints.gamma_automatic((2, 2, 2))
+        outdir = os.path.join(self.tmpdir, "out")
+        os.mkdir(outdir)
+        vi.write_input(outdir)
+        self.assertEqual(sorted(os.listdir(outdir)), ["INCAR", "KPOINTS"])
+        self.assertEqual(Incar.from_file(os.path.join(outdir,
+                                                      "INCAR"))["ISTART"], 1)
+        self.assertEqual(vi.modified, set())
+
+    def test_modder(self):
+        modder = VaspModder()
+        modder.apply_actions([{"dict": "INCAR",
+                               "action": {"_set": {"ISTART": 1}}}])
+        self.assertEqual(Incar.from_file("INCAR")["ISTART"], 1)
+        self.assertFalse(modder.vi.is_loaded("POTCAR"))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+class InputTagsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def test_read_incar_tags(self):
+        for d in ["", "lrf_comm", "large_cell_real_optlay", "drift"]:
+            filename = os.path.join(test_dir, d, "INCAR")
+            incar = Incar.from_file(filename)
+            tags = read_incar_tags(filename)
+            self.assertEqual(sorted(tags), sorted(incar))
+            for k, v in tags.items():
+                # pymatgen knows that KPOINT_BSE is a list, even if it has
+                # a single value.
+                if k != "KPOINT_BSE":
+                    self.assertEqual(
+                        list(v) if isinstance(v, tuple) else v, incar[k])
+        self.assertIs(read_incar_tags(filename), tags)
+        with self.assertRaises(TypeError):
+            tags["NSW"] = 1
+
+        filename = os.path.join(self.tmpdir, "INCAR")
+        with open(filename, "w") as f:
+            f.write("ALGO = fast ; nelm = 100 ! comment\n"
+                    "LWAVE = .FALSE.\nMAGMOM = 2*5.0 -1  # comment\n"
+                    "LREAL = Auto\nSYSTEM = test run\n")
+        tags = read_incar_tags(filename)
+        self.assertEqual(dict(tags), {"ALGO": "Fast", "NELM": 100,
+                                      "LWAVE": False,
+                                      "MAGMOM": (5.0, 5.0, -1),
+                                      "LREAL": "Auto",
+                                      "SYSTEM": "test run"})
+        with open(filename, "a") as f:
+            f.write("NSW = 10\n")
+        self.assertEqual(read_incar_tags(filename)["NSW"], 10)
+
+    def test_read_kpoints_tags(self):
+        for d in ["", "drift", "large_cell_real_optlay"]:
+            filename = os.path.join(test_dir, d, "KPOINTS")
+            self.assertEqual(read_kpoints_tags(filename)["style"],
+                             Kpoints.from_file(filename).style.name)
+        filename = os.path.join(self.tmpdir, "KPOINTS")
+        with open(filename, "w") as f:
+            f.write("Line\n10\nLine-mode\nReciprocal\n0 0 0 ! G\n"
+                    "0.5 0 0 ! X\n")
+        self.assertEqual(read_kpoints_tags(filename)["style"], "Line_mode")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
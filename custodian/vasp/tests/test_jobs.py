@@ -8,7 +8,9 @@ import glob
 from monty.tempfile import ScratchDir
 from monty.os import cd
 import multiprocessing
+from custodian.utils import DIGEST_SUFFIX
 from custodian.vasp.jobs import VaspJob, VaspNEBJob, GenerateVaspInputJob
+from custodian.vasp.trajectory import load_trajectory
 from pymatgen.io.vasp import Incar, Kpoints, Poscar
 import pymatgen
 
@@ -54,20 +56,61 @@ class VaspJobTest(unittest.TestCase):
             with ScratchDir('.', copy_from_current_on_enter=True) as d:
                 shutil.copy('INCAR', 'INCAR.backup')
 
-                v = VaspJob("hello", final=False, suffix=".test", copy_magmom=True)
+                v = VaspJob("hello", final=False, suffix=".test",
+                            copy_magmom=True, write_digests=True)
                 v.postprocess()
                 incar = Incar.from_file("INCAR")
                 incar_prev = Incar.from_file("INCAR.test")
+                self.assertIn("vasprun.xml.test", v.finalized_outputs)
+                self.assertEqual(VaspJob("hello").finalized_outputs, [])
 
                 for f in ['INCAR', 'KPOINTS', 'CONTCAR', 'OSZICAR', 'OUTCAR',
                           'POSCAR', 'vasprun.xml']:
                     self.assertTrue(os.path.isfile('{}.test'.format(f)))
                     os.remove('{}.test'.format(f))
+                for f in ['OUTCAR', 'vasprun.xml']:
+                    self.assertTrue(os.path.isfile(f + DIGEST_SUFFIX))
+                    self.assertTrue(os.path.isfile(
+                        '{}.test{}'.format(f, DIGEST_SUFFIX)))
                 shutil.move('INCAR.backup', 'INCAR')
 
                 self.assertAlmostEqual(incar['MAGMOM'], [3.007, 1.397, -0.189, -0.189])
                 self.assertAlmostEqual(incar_prev["MAGMOM"], [5, -5, 0.6, 0.6])
 
+    def test_postprocess_link(self):
+        with cd(os.path.join(test_dir, 'postprocess')):
+            with ScratchDir('.', copy_from_current_on_enter=True) as d:
+                v = VaspJob("hello", final=False, suffix=".test",
+                            copy_magmom=True, skip_archive=["vasprun*"])
+                v.postprocess()
+                # Digests are only written on request.
+                self.assertFalse(os.path.exists("OUTCAR" + DIGEST_SUFFIX))
+                self.assertFalse(os.path.exists("vasprun.xml.test"))
+                self.assertNotIn("vasprun.xml.test", v.finalized_outputs)
+                with open("OUTCAR") as f1, open("OUTCAR.test") as f2:
+                    self.assertEqual(f1.read(), f2.read())
+                # The copies are independent of the outputs which are
+                # rewritten in place.
+                self.assertAlmostEqual(Incar.from_file("INCAR")["MAGMOM"],
+                                       [3.007, 1.397, -0.189, -0.189])
+                self.assertAlmostEqual(
+                    Incar.from_file("INCAR.test")["MAGMOM"],
+                    [5, -5, 0.6, 0.6])
+                with open("OUTCAR", "w") as f:
+                    f.write("")
+                self.assertGreater(os.path.getsize("OUTCAR.test"), 0)
+                self.assertRaises(ValueError, VaspJob, "hello",
+                                  link="hardlink")
+
+    def test_update(self):
+        with cd(os.path.join(test_dir, 'postprocess')):
+            with ScratchDir('.', copy_from_current_on_enter=True) as d:
+                VaspJob("hello", trajectory=False).update()
+                self.assertFalse(os.path.exists("custodian_trajectory"))
+                VaspJob("hello").update()
+                self.assertEqual(
+                    len(load_trajectory("custodian_trajectory")["E0"]), 28)
+
     def test_continue(self):
         # Test the continuation functionality
         with cd(os.path.join(test_dir, 'postprocess')):
@@ -0,0 +1,311 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import math
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from pymatgen.core import Lattice, Structure
+from pymatgen.io.vasp import Chgcar, Oszicar, Outcar, Poscar, Vasprun, \
+    Xdatcar
+
+from custodian.utils import write_digest, DIGEST_SUFFIX
+from custodian.vasp.outputs import OutcarStream, OszicarStream, \
+    XdatcarStream, VasprunDigest, OutcarDigest, ChgcarSlabReader, \
+    get_outcar_stream, get_oszicar_stream, get_xdatcar_stream, clear_streams
+
+test_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                        'test_files')
+
+
+class OutcarStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outcar = os.path.join(self.tmpdir, "OUTCAR")
+
+    def test_update(self):
+        with open(os.path.join(test_dir, "postprocess", "OUTCAR")) as f:
+            content = f.read()
+        full = OutcarStream(os.path.join(test_dir, "postprocess", "OUTCAR"))
+        full.update()
+        self.assertEqual(full.nbands, 24)
+        self.assertEqual(len(full.ionic_timings), 28)
+        self.assertAlmostEqual(max(full.ionic_timings), 10.86)
+        self.assertAlmostEqual(max(full.electronic_timings), 0.37)
+        self.assertFalse(full.is_stopped)
+
+        # Reading the file while it is being written, with a cut in the
+        # middle of a line, gives the same result as reading it at once.
+        stream = OutcarStream(self.outcar)
+        for i in range(0, len(content), 50001):
+            with open(self.outcar, "a") as f:
+                f.write(content[i:i + 50001])
+            stream.update()
+        for k in ["ionic_timings", "electronic_timings", "drift",
+                  "magnetization", "nbands", "mdalgo"]:
+            self.assertEqual(getattr(stream, k), getattr(full, k))
+
+        # A restarted job starts a new OUTCAR.
+        with open(self.outcar, "w") as f:
+            f.write(content[:len(content) // 2] +
+                    "soft stop encountered!  aborting job\n")
+        stream.update()
+        self.assertTrue(stream.is_stopped)
+        self.assertLess(len(stream.ionic_timings), 28)
+
+    def test_get_outcar_stream(self):
+        drift = get_outcar_stream(os.path.join(test_dir, "drift", "OUTCAR"))
+        self.assertEqual(len(drift.drift), 10)
+        self.assertEqual(drift.drift[0], [-0.000805, -0.000341, 0.002346])
+        self.assertIs(get_outcar_stream(
+            os.path.join(test_dir, "drift", "OUTCAR")), drift)
+        npt = get_outcar_stream(os.path.join(test_dir, "npt_common",
+                                             "OUTCAR"))
+        self.assertEqual(npt.mdalgo, ["3"])
+        self.assertRaises(IOError, get_outcar_stream, self.outcar)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+class OszicarStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.oszicar = os.path.join(self.tmpdir, "OSZICAR")
+
+    def assert_same(self, stream, oszicar):
+        self.assertEqual(list(stream.nelectronic),
+                         [len(e) for e in oszicar.electronic_steps])
+        self.assertEqual(stream.nionic_steps, len(oszicar.ionic_steps))
+        for k in ["E0", "dE", "F"]:
+            self.assertEqual(list(getattr(stream, k)),
+                             [s[k] for s in oszicar.ionic_steps])
+        self.assertEqual(stream.final_energy, oszicar.final_energy)
+        self.assertEqual(list(stream.electronic_dE),
+                         [e["dE"] for e in oszicar.electronic_steps[-1]])
+        self.assertEqual(stream.max_dE,
+                         max([s["dE"] for s in oszicar.ionic_steps[1:]]))
+
+    def test_update(self):
+        for d in ["", "potim"]:
+            filename = os.path.join(test_dir, d, "OSZICAR")
+            self.assert_same(OszicarStream(filename).update(),
+                             Oszicar(filename))
+
+        filename = os.path.join(test_dir, "potim", "OSZICAR")
+        with open(filename) as f:
+            content = f.read()
+        stream = OszicarStream(self.oszicar)
+        for i in range(0, len(content), 997):
+            with open(self.oszicar, "a") as f:
+                f.write(content[i:i + 997])
+            stream.update()
+        self.assert_same(stream, Oszicar(filename))
+
+        # A restarted job starts a new OSZICAR.
+        with open(self.oszicar, "w") as f:
+            f.write(content[:len(content) // 2])
+        stream.update()
+        self.assertLess(stream.nionic_steps,
+                        len(Oszicar(filename).ionic_steps))
+
+    def test_junk_lines(self):
+        filename = os.path.join(test_dir, "potim", "OSZICAR")
+        with open(filename) as f:
+            content = f.read()
+        with open(self.oszicar, "w") as f:
+            f.write("Fake OSZICAR file for testing.\n" + content +
+                    "not an ionic step\n")
+        stream = OszicarStream(self.oszicar).update()
+        self.assert_same(stream, Oszicar(filename))
+        self.assertFalse(math.isnan(stream.final_energy))
+
+    def test_get_oszicar_stream(self):
+        filename = os.path.join(test_dir, "positive_energy", "OSZICAR")
+        stream = get_oszicar_stream(filename)
+        self.assertEqual(stream.nionic_steps, 1)
+        self.assertAlmostEqual(stream.final_energy, 46.575827)
+        self.assertIsNone(stream.max_dE)
+        self.assertIs(get_oszicar_stream(filename), stream)
+        self.assertRaises(IOError, get_oszicar_stream, self.oszicar)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+def write_xdatcar(filename, frames, variable_cell=False):
+    """
+    Writes an XDATCAR with the (lattice, frac_coords) frames of a Si2 cell.
+    """
+    with open(filename, "w") as f:
+        for i, (lattice, frac_coords) in enumerate(frames):
+            if i == 0 or variable_cell:
+                f.write("Si2\n1.0\n")
+                for v in lattice:
+                    f.write("{:.6f} {:.6f} {:.6f}\n".format(*v))
+                f.write("Si\n2\n")
+            f.write("Direct configuration= {}\n".format(i + 1))
+            for c in frac_coords:
+                f.write("{:.8f} {:.8f} {:.8f}\n".format(*c))
+
+
+class XdatcarStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.xdatcar = os.path.join(self.tmpdir, "XDATCAR")
+        rs = np.random.RandomState(0)
+        self.frames = [(np.eye(3) * (3 + 0.1 * i), rs.uniform(0, 1, (2, 3)))
+                       for i in range(20)]
+
+    def test_update(self):
+        for variable_cell in [False, True]:
+            write_xdatcar(self.xdatcar, self.frames, variable_cell)
+            with open(self.xdatcar) as f:
+                content = f.read()
+            structures = Xdatcar(self.xdatcar).structures
+            os.remove(self.xdatcar)
+            stream = XdatcarStream(self.xdatcar)
+            for i in range(0, len(content), 101):
+                with open(self.xdatcar, "a") as f:
+                    f.write(content[i:i + 101])
+                stream.update()
+            self.assertEqual(stream.species, ["Si"])
+            self.assertEqual(stream.natoms, 2)
+            self.assertEqual(stream.nframes, 20)
+            frac_coords = stream.get_frac_coords()
+            lattices = stream.get_lattices()
+            for i, s in enumerate(structures):
+                self.assertTrue(np.allclose(frac_coords[i], s.frac_coords))
+                if variable_cell:
+                    self.assertTrue(np.allclose(lattices[i],
+                                                s.lattice.matrix))
+                else:
+                    self.assertTrue(np.allclose(lattices[i],
+                                                structures[0].lattice.matrix))
+            self.assertEqual(stream.get_frac_coords(5).shape, (5, 2, 3))
+            self.assertTrue(np.array_equal(stream.get_frac_coords(5),
+                                           frac_coords[-5:]))
+            os.remove(self.xdatcar)
+
+        # A restarted job starts a new XDATCAR.
+        write_xdatcar(self.xdatcar, self.frames[:3])
+        stream.update()
+        self.assertEqual(stream.nframes, 3)
+
+    def test_max_frames(self):
+        write_xdatcar(self.xdatcar, self.frames)
+        stream = XdatcarStream(self.xdatcar, max_frames=5).update()
+        self.assertEqual(stream.nframes, 20)
+        frac_coords = stream.get_frac_coords()
+        self.assertEqual(frac_coords.shape, (5, 2, 3))
+        self.assertTrue(np.allclose(frac_coords[-1], self.frames[-1][1]))
+        self.assertEqual(stream.get_lattices(2).shape, (2, 3, 3))
+
+    def test_get_xdatcar_stream(self):
+        self.assertRaises(IOError, get_xdatcar_stream, self.xdatcar)
+        write_xdatcar(self.xdatcar, self.frames)
+        stream = get_xdatcar_stream(self.xdatcar)
+        self.assertEqual(stream.nframes, 20)
+        self.assertIs(get_xdatcar_stream(self.xdatcar), stream)
+        clear_streams()
+        self.assertIsNot(get_xdatcar_stream(self.xdatcar), stream)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+class VasprunDigestTest(unittest.TestCase):
+
+    def test_digest(self):
+        for f in ["max_force/vasprun.xml", "unconverged/vasprun.xml.ionic",
+                  "unconverged/vasprun.xml.electronic",
+                  "vasprun.xml.indirect.gz"]:
+            filename = os.path.join(test_dir, f)
+            d = VasprunDigest(filename)
+            v = Vasprun(filename, parse_dos=False, parse_eigen=False)
+            self.assertEqual(d.converged_electronic, v.converged_electronic)
+            self.assertEqual(d.converged_ionic, v.converged_ionic)
+            self.assertEqual(d.converged, v.converged)
+            self.assertEqual(d.nionic_steps, len(v.ionic_steps))
+            self.assertAlmostEqual(d.final_energy, v.final_energy)
+            self.assertEqual(d.forces,
+                             np.array(v.ionic_steps[-1]["forces"]).tolist())
+            self.assertEqual(d.selective_dynamics,
+                             v.final_structure.site_properties.get(
+                                 "selective_dynamics"))
+            self.assertEqual(d.incar.get("ALGO"), v.incar.get("ALGO"))
+            self.assertEqual(d.final_structure, v.final_structure)
+        self.assertEqual(d.selective_dynamics, [[True] * 3, [False] * 3])
+        self.assertEqual(d.final_structure.site_properties,
+                         v.final_structure.site_properties)
+
+    def test_sidecar(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "vasprun.xml")
+            shutil.copy(os.path.join(test_dir, "max_force", "vasprun.xml"),
+                        filename)
+            d = write_digest(filename, VasprunDigest)
+            d2 = VasprunDigest.from_file(filename)
+            self.assertEqual(d2.__dict__, d.__dict__)
+            self.assertEqual(d2.final_structure.formula, "Sb16 Xe8 Cl8 F88")
+            # The digest is read from the sidecar, not from the file.
+            with open(filename + DIGEST_SUFFIX) as f:
+                sidecar = json.load(f)
+            sidecar["digests"]["VasprunDigest"]["final_energy"] = 1.0
+            with open(filename + DIGEST_SUFFIX, "w") as f:
+                json.dump(sidecar, f)
+            self.assertEqual(VasprunDigest.from_file(filename).final_energy,
+                             1.0)
+
+            shutil.copy(os.path.join(test_dir, "postprocess", "OUTCAR"),
+                        os.path.join(tmpdir, "OUTCAR"))
+            write_digest(os.path.join(tmpdir, "OUTCAR"), OutcarDigest)
+            d = OutcarDigest.from_file(os.path.join(tmpdir, "OUTCAR"))
+            self.assertEqual(
+                d.site_magnetization,
+                list(Outcar(os.path.join(tmpdir, "OUTCAR")).magnetization))
+            self.assertEqual(d.nbands, 24)
+            self.assertEqual(d.nionic_steps, 28)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_bad_vasprun(self):
+        for f in ["bad_vasprun/vasprun.xml", "vasprun.xml"]:
+            self.assertRaises(Exception, VasprunDigest,
+                              os.path.join(test_dir, f))
+
+
+class ChgcarSlabReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def test_iter(self):
+        structure = Structure(Lattice.cubic(3), ["Si", "Si"],
+                              [[0, 0, 0], [0.25, 0.25, 0.25]])
+        data = np.random.RandomState(0).uniform(-1, 1, (5, 4, 3))
+        filename = os.path.join(self.tmpdir, "CHGCAR")
+        Chgcar(Poscar(structure), {"total": data}).write_file(filename)
+        expected = Chgcar.from_file(filename).data["total"]
+        reader = ChgcarSlabReader(filename)
+        self.assertEqual(reader.dims, (5, 4, 3))
+        planes = list(reader)
+        self.assertEqual(len(planes), 3)
+        for z, plane in enumerate(planes):
+            self.assertTrue(np.array_equal(plane, expected[:, :, z]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
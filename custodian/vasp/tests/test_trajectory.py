@@ -0,0 +1,100 @@
+# coding: utf-8
+
+from __future__ import unicode_literals, division
+
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+from pymatgen.io.vasp import Vasprun
+
+from custodian.vasp.trajectory import TrajectoryStore, load_trajectory, \
+    get_trajectory_store
+
+test_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                        'test_files')
+
+
+class TrajectoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outcar = os.path.join(self.tmpdir, "OUTCAR")
+        self.store_dir = os.path.join(self.tmpdir, "custodian_trajectory")
+
+    def test_update(self):
+        with open(os.path.join(test_dir, "postprocess", "OUTCAR")) as f:
+            content = f.read()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            vasprun = Vasprun(os.path.join(test_dir, "postprocess",
+                                           "vasprun.xml"),
+                              parse_dos=False, parse_eigen=False)
+        open(self.outcar, "w").close()
+        store = TrajectoryStore(self.store_dir, self.outcar)
+        self.assertEqual(load_trajectory(self.store_dir)["forces"].shape,
+                         (0, 0, 3))
+        for i in range(0, len(content), 30001):
+            with open(self.outcar, "a") as f:
+                f.write(content[i:i + 30001])
+            store.update()
+        self.assertEqual(store.nsteps, 28)
+        self.assertEqual(store.natoms, 4)
+
+        for traj in [load_trajectory(self.store_dir),
+                     {k: store.get(k) for k in TrajectoryStore.arrays}]:
+            self.assertEqual(traj["forces"].shape, (28, 4, 3))
+            self.assertTrue(np.allclose(
+                traj["forces"],
+                [s["forces"] for s in vasprun.ionic_steps], atol=1e-6))
+            self.assertTrue(np.allclose(
+                traj["positions"][-1],
+                vasprun.ionic_steps[-1]["structure"].cart_coords,
+                atol=1e-4))
+            self.assertEqual(traj["E0"][0], -20.66323714)
+            self.assertTrue(np.allclose(
+                traj["F"], [s["e_fr_energy"] for s in vasprun.ionic_steps]))
+            self.assertEqual(list(traj["stress"][0]),
+                             [-25.15548, 137.04889, 35.72997, 32.46476,
+                              -56.45832, -52.30520])
+            self.assertEqual(traj["drift"].shape, (28, 3))
+            self.assertAlmostEqual(traj["timing"].max(), 10.86)
+
+        # A restarted job starts a new OUTCAR. Views of the old arrays
+        # remain readable.
+        old_forces = store.get("forces")
+        with open(self.outcar, "w") as f:
+            f.write(content[:len(content) // 2])
+        store.update()
+        self.assertTrue(np.allclose(old_forces[-1],
+                                    vasprun.ionic_steps[-1]["forces"],
+                                    atol=1e-6))
+        self.assertLess(store.nsteps, 28)
+        self.assertEqual(len(load_trajectory(self.store_dir)["E0"]),
+                         store.nsteps)
+
+    def test_get_trajectory_store(self):
+        shutil.copy(os.path.join(test_dir, "drift", "OUTCAR"), self.outcar)
+        store = get_trajectory_store(self.outcar)
+        self.assertEqual(store.directory, self.store_dir)
+        drift = store.get("drift")
+        self.assertEqual(len(drift), 10)
+        self.assertEqual(list(drift[0]), [-0.000805, -0.000341, 0.002346])
+        self.assertIs(get_trajectory_store(self.outcar), store)
+
+        # The store is rebuilt if it is removed.
+        shutil.rmtree(self.store_dir)
+        self.assertEqual(len(get_trajectory_store(self.outcar).get("drift")),
+                         10)
+        self.assertRaises(IOError, get_trajectory_store,
+                          os.path.join(self.tmpdir, "OUTCAR.missing"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,14 @@
 import os, shutil
+import tempfile
 import unittest
+
+import numpy as np
+from pymatgen.core import Lattice, Structure
+from pymatgen.io.vasp import Chgcar, Poscar
+
 from custodian.vasp.validators import VasprunXMLValidator, VaspFilesValidator, \
-    VaspNpTMDValidator, VaspAECCARValidator
+    VaspNpTMDValidator, VaspAECCARValidator, check_broken_aeccar, \
+    check_broken_chgcar
 
 test_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..",
                         'test_files')
@@ -88,6 +95,31 @@ class VaspAECCARValidatorTest(unittest.TestCase):
         h = VaspAECCARValidator()
         self.assertTrue(h.check())
 
+    def test_check_broken_aeccar(self):
+        tmpdir = tempfile.mkdtemp()
+        poscar = Poscar(Structure(Lattice.cubic(3), ["Si"], [[0, 0, 0]]))
+        rng = np.random.RandomState(0)
+        try:
+            for i, spike in enumerate([None, (3, 2, 4), (7, 6, 5)]):
+                data = [rng.uniform(0.1, 1, (8, 7, 6)) for j in range(2)]
+                if spike is not None:
+                    data[1][spike] = 100
+                files = []
+                for j, d in enumerate(data):
+                    files.append(os.path.join(tmpdir,
+                                              "AECCAR{}".format(2 * j)))
+                    Chgcar(poscar, {"total": d}).write_file(files[-1])
+                expected = check_broken_chgcar(Chgcar.from_file(files[0]) +
+                                               Chgcar.from_file(files[1]))
+                self.assertEqual(check_broken_aeccar(*files), expected)
+                self.assertEqual(expected, i == 1)
+
+            # Negative values.
+            data[0][:5, :5, :5] = -1
+            Chgcar(poscar, {"total": data[0]}).write_file(files[0])
+            self.assertTrue(check_broken_aeccar(*files))
+        finally:
+            shutil.rmtree(tmpdir)
 
     @classmethod
     def tearDownClass(cls):
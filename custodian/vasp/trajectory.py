@@ -0,0 +1,276 @@
+# coding: utf-8
+
+"""
+This module implements a live trajectory store for VASP runs. While the job
+is running, Custodian has VaspJob.update parse the ionic steps written to
+the OUTCAR incrementally and append them to flat binary files, one per
+quantity, in the run directory. The energies are those of the OUTCAR, which
+are the same as those of the OSZICAR, so the OSZICAR is not read.
+Handlers get the arrays as read-only memory-mapped views, without building
+lists of dicts, and other tools can read the same arrays with
+load_trajectory without parsing any text.
+"""
+
+from __future__ import unicode_literals, division
+
+import os
+import re
+import json
+import threading
+
+import numpy as np
+
+from custodian.utils import IncrementalReader
+
+
+METADATA_FILE = "metadata.json"
+
+
+def _read_array(directory, metadata, name):
+    spec = metadata["arrays"][name]
+    shape = (metadata["nsteps"],) + tuple(spec["shape"])
+    if metadata["nsteps"] == 0 or 0 in shape:
+        # Empty files cannot be mapped.
+        return np.zeros(shape, dtype=spec["dtype"])
+    return np.memmap(os.path.join(directory, name + ".bin"),
+                     dtype=spec["dtype"], mode="r", shape=shape)
+
+
+def load_trajectory(directory="custodian_trajectory"):
+    """
+    Reads a trajectory written by a TrajectoryStore.
+
+    Args:
+        directory (str): Directory of the store. Defaults to
+            "custodian_trajectory".
+
+    Returns:
+        Dict of read-only arrays (see TrajectoryStore.arrays), with the
+        ionic steps along the first axis.
+    """
+    with open(os.path.join(directory, METADATA_FILE), "rt") as f:
+        metadata = json.load(f)
+    return {name: _read_array(directory, metadata, name)
+            for name in metadata["arrays"]}
+
+
+class TrajectoryStore(object):
+    """
+    Append-only store of the ionic steps of a VASP run, filled incrementally
+    from the OUTCAR. Each array is stored as a raw file (<name>.bin) of
+    little-endian float64 values, with the ionic steps along the first axis,
+    and metadata.json gives the number of complete steps and the shape of
+    the arrays. The data of new steps is written before the metadata, so
+    that readers never see a partially written step.
+
+    If the OUTCAR is rewritten (e.g., because the job has been restarted
+    after a correction), the store is emptied and filled again from the new
+    OUTCAR. Likewise, it is rebuilt if it has been removed.
+    """
+
+    # Quantities stored for each ionic step, as (per atom, shape) tuples.
+    arrays = {
+        "E0": (False, ()),          # energy(sigma->0)
+        "F": (False, ()),           # free energy TOTEN
+        "forces": (True, (3,)),     # total forces
+        "positions": (True, (3,)),  # cartesian positions
+        "stress": (False, (6,)),    # xx, yy, zz, xy, yz, zx in kB
+        "drift": (False, (3,)),     # total drift
+        "timing": (False, ()),      # real time of the ionic step (LOOP+)
+    }
+
+    dtype = "<f8"
+
+    float_pattern = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+    def __init__(self, directory="custodian_trajectory", outcar="OUTCAR"):
+        """
+        Args:
+            directory (str): Directory in which the arrays are stored. It is
+                created if needed. Defaults to "custodian_trajectory".
+            outcar (str): OUTCAR to read. Defaults to "OUTCAR".
+        """
+        self.directory = directory
+        self.outcar = outcar
+        self.reader = IncrementalReader(outcar)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Empties the store. The next update reads the OUTCAR from the
+        beginning.
+        """
+        self.reader.reset()
+        self._clear()
+
+    def _clear(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        for name in self.arrays:
+            # The old files are replaced rather than truncated, since
+            # readers may still have them memory-mapped.
+            path = self._path(name)
+            open(path + ".tmp", "wb").close()
+            os.rename(path + ".tmp", path)
+        self.nsteps = 0
+        self.natoms = None
+        self._pending = []
+        self._step = {}
+        self._block = None
+        self._in_energies = False
+        self._write_metadata()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".bin")
+
+    def _get_shape(self, name):
+        per_atom, shape = self.arrays[name]
+        return ((self.natoms or 0,) if per_atom else ()) + shape
+
+    def _get_metadata(self):
+        return {
+            "source": os.path.abspath(self.outcar),
+            "nsteps": self.nsteps,
+            "arrays": {name: {"dtype": self.dtype,
+                              "shape": list(self._get_shape(name))}
+                       for name in self.arrays}
+        }
+
+    def _write_metadata(self):
+        path = os.path.join(self.directory, METADATA_FILE)
+        with open(path + ".tmp", "wt") as f:
+            json.dump(self._get_metadata(), f)
+        os.rename(path + ".tmp", path)
+
+    def update(self):
+        """
+        Appends the ionic steps completed since the last update.
+
+        Returns:
+            self, for convenience.
+        """
+        with self._lock:
+            if not os.path.exists(os.path.join(self.directory,
+                                               METADATA_FILE)):
+                # The store has been removed, so it is rebuilt.
+                self.reset()
+            chunks = self.reader.read_chunks()
+            if self.reader.restarted:
+                self._clear()
+            steps = []
+            for chunk in chunks:
+                for l in chunk.splitlines(True):
+                    if l.endswith("\n"):
+                        step = self._parse_line(l)
+                        if step is not None:
+                            steps.append(step)
+            if steps:
+                self._append(steps)
+        return self
+
+    def _floats(self, s):
+        return [float(x) for x in self.float_pattern.findall(s)]
+
+    def _parse_line(self, l):
+        if self._block is not None:
+            if l.lstrip().startswith("---"):
+                if self._block:
+                    block = np.array(self._block)
+                    self._step["positions"] = block[:, :3]
+                    self._step["forces"] = block[:, 3:6]
+                    self._block = None
+                else:
+                    # Line below the header.
+                    self._block = []
+            else:
+                row = self._floats(l)[:6]
+                self._block.append(row + [float("nan")] * (6 - len(row)))
+        elif "TOTAL-FORCE" in l and "POSITION" in l:
+            self._block = []
+        elif "in kB" in l:
+            self._step["stress"] = self._floats(l.split("in kB")[1])[:6]
+        elif "total drift:" in l:
+            self._step["drift"] = self._floats(l.split(":")[1])[:3]
+        elif "FREE ENERGIE OF THE ION-ELECTRON SYSTEM" in l:
+            self._in_energies = True
+        elif self._in_energies and "TOTEN" in l:
+            self._step["F"] = self._floats(l.split("=")[1])[0]
+        elif self._in_energies and "energy(sigma->0)" in l:
+            self._step["E0"] = self._floats(
+                l.split("energy(sigma->0)")[1])[0]
+            self._in_energies = False
+        elif "LOOP+" in l and "real time" in l:
+            self._step["timing"] = self._floats(l.split("real time")[1])[0]
+            step = self._step
+            self._step = {}
+            self._in_energies = False
+            return step
+        return None
+
+    def _append(self, steps):
+        steps = self._pending + steps
+        if self.natoms is None:
+            forces = [s["forces"] for s in steps if "forces" in s]
+            if not forces:
+                # The shape of the per atom arrays is not known yet.
+                self._pending = steps
+                return
+            self.natoms = len(forces[0])
+        self._pending = []
+        for name in self.arrays:
+            shape = self._get_shape(name)
+            values = []
+            for s in steps:
+                v = np.asarray(s.get(name, np.nan), dtype=float)
+                if v.shape != shape:
+                    v = np.full(shape, np.nan)
+                values.append(v)
+            with open(self._path(name), "ab") as f:
+                f.write(np.array(values, dtype=self.dtype).tobytes())
+        self.nsteps += len(steps)
+        self._write_metadata()
+
+    def get(self, name):
+        """
+        Args:
+            name (str): Name of the array, one of TrajectoryStore.arrays.
+
+        Returns:
+            Read-only memory-mapped view of the array, with the ionic steps
+            along the first axis.
+        """
+        with self._lock:
+            return _read_array(self.directory, self._get_metadata(), name)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_trajectory_store(outcar="OUTCAR", directory="custodian_trajectory"):
+    """
+    Returns the up to date TrajectoryStore of an OUTCAR. As for the streams
+    of custodian.vasp.outputs, the store is shared by all handlers in the
+    process.
+
+    Args:
+        outcar (str): OUTCAR. Defaults to "OUTCAR".
+        directory (str): Directory of the store, relative to the directory
+            of the OUTCAR. Defaults to "custodian_trajectory".
+
+    Returns:
+        TrajectoryStore
+
+    Raises:
+        IOError if the OUTCAR does not exist.
+    """
+    outcar = os.path.abspath(outcar)
+    if not os.path.exists(outcar):
+        raise IOError("{} does not exist".format(outcar))
+    directory = os.path.join(os.path.dirname(outcar), directory)
+    with _stores_lock:
+        if (outcar, directory) not in _stores:
+            _stores[(outcar, directory)] = TrajectoryStore(directory, outcar)
+        store = _stores[(outcar, directory)]
+    return store.update()
@@ -3,7 +3,11 @@
 from __future__ import unicode_literals, division
 
 from custodian.custodian import Validator
-from pymatgen.io.vasp import Vasprun, Incar, Outcar, Chgcar
+from custodian.utils import get_parsed
+from custodian.vasp.outputs import get_outcar_stream, VasprunDigest, \
+    ChgcarSlabReader
+from custodian.vasp.inputs import read_incar_tags
+import numpy as np
 import os
 
 class VasprunXMLValidator(Validator):
@@ -16,7 +20,7 @@ class VasprunXMLValidator(Validator):
 
     def check(self):
         try:
-            Vasprun("vasprun.xml")
+            get_parsed("vasprun.xml", VasprunDigest.from_file)
         except:
             return True
         return False
@@ -48,15 +52,13 @@ class VaspNpTMDValidator(Validator):
         pass
 
     def check(self):
-        incar = Incar.from_file("INCAR")
+        incar = read_incar_tags()
         is_npt = incar.get("MDALGO") == 3
         if not is_npt:
             return False
 
-        outcar = Outcar("OUTCAR")
-        patterns = {"MDALGO": "MDALGO\s+=\s+([\d]+)"}
-        outcar.read_pattern(patterns=patterns)
-        if outcar.data["MDALGO"] == [['3']]:
+        outcar = get_outcar_stream("OUTCAR")
+        if outcar.mdalgo == ['3']:
             return False
         else:
             return True
@@ -70,10 +72,7 @@ class VaspAECCARValidator(Validator):
         pass
 
     def check(self):
-        aeccar0 = Chgcar.from_file("AECCAR0")
-        aeccar2 = Chgcar.from_file("AECCAR2")
-        aeccar = aeccar0 + aeccar2
-        return check_broken_chgcar(aeccar)
+        return check_broken_aeccar("AECCAR0", "AECCAR2")
 
 def check_broken_chgcar(chgcar):
     chgcar_data = chgcar.data['total']
@@ -87,3 +86,47 @@ def check_broken_chgcar(chgcar):
         return True
 
     return False
+
+
+def check_broken_aeccar(aeccar0, aeccar2):
+    """
+    Same check as check_broken_chgcar(Chgcar.from_file(aeccar0) +
+    Chgcar.from_file(aeccar2)), but the sum of the densities is computed one
+    plane at a time with ChgcarSlabReader, so that neither the full grids nor
+    the array of diagonal differences are held in memory.
+
+    Args:
+        aeccar0 (str): AECCAR0 file.
+        aeccar2 (str): AECCAR2 file.
+
+    Returns:
+        True if the summed density is broken.
+    """
+    readers = [ChgcarSlabReader(aeccar0), ChgcarSlabReader(aeccar2)]
+    if readers[0].dims != readers[1].dims:
+        raise ValueError("{} and {} have different grids".format(
+            aeccar0, aeccar2))
+    nnegative = 0
+    data_min = np.inf
+    data_max = -np.inf
+    diff_max = -np.inf
+    previous = None
+    for plane0, plane2 in zip(*readers):
+        plane = plane0 + plane2
+        nnegative += (plane < 0).sum()
+        if nnegative > 100:
+            # a decent bunch of the values are negative
+            return True
+        data_min = min(data_min, plane.min())
+        data_max = max(data_max, plane.max())
+        if previous is not None:
+            diff_max = max(diff_max,
+                           (previous[:-1, :-1] - plane[1:, 1:]).max())
+        previous = plane
+
+    if diff_max / (data_max - data_min) > 0.95:
+        # Some single diagonal finite difference is more than 95% of the
+        # entire range
+        return True
+
+    return False
@@ -0,0 +1,298 @@
+# coding: utf-8
+
+"""
+This module implements file and process watchers, which allow Custodian to
+sleep until the files monitored by its error handlers change or the running
+job exits, instead of waking up at a fixed polling interval. On Linux,
+inotify and pidfds are used. Elsewhere (or if these are unavailable),
+stat-based and thread-based fallbacks are used.
+"""
+
+from __future__ import unicode_literals, division
+
+import os
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def get_file_signature(filename):
+    """
+    Returns a signature of a file that changes whenever the file is
+    modified, replaced or removed.
+
+    Args:
+        filename (str): File.
+
+    Returns:
+        (inode, size, modification time) tuple, or None if the file does
+        not exist.
+    """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, getattr(st, "st_mtime_ns", st.st_mtime)
+
+
+class ProcessWatcher(object):
+    """
+    Provides a file descriptor that becomes readable as soon as a child
+    process exits, so that waiting for the exit can be combined with waiting
+    for other events. A pidfd is used if available (Linux >= 5.3 and
+    Python >= 3.9). Otherwise, a daemon thread blocks in Popen.wait and
+    writes to a pipe when the process exits.
+    """
+
+    def __init__(self, process, use_pidfd=True):
+        """
+        Args:
+            process (Popen): Process to watch.
+            use_pidfd (bool): Whether to use a pidfd if available. Defaults
+                to True.
+        """
+        self.process = process
+        self._fd = -1
+        pidfd_open = getattr(os, "pidfd_open", None)
+        if use_pidfd and pidfd_open is not None:
+            try:
+                self._fd = pidfd_open(process.pid)
+            except OSError:
+                self._fd = -1
+        if self._fd < 0:
+            self._fd, w = os.pipe()
+            t = threading.Thread(target=self._notify_exit, args=(w,))
+            t.daemon = True
+            t.start()
+
+    def _notify_exit(self, w):
+        try:
+            self.process.wait()
+            os.write(w, b"x")
+        except OSError:
+            # Read end already closed.
+            pass
+        finally:
+            os.close(w)
+
+    def fileno(self):
+        return self._fd
+
+    def wait(self, timeout):
+        """
+        Blocks until the process exits or until timeout seconds have elapsed.
+
+        Args:
+            timeout (float): Maximum time to wait in seconds.
+
+        Returns:
+            (bool) Whether the process has exited.
+        """
+        if self.process.poll() is not None:
+            return True
+        select.select([self._fd], [], [], max(timeout, 0))
+        return self.process.poll() is not None
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class StatFileWatcher(object):
+    """
+    Portable file watcher that detects changes by comparing the inode, size
+    and modification time of the watched files every stat_interval seconds.
+    """
+
+    def __init__(self, filenames, stat_interval=1):
+        """
+        Args:
+            filenames ([str]): Files to watch. The files need not exist yet.
+            stat_interval (float): Interval in seconds between stats of the
+                watched files. Defaults to 1 sec.
+        """
+        self.filenames = set(os.path.normpath(f) for f in filenames)
+        self.stat_interval = stat_interval
+        self._stats = {f: get_file_signature(f) for f in self.filenames}
+
+    def _get_changed(self):
+        changed = set()
+        for f in self.filenames:
+            st = get_file_signature(f)
+            if st != self._stats[f]:
+                self._stats[f] = st
+                changed.add(f)
+        return changed
+
+    def wait(self, timeout, process_watcher=None):
+        """
+        Blocks until at least one of the watched files changes or until
+        timeout seconds have elapsed.
+
+        Args:
+            timeout (float): Maximum time to wait in seconds.
+            process_watcher (ProcessWatcher): If supplied, the wait also
+                returns as soon as the watched process exits.
+
+        Returns:
+            (set) Watched files that have changed. Empty if timed out or if
+            the process has exited.
+        """
+        deadline = time.time() + timeout
+        while True:
+            changed = self._get_changed()
+            remaining = deadline - time.time()
+            if changed or remaining <= 0:
+                return changed
+            if process_watcher is None:
+                time.sleep(min(self.stat_interval, remaining))
+            elif process_watcher.wait(min(self.stat_interval, remaining)):
+                return changed
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class InotifyFileWatcher(StatFileWatcher):
+    """
+    Linux file watcher based on inotify. The parent directories of the
+    watched files are watched, so that files which are created, truncated
+    or replaced by the running job are picked up as well. The kernel wakes
+    the watcher up as soon as a watched file is written to, so there is no
+    periodic wake up while the job is quiet.
+    """
+
+    def __init__(self, filenames):
+        """
+        Args:
+            filenames ([str]): Files to watch. The files need not exist yet,
+                but their directories must.
+
+        Raises:
+            OSError if inotify is not supported on this system.
+        """
+        import ctypes
+        import ctypes.util
+
+        super(InotifyFileWatcher, self).__init__(filenames)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not supported")
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}
+        try:
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+            for f in self.filenames:
+                d = os.path.dirname(f) or "."
+                if d in self._watches.values():
+                    continue
+                path = os.path.abspath(d)
+                if not isinstance(path, bytes):
+                    path = path.encode("utf-8")
+                wd = libc.inotify_add_watch(self._fd, path, mask)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(),
+                                  "inotify_add_watch failed for {}".format(d))
+                self._watches[wd] = d
+        except Exception:
+            self.close()
+            raise
+
+    def _read_events(self):
+        changed = set()
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except OSError as ex:
+                if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not buf:
+                break
+            i = 0
+            while i + _EVENT_HEADER.size <= len(buf):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buf, i)
+                i += _EVENT_HEADER.size
+                name = buf[i:i + length].rstrip(b"\0").decode(
+                    "utf-8", "replace")
+                i += length
+                d = self._watches.get(wd)
+                if d is None:
+                    continue
+                f = name if d == "." else os.path.join(d, name)
+                if f in self.filenames:
+                    changed.add(f)
+        return changed
+
+    def wait(self, timeout, process_watcher=None):
+        fds = [self._fd]
+        if process_watcher is not None:
+            fds.append(process_watcher.fileno())
+        deadline = time.time() + timeout
+        while True:
+            remaining = max(deadline - time.time(), 0)
+            r, _, _ = select.select(fds, [], [], remaining)
+            changed = self._read_events() if self._fd in r else set()
+            if changed or time.time() >= deadline:
+                return changed
+            if process_watcher is not None and \
+                    process_watcher.process.poll() is not None:
+                return changed
+
+    def close(self):
+        if getattr(self, "_fd", -1) >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def get_file_watcher(filenames, stat_interval=1):
+    """
+    Returns the most efficient file watcher available on this system, i.e.,
+    an InotifyFileWatcher on Linux and a StatFileWatcher otherwise.
+
+    Args:
+        filenames ([str]): Files to watch.
+        stat_interval (float): Interval in seconds between stats if the
+            stat-based fallback has to be used.
+
+    Returns:
+        StatFileWatcher or InotifyFileWatcher
+    """
+    try:
+        return InotifyFileWatcher(filenames)
+    except (OSError, AttributeError) as ex:
+        logger.info("inotify unavailable ({}). Falling back to stat-based "
+                    "file watching.".format(ex))
+        return StatFileWatcher(filenames, stat_interval=stat_interval)
@@ -102,6 +102,58 @@ def test(ctx):
     ctx.run("nosetests")
 
 
+@task
+def benchmark_error_scan(ctx, size_mb=1024):
+    """
+    Compares the throughput (lines per second) of the line-by-line search
+    for the VaspErrorHandler error messages with that of the compiled
+    MessageScanner, on the test_files/vasp.* fixtures repeated up to
+    size_mb MB.
+    """
+    import shutil
+    import tempfile
+    import time
+    from custodian.utils import MessageScanner
+    from custodian.vasp.handlers import VaspErrorHandler
+
+    text = ""
+    for f in sorted(glob.glob(os.path.join("test_files", "vasp.*"))):
+        with open(f, "rt") as fid:
+            text += fid.read()
+    error_msgs = VaspErrorHandler.error_msgs
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, "vasp.out")
+        target = int(size_mb) * 1024 * 1024
+        size = 0
+        with open(fname, "wt") as fid:
+            while size < target:
+                fid.write(text)
+                size += len(text)
+        nlines = text.count("\n") * (size // len(text))
+
+        t = time.time()
+        errors = set()
+        with open(fname, "rt") as fid:
+            for l in fid:
+                for err, msgs in error_msgs.items():
+                    for msg in msgs:
+                        if l.find(msg) != -1:
+                            errors.add(err)
+        before = time.time() - t
+
+        t = time.time()
+        scanned = MessageScanner(fname, error_msgs).scan()
+        after = time.time() - t
+
+        assert scanned == errors
+        print("Scanned %d MB (%d lines)" % (size // 1024 // 1024, nlines))
+        print("Line by line: %.3g lines/s" % (nlines / before))
+        print("Compiled: %.3g lines/s" % (nlines / after))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
 @task
 def set_ver(ctx):
     lines = []